@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""Benchmark io_utils read strategies across file sizes (warm page cache).
+
+    python scripts/bench_io.py [--sizes 4K,256K,1M,16M,256M] [--repeat 5] [--json out.json]
+                               [--mix DIR]
+
+Prints MB/s per strategy and the strategy io_utils.choose_strategy() picks,
+so the REPRO_IO_* thresholds can be checked on the hardware at hand, then
+compares the published SHA-256 against every installed fingerprint backend
+over an artifact mix (the files under --mix, e.g. dist/, or the sized files).
+"""
+import argparse, json, os, pathlib, sys, tempfile, time
+if __package__ in (None, ""): sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[1]))
+from tools import io_utils, profiling
+
+UNITS = {"K": 1 << 10, "M": 1 << 20, "G": 1 << 30}
+
+def parse_size(text: str) -> int:
+    text = text.strip().upper()
+    return int(text[:-1]) * UNITS[text[-1]] if text[-1] in UNITS else int(text)
+
+def bench_file(path: pathlib.Path, size: int, repeat: int) -> dict:
+    row = {"size": size, "chosen": io_utils.choose_strategy(size), "mb_s": {}}
+    # Enough iterations that tiny files are not dominated by timer resolution.
+    iters = max(1, (64 << 20) // max(size, 1))
+    for strategy in io_utils.STRATEGIES:
+        best = float("inf")
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            for _ in range(iters): io_utils.sha256_path(path, strategy=strategy)
+            best = min(best, time.perf_counter() - t0)
+        row["mb_s"][strategy] = round(size * iters / best / 1e6, 1)
+    return row
+
+def bench_fingerprints(paths: list, repeat: int) -> dict:
+    total = sum(p.stat().st_size for p in paths)
+    row = {"files": len(paths), "bytes": total, "default": io_utils.fingerprint_backend(), "mb_s": {}}
+    for backend in io_utils.FINGERPRINT_BACKENDS:
+        if io_utils._fingerprint_factory(backend) is None: continue
+        best = float("inf")
+        for _ in range(repeat):
+            io_utils._fp_memo.clear(); t0 = time.perf_counter()
+            for p in paths: io_utils.fingerprint_path(p, backend=backend)
+            best = min(best, time.perf_counter() - t0)
+        row["mb_s"][backend] = round(total / best / 1e6, 1)
+    return row
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--sizes", default="4K,64K,256K,1M,4M,16M,64M,256M")
+    ap.add_argument("--repeat", type=int, default=5)
+    ap.add_argument("--json", help="Also write results as JSON")
+    ap.add_argument("--mix", help="Directory whose files form the fingerprint artifact mix")
+    args = ap.parse_args()
+    rows = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for text in args.sizes.split(","):
+            size = parse_size(text); p = pathlib.Path(tmp) / f"f{size}"
+            p.write_bytes(os.urandom(size))
+            rows.append(bench_file(p, size, args.repeat))
+        mix = sorted(q for q in pathlib.Path(args.mix or tmp).rglob("*") if q.is_file() and not q.is_symlink())
+        fp = bench_fingerprints(mix, args.repeat)
+    print(f"{'size':>10} {'chosen':>9} " + " ".join(f"{s:>9}" for s in io_utils.STRATEGIES) + "  (MB/s)")
+    for r in rows:
+        print(f"{r['size']:>10} {r['chosen']:>9} " + " ".join(f"{r['mb_s'][s]:>9}" for s in io_utils.STRATEGIES))
+    print(f"\nfingerprint over {fp['files']} files, {fp['bytes']} bytes (default: {fp['default']})")
+    for backend, rate in fp["mb_s"].items():
+        print(f"{backend:>10} {rate:>9} MB/s" + ("  (published digest)" if backend == "sha256" else ""))
+    if args.json:
+        pathlib.Path(args.json).write_text(json.dumps({"results": rows, "fingerprint": fp}, sort_keys=True, separators=(",", ":")), encoding="utf-8")
+if __name__=="__main__": profiling.run(main)
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""Benchmark det_tar writers on a many-small-files tree (warm page cache).
+
+    python scripts/bench_tar.py [--files 20000] [--size 2K] [--repeat 3] [--compression none,gzip]
+                                [--src DIR] [--json out.json]
+
+Times create_deterministic_tar with the raw header writer (tools/tar_writer.py)
+with and without read-ahead (REPRO_PREFETCH_WORKERS=0 for raw-sync) and with
+the tarfile reference path (REPRO_TAR_WRITER=tarfile), checks that all
+archives are byte-identical and prints the best time per writer.
+"""
+import argparse, json, os, pathlib, sys, tempfile, time
+if __package__ in (None, ""): sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[1]))
+from tools import profiling
+from tools.det_tar import create_deterministic_tar
+
+# writer -> (REPRO_TAR_WRITER, REPRO_PREFETCH_WORKERS or None for the default)
+WRITERS = {"raw": ("raw", None), "raw-sync": ("raw", "0"), "tarfile": ("tarfile", None)}
+UNITS = {"K": 1 << 10, "M": 1 << 20, "G": 1 << 30}
+
+def parse_size(text: str) -> int:
+    text = text.strip().upper()
+    return int(text[:-1]) * UNITS[text[-1]] if text[-1] in UNITS else int(text)
+
+def make_tree(root: pathlib.Path, files: int, size: int) -> None:
+    # 100 files per directory, two levels, like a vendored source tree.
+    for i in range(files):
+        d = root / f"pkg{i // 10000:02d}" / f"mod{i // 100 % 100:02d}"
+        d.mkdir(parents=True, exist_ok=True)
+        (d / f"file{i:06d}.py").write_bytes(os.urandom(size // 2).hex().encode())
+
+def bench(src: str, out_dir: str, compression: str, repeat: int) -> dict:
+    row = {"compression": compression, "seconds": {}, "files": 0}
+    digests = set()
+    for writer, (impl, workers) in WRITERS.items():
+        os.environ["REPRO_TAR_WRITER"] = impl
+        if workers is None: os.environ.pop("REPRO_PREFETCH_WORKERS", None)
+        else: os.environ["REPRO_PREFETCH_WORKERS"] = workers
+        out = pathlib.Path(out_dir) / f"{writer}.tar"
+        best = float("inf")
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            stats = create_deterministic_tar(src, str(out), compression=compression)
+            best = min(best, time.perf_counter() - t0)
+        row["seconds"][writer] = round(best, 4)
+        row["files"] = stats["files"]
+        digests.add(out.read_bytes())
+    os.environ.pop("REPRO_TAR_WRITER", None); os.environ.pop("REPRO_PREFETCH_WORKERS", None)
+    row["identical"] = len(digests) == 1
+    row["speedup"] = round(row["seconds"]["tarfile"] / row["seconds"]["raw"], 2)
+    return row
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--files", type=int, default=20000)
+    ap.add_argument("--size", default="2K")
+    ap.add_argument("--repeat", type=int, default=3)
+    ap.add_argument("--compression", default="none,gzip")
+    ap.add_argument("--src", help="Archive this tree instead of a generated one")
+    ap.add_argument("--json", help="Also write results as JSON")
+    args = ap.parse_args()
+    with tempfile.TemporaryDirectory() as tmp:
+        src = args.src or str(pathlib.Path(tmp) / "src")
+        if not args.src: make_tree(pathlib.Path(src), args.files, parse_size(args.size))
+        rows = [bench(src, tmp, c.strip(), args.repeat) for c in args.compression.split(",")]
+    print(f"{'compression':>12} {'files':>8} " + " ".join(f"{w:>9}" for w in WRITERS) + f" {'speedup':>8} identical")
+    for r in rows:
+        print(f"{r['compression']:>12} {r['files']:>8} " + " ".join(f"{r['seconds'][w]:>8}s" for w in WRITERS)
+              + f" {r['speedup']:>7}x {r['identical']}")
+    if args.json:
+        pathlib.Path(args.json).write_text(json.dumps({"results": rows}, sort_keys=True, separators=(",", ":")), encoding="utf-8")
+if __name__=="__main__": profiling.run(main)
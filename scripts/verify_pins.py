@@ -1,5 +1,7 @@
 #!/usr/bin/env python3
 import argparse, json, re, sys, pathlib
+if __package__ in (None, ""): sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[1]))
+from tools import profiling
 WS = pathlib.Path(".github/workflows")
 ACTION_RE = re.compile(r"^\s*uses:\s*([^\s@]+)@([^\s#]+)")
 SHA_RE = re.compile(r"^[0-9a-f]{40}$")
@@ -23,4 +25,4 @@ def main():
     if bad:
         print("ERROR: Unpinned actions detected", file=sys.stderr); sys.exit(2)
     print("Pinned-actions verification PASS")
-if __name__=="__main__": main()
+if __name__=="__main__": profiling.run(main)
@@ -4,3 +4,11 @@ import pathlib
 
 # ensure the repo root (parent of tests/) is on sys.path so `import tools` works
 sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent))
+
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def _isolated_cache(tmp_path_factory, monkeypatch):
+    # Tools that cache on disk (io_utils.cache_dir) must not read or fill the user's cache.
+    monkeypatch.setenv("REPRO_CACHE_DIR", str(tmp_path_factory.mktemp("repro-cache")))
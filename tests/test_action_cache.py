@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""Test suite for tools/action_cache.py - skipping unchanged build steps"""
+import json
+import sys
+import pytest
+from tools import io_utils
+from tools.action_cache import Action, action_key, run_action
+from tools.cas import DirBackend, HttpBackend
+
+# Copies in.txt to out/result.txt (plus an optional nonce) and counts its runs in runs.log.
+STEP = ("import pathlib, sys, time; pathlib.Path('out').mkdir(exist_ok=True); "
+        "pathlib.Path('out/result.txt').write_text(pathlib.Path('in.txt').read_text() + (str(time.time_ns()) if len(sys.argv) > 1 else '')); "
+        "open('runs.log', 'a').write('x')")
+
+
+@pytest.fixture
+def work(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.delenv("REPRO_ACTION_SHARED", raising=False)
+    monkeypatch.delenv("REPRO_ACTION_CACHE", raising=False)
+    (tmp_path / "in.txt").write_text("hello\n")
+    return tmp_path
+
+
+def step(*extra, **kw):
+    return Action("demo", [sys.executable, "-c", STEP, *extra], inputs=["in.txt"], outputs=["out/result.txt"], **kw)
+
+
+def runs(path):
+    return len((path / "runs.log").read_text()) if (path / "runs.log").exists() else 0
+
+
+class TestActionCache:
+    def test_miss_then_hit_restores(self, work):
+        store = DirBackend(str(work / "store"))
+        assert run_action(step(), stores=[store])["status"] == "miss"
+        (work / "out" / "result.txt").unlink()
+        rep = run_action(step(), stores=[store])
+        assert rep["status"] == "hit" and rep["outputs"] == ["out/result.txt"]
+        assert (work / "out" / "result.txt").read_text() == "hello\n" and runs(work) == 1
+
+    def test_key_covers_inputs_config_env(self, work, monkeypatch):
+        base = action_key(step())
+        (work / "in.txt").write_text("changed\n")
+        assert action_key(step()) != base
+        assert action_key(step(config=["paths.artifact"])) != action_key(step())
+        monkeypatch.setenv("DEMO_KNOB", "1")
+        with_env = action_key(step(env=["DEMO_KNOB"]))
+        monkeypatch.setenv("DEMO_KNOB", "2")
+        assert action_key(step(env=["DEMO_KNOB"])) != with_env
+        assert action_key(step("nonce")) != action_key(step())
+
+    def test_strict_mode_detects_nondeterminism(self, work):
+        store = DirBackend(str(work / "store"))
+        run_action(step(), stores=[store])
+        assert run_action(step(), mode="strict", stores=[store])["status"] == "verified"
+        run_action(step("nonce"), stores=[store])
+        rep = run_action(step("nonce"), mode="strict", stores=[store])
+        assert rep["status"] == "mismatch" and rep["mismatched"] == ["out/result.txt"] and runs(work) == 4
+
+    def test_shared_store_fills_local(self, work):
+        local, shared = DirBackend(str(work / "local")), DirBackend(str(work / "shared"))
+        run_action(step(), stores=[shared])
+        assert run_action(step(), stores=[local, shared])["status"] == "hit"
+        assert run_action(step(), stores=[local])["status"] == "hit" and runs(work) == 1
+
+    def test_hit_fetches_record_once(self, work, monkeypatch):
+        store = DirBackend(str(work / "store"))
+        run_action(step(), stores=[store])
+        fetches = []
+        get_ref = store.get_ref
+        monkeypatch.setattr(store, "get_ref", lambda name: fetches.append(name) or get_ref(name))
+        assert run_action(step(), stores=[store])["status"] == "hit" and len(fetches) == 1
+
+    def test_unreachable_shared_store_warns(self, work, capsys):
+        local = DirBackend(str(work / "local"))
+        assert run_action(step(), stores=[local, HttpBackend("http://127.0.0.1:9", timeout=5)])["status"] == "miss"
+        assert "WARN: could not save action demo" in capsys.readouterr().err
+        assert run_action(step(), stores=[local])["status"] == "hit" and runs(work) == 1
+
+    def test_corrupt_blob_is_a_miss(self, work):
+        store = DirBackend(str(work / "store"))
+        run_action(step(), stores=[store])
+        for blob in (work / "store" / "cas").rglob("*"):
+            if blob.is_file():
+                blob.write_text("tampered")
+        (work / "out" / "result.txt").unlink()
+        assert run_action(step(), stores=[store])["status"] == "miss" and runs(work) == 2
+        assert (work / "out" / "result.txt").read_text() == "hello\n"
+
+    def test_restores_only_declared_outputs(self, work):
+        store = DirBackend(str(work / "store"))
+        key = run_action(step(), stores=[store])["key"]
+        sha = json.loads(store.get_ref(key))["outputs"][0]["sha256"]
+        evil = {"key": key, "name": "demo", "outputs": [{"path": str(work / "planted.txt"), "sha256": sha, "size": 6, "mode": 0o777}]}
+        store.put_ref(key, json.dumps(evil).encode())
+        assert run_action(step(), stores=[store])["status"] == "miss" and not (work / "planted.txt").exists()
+        good = json.loads(store.get_ref(key))
+        good["outputs"][0]["mode"] = 0o4777
+        store.put_ref(key, json.dumps(good).encode())
+        assert run_action(step(), stores=[store])["status"] == "hit" and runs(work) == 2
+        assert (work / "out" / "result.txt").stat().st_mode & 0o7777 == 0o755
+
+    def test_key_ignores_fingerprint_backend(self, work, monkeypatch):
+        monkeypatch.setattr(io_utils, "_fp_backend", "blake2b")
+        key = action_key(step())
+        monkeypatch.setattr(io_utils, "_fp_backend", "sha256")
+        assert action_key(step()) == key
+
+    def test_failures_are_not_cached(self, work):
+        store = DirBackend(str(work / "store"))
+        bad = Action("bad", [sys.executable, "-c", "raise SystemExit(3)"], outputs=["never"])
+        assert run_action(bad, stores=[store]) == {**run_action(bad, stores=[store]), "status": "failed", "returncode": 3}
+        assert not (work / "store" / "ac").exists()
+        with pytest.raises(FileNotFoundError):
+            run_action(Action("noout", [sys.executable, "-c", "pass"], outputs=["missing.txt"]), stores=[store])
+
+    def test_off(self, work, monkeypatch):
+        monkeypatch.setenv("REPRO_ACTION_CACHE", "off")
+        assert run_action(step(), stores=[DirBackend(str(work / "s"))])["status"] == "off"
+        assert run_action(step(), stores=[DirBackend(str(work / "s"))])["status"] == "off" and runs(work) == 2
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""Test suite for tools/cas.py - shared content-addressed blob store"""
+import hashlib
+import http.client
+import os
+import subprocess
+import sys
+import threading
+import urllib.error
+import urllib.request
+from pathlib import Path
+import pytest
+from tools import cas
+from tools.action_cache import Action, run_action
+
+ROOT = Path(__file__).resolve().parents[1]
+
+
+@pytest.fixture
+def files(tmp_path):
+    d = tmp_path / "files"
+    d.mkdir()
+    for i in range(6):
+        (d / f"f{i}.bin").write_bytes(bytes([i]) * (1000 * (i + 1)))
+    return sorted(d.iterdir())
+
+
+@pytest.fixture
+def server(tmp_path):
+    srv = cas.serve(str(tmp_path / "served"), port=0)
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    yield srv, f"http://127.0.0.1:{srv.server_address[1]}"
+    srv.shutdown()
+    srv.server_close()
+
+
+def sha(path):
+    return hashlib.sha256(Path(path).read_bytes()).hexdigest()
+
+
+class TestBackends:
+    def test_dir_round_trip(self, files, tmp_path):
+        store = cas.open_store(str(tmp_path / "store"))
+        shas = cas.put_many(store, files, workers=3)
+        assert shas == {str(f): sha(f) for f in files}
+        got = cas.get_many(store, {s: tmp_path / "out" / Path(p).name for p, s in shas.items()}, workers=3)
+        assert all(got.values()) and (tmp_path / "out" / "f3.bin").read_bytes() == files[3].read_bytes()
+        assert store.get_file("0" * 64, tmp_path / "nope") is False and not (tmp_path / "nope").exists()
+
+    def test_http_round_trip(self, files, tmp_path, server):
+        srv, url = server
+        store = cas.open_store(url)
+        assert isinstance(store, cas.HttpBackend)
+        shas = cas.put_many(store, files, workers=4)
+        assert srv.RequestHandlerClass.store.has(shas[str(files[5])])
+        assert cas.get_many(store, {s: tmp_path / "dl" / Path(p).name for p, s in shas.items()}, workers=4)
+        assert [sha(tmp_path / "dl" / f.name) for f in files] == [shas[str(f)] for f in files]
+        store.put_ref("ab" * 32, b'{"k":1}')
+        assert store.get_ref("ab" * 32) == b'{"k":1}' and store.get_ref("cd" * 32) is None
+        assert store.get_file("0" * 64, tmp_path / "nope") is False
+
+    def test_server_rejects_misnamed_upload(self, files, server):
+        _, url = server
+        req = urllib.request.Request(f"{url}/cas/{'0' * 64}", data=files[0].read_bytes(), method="PUT")
+        with pytest.raises(urllib.error.HTTPError) as e:
+            urllib.request.urlopen(req)
+        assert e.value.code == 400 and not cas.HttpBackend(url).has("0" * 64)
+
+    def test_server_rejects_bad_lengths(self, server):
+        srv, url = server
+        port = srv.server_address[1]
+        for length in ("abc", "-1", None):
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=10)
+            conn.putrequest("PUT", f"/ac/{'ab' * 32}")
+            if length is not None:
+                conn.putheader("Content-Length", length)
+            conn.endheaders()
+            assert conn.getresponse().status == 400
+            conn.close()
+        with pytest.raises(urllib.error.HTTPError) as e:
+            cas.HttpBackend(url).put_ref("ab" * 32, b" " * ((1 << 20) + 1))
+        assert e.value.code == 413 and cas.HttpBackend(url).get_ref("ab" * 32) is None
+
+    def test_token_guards_uploads(self, files, tmp_path):
+        srv = cas.serve(str(tmp_path / "guarded"), port=0, token="s3cret")
+        threading.Thread(target=srv.serve_forever, daemon=True).start()
+        url = f"http://127.0.0.1:{srv.server_address[1]}"
+        try:
+            for anon in (cas.HttpBackend(url, token=""), cas.HttpBackend(url, token="wrong")):
+                with pytest.raises(urllib.error.HTTPError) as e:
+                    anon.put_ref("ab" * 32, b"{}")
+                assert e.value.code == 401
+            with pytest.raises(urllib.error.HTTPError):
+                cas.HttpBackend(url, token="").put_file(files[0])
+            store = cas.HttpBackend(url, token="s3cret")
+            digest = store.put_file(files[0])
+            store.put_ref("ab" * 32, b"{}")
+            assert cas.HttpBackend(url, token="").get_ref("ab" * 32) == b"{}" and cas.HttpBackend(url, token="").has(digest)
+        finally:
+            srv.shutdown()
+            srv.server_close()
+        proc = subprocess.run([sys.executable, str(ROOT / "tools" / "cas.py"), "serve", "--root", str(tmp_path / "s"), "--host", "0.0.0.0"],
+                              capture_output=True, text=True, env={k: v for k, v in os.environ.items() if k != "REPRO_CAS_TOKEN"}, timeout=30)
+        assert proc.returncode == 2 and "--token" in proc.stderr
+
+    def test_corrupt_blob_never_returned(self, files, tmp_path, server):
+        srv, url = server
+        digest = cas.HttpBackend(url).put_file(files[1])
+        srv.RequestHandlerClass.store.blob_path(digest).write_bytes(b"bit rot")
+        with pytest.raises(cas.IntegrityError):
+            cas.HttpBackend(url).get_file(digest, tmp_path / "x")
+        assert not (tmp_path / "x").exists()
+
+    def test_gc_evicts_least_recently_used(self, files, tmp_path):
+        store = cas.DirBackend(tmp_path / "store")
+        shas = [store.put_file(f) for f in files]
+        for i, s in enumerate(shas):
+            os.utime(store.blob_path(s), ns=(i * 10**9, i * 10**9))
+        store.get_file(shas[0], tmp_path / "touched")  # oldest, but just used
+        rep = store.gc(max_bytes=12000)
+        assert rep["bytes"] <= 12000 and rep["freed"] == 1000 * (2 + 3 + 4)
+        assert [store.has(s) for s in shas] == [True, False, False, False, True, True]
+
+    def test_bounded_store_collects_after_put(self, files, tmp_path, monkeypatch):
+        monkeypatch.setenv("REPRO_CAS_MAX_BYTES", "10K")
+        store = cas.open_store(str(tmp_path / "store"))
+        cas.put_many(store, files, workers=1)
+        assert store.max_bytes == 10240 and sum(b[1] for b in store.blobs()) <= 10240
+        assert cas.parse_size("2G") == 2 << 30 and cas.parse_size("512MiB") == 512 << 20
+
+    def test_action_cache_shares_through_server(self, tmp_path, server, monkeypatch):
+        _, url = server
+        monkeypatch.chdir(tmp_path)
+        (tmp_path / "in.txt").write_text("shared\n")
+        step = Action("copy", [sys.executable, "-c", "import shutil; shutil.copy('in.txt', 'out.txt')"], inputs=["in.txt"], outputs=["out.txt"])
+        assert run_action(step, stores=[cas.DirBackend(tmp_path / "runner-a"), cas.HttpBackend(url)])["status"] == "miss"
+        (tmp_path / "out.txt").unlink()
+        assert run_action(step, stores=[cas.DirBackend(tmp_path / "runner-b"), cas.HttpBackend(url)])["status"] == "hit"
+        assert (tmp_path / "out.txt").read_text() == "shared\n"
+
+    def test_cli(self, files, tmp_path):
+        store = str(tmp_path / "store")
+        proc = subprocess.run([sys.executable, str(ROOT / "tools" / "cas.py"), "--store", store, "put", *map(str, files)], capture_output=True, text=True)
+        assert proc.returncode == 0, proc.stderr
+        digest = proc.stdout.split()[0]
+        proc = subprocess.run([sys.executable, str(ROOT / "tools" / "cas.py"), "--store", store, "get", digest, str(tmp_path / "back")], capture_output=True, text=True)
+        assert proc.returncode == 0 and sha(tmp_path / "back") == digest
+        proc = subprocess.run([sys.executable, str(ROOT / "tools" / "cas.py"), "--store", store, "gc", "--max-size", "0"], capture_output=True, text=True)
+        assert proc.returncode == 0 and '"blobs":0' in proc.stdout
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""Test suite for tools/compress.py - deterministic compressor backends"""
+import gzip
+import os
+import tarfile
+import pytest
+from tools import compress
+from tools.det_tar import build_tar, create_deterministic_tar
+from tools.verify_tar_determinism import check_tar
+
+DATA = b"repro " * 50000 + os.urandom(4096)
+FORMATS = ["gzip", "xz", pytest.param("zstd", marks=pytest.mark.skipif(not compress.BACKENDS["zstd"].available(), reason="zstandard not installed"))]
+
+
+def _write(path, name, **kw):
+    with compress.open_writer(path, name, **kw) as w:
+        w.write(DATA[:1000]); w.write(DATA[1000:])
+        assert w.tell() == len(DATA)
+    return path.read_bytes()
+
+
+class TestBackends:
+    """Round trip, determinism and header checks per backend"""
+
+    @pytest.mark.parametrize("name", FORMATS)
+    def test_roundtrip_and_reproducible(self, tmp_path, name):
+        first = _write(tmp_path / "a", name)
+        assert _write(tmp_path / "b", name) == first
+        with compress.open_reader(tmp_path / "a") as r:
+            assert r.read() == DATA
+        rep = compress.verify_header(tmp_path / "a")
+        assert rep["format"] == name and rep["is_valid"] and rep["deterministic"]
+
+    def test_gzip_matches_gzip_module_body(self, tmp_path):
+        ours = _write(tmp_path / "a.gz", "gzip")
+        with gzip.GzipFile(tmp_path / "b.gz", "wb", compresslevel=9, mtime=0) as f:
+            f.write(DATA)
+        theirs = (tmp_path / "b.gz").read_bytes()
+        assert ours[10:] == theirs[10 + len(b"b\0"):]  # GzipFile stores the name without .gz
+        assert ours[9] == 3
+
+    def test_gzip_name_and_mtime_are_flagged(self, tmp_path):
+        p = tmp_path / "named.gz"
+        with gzip.GzipFile(p, "wb", mtime=1234) as f:
+            f.write(b"x")
+        rep = compress.verify_header(p)
+        assert rep["is_valid"] and not rep["deterministic"]
+        assert rep["flags"] == ["FNAME"] and rep["mtime"] == 1234
+
+    def test_zstd_output_independent_of_threads(self, tmp_path, monkeypatch):
+        pytest.importorskip("zstandard")
+        monkeypatch.setenv("REPRO_ZSTD_THREADS", "1")
+        one = _write(tmp_path / "a", "zstd", level=3)
+        monkeypatch.setenv("REPRO_ZSTD_THREADS", "4")
+        assert _write(tmp_path / "b", "zstd", level=3) == one
+
+    def test_xz_bad_footer(self, tmp_path):
+        p = tmp_path / "t.xz"
+        _write(p, "xz")
+        p.write_bytes(p.read_bytes()[:-2])
+        assert compress.verify_header(p)["error"] == "bad_footer"
+
+    @pytest.mark.parametrize("path,name", [("a.tar.gz", "gzip"), ("a.tgz", "gzip"), ("a.tar.xz", "xz"),
+                                           ("a.tar.zst", "zstd"), ("a.tar", "gzip"), ("a.bin", "gzip")])
+    def test_backend_for_path(self, path, name):
+        assert compress.backend_for_path(path).name == name
+
+    def test_unknown_backend(self):
+        with pytest.raises(ValueError):
+            compress.get_backend("lz4")
+
+
+class TestDetTarCompression:
+    """det_tar output per backend passes verify_tar_determinism"""
+
+    @pytest.mark.parametrize("suffix", [".tar.gz", ".tar.xz", pytest.param(".tar.zst", marks=FORMATS[2].marks)])
+    def test_create_and_check(self, tmp_path, suffix):
+        src = tmp_path / "src"
+        (src / "sub").mkdir(parents=True)
+        (src / "a.txt").write_text("a")
+        (src / "sub" / "b.txt").write_text("b" * 5000)
+        out1, out2 = tmp_path / ("one" + suffix), tmp_path / ("two" + suffix)
+        create_deterministic_tar(str(src), str(out1))
+        create_deterministic_tar(str(src), str(out2))
+        assert out1.read_bytes() == out2.read_bytes()
+        rep = check_tar(str(out1))
+        assert rep["ok"] and rep["compression"]["format"] == compress.backend_for_path(out1).name
+
+    def test_build_tar_stays_uncompressed(self, tmp_path):
+        f = tmp_path / "f.txt"
+        f.write_text("f")
+        build_tar(str(tmp_path / "t.tar"), [str(f)])
+        with tarfile.open(tmp_path / "t.tar", "r:") as tf:
+            assert tf.getnames() == ["f.txt"]
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -13,3 +13,34 @@ def test_det_tar_root_and_mtime(tmp_path: pathlib.Path):
             assert (m.uname or 'root')=='root'
             assert (m.gname or 'root')=='root'
             assert int(m.mtime)==0
+def test_det_tar_mode_ignores_umask(tmp_path: pathlib.Path):
+    a=tmp_path/'a.txt'; _mkfile(a,'A'); a.chmod(0o600)
+    x=tmp_path/'x.sh'; _mkfile(x,'#!/bin/sh'); x.chmod(0o700)
+    out=tmp_path/'t.tar'; build_tar(str(out), [str(a), str(x)])
+    with tarfile.open(out, 'r:') as t:
+        assert {m.name: m.mode for m in t.getmembers()}=={'a.txt':0o644,'x.sh':0o755}
+def _dup_tree(root: pathlib.Path):
+    (root/'a').mkdir(parents=True); (root/'b').mkdir()
+    _mkfile(root/'LICENSE','MIT'*100); _mkfile(root/'a'/'LICENSE','MIT'*100); _mkfile(root/'b'/'LICENSE','MIT'*100)
+    _mkfile(root/'b'/'other','MIT'*99+'BSD'); _mkfile(root/'Empty1',''); _mkfile(root/'Empty2','')
+    x=root/'b'/'run'; _mkfile(x,'MIT'*100); x.chmod(0o755)
+    return root
+def test_det_tar_dedup_links_to_first(tmp_path: pathlib.Path):
+    from tools.det_tar import create_deterministic_tar
+    from tools.verify_tar_determinism import check_tar
+    src=_dup_tree(tmp_path/'src'); out=tmp_path/'d.tar.gz'
+    stats=create_deterministic_tar(str(src), str(out), dedup=True)
+    assert (stats['dedup_links'], stats['bytes_saved'])==(2, 600)
+    with tarfile.open(out, 'r:gz') as t:
+        links={m.name: m.linkname for m in t.getmembers() if m.islnk()}
+        assert links=={'a/LICENSE':'LICENSE','b/LICENSE':'LICENSE'}
+        t.extractall(tmp_path/'x', filter='tar')
+    assert (tmp_path/'x'/'b'/'LICENSE').read_text()=='MIT'*100
+    assert check_tar(str(out))['ok']
+    plain=tmp_path/'p.tar.gz'; assert create_deterministic_tar(str(src), str(plain))['dedup_links']==0
+    again=tmp_path/'d2.tar.gz'; create_deterministic_tar(str(src), str(again), dedup=True)
+    assert out.read_bytes()==again.read_bytes()
+def test_verify_links_rejects_forward_target():
+    from tools.verify_tar_determinism import verify_links
+    link=tarfile.TarInfo('a'); link.type=tarfile.LNKTYPE; link.linkname='b'
+    assert verify_links([link, tarfile.TarInfo('b')])==['a']
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""Test suite for tools/det_zip.py and tools/verify_zip_determinism.py - deterministic zips and wheels"""
+import os
+import zipfile
+import pytest
+from tools import det_zip
+from tools.det_zip import create_deterministic_zip
+from tools.verify_zip_determinism import check_zip_determinism
+
+
+@pytest.fixture
+def tree(tmp_path):
+    src = tmp_path / "src"
+    for i in range(150):
+        d = src / "pkg" / f"sub{i // 40}"
+        d.mkdir(parents=True, exist_ok=True)
+        (d / f"m{i:03d}.py").write_text(f"# module {i}\n" + "value = 1\n" * (i % 30))
+    (src / "pkg" / "run.sh").write_text("#!/bin/sh\n")
+    os.chmod(src / "pkg" / "run.sh", 0o775)
+    (src / "pkg" / "données.txt").write_text("utf-8 name\n")
+    (src / "pkg" / "__pycache__").mkdir()
+    (src / "pkg" / "__pycache__" / "x.pyc").write_bytes(b"\0")
+    dist = src / "pkg-1.0.dist-info"
+    dist.mkdir()
+    (dist / "METADATA").write_text("Name: pkg\nVersion: 1.0\n")
+    (dist / "WHEEL").write_text("Wheel-Version: 1.0\n")
+    (dist / "RECORD").write_text("stale,,\n")
+    return src
+
+
+class TestZip:
+    def test_normalized_and_readable(self, tree, tmp_path):
+        out = tmp_path / "a.zip"
+        stats = create_deterministic_zip(str(tree), str(out), workers=1)
+        with zipfile.ZipFile(out) as zf:
+            names = zf.namelist()
+            assert names == sorted(names) and "pkg/__pycache__/x.pyc" not in names
+            assert zf.read("pkg/sub1/m050.py") == (tree / "pkg" / "sub1" / "m050.py").read_bytes()
+            assert zf.getinfo("pkg/run.sh").external_attr >> 16 == 0o100755
+            assert zf.getinfo("pkg/données.txt").flag_bits & 0x800
+            assert zf.testzip() is None
+        assert stats["entries"] == len(names)
+        assert check_zip_determinism(str(out)) == {"is_deterministic": True, "issues": []}
+
+    def test_pool_matches_inline(self, tree, tmp_path, monkeypatch):
+        monkeypatch.setattr(det_zip, "_BATCH_FILES", 8)
+        create_deterministic_zip(str(tree), str(tmp_path / "a.zip"), workers=1)
+        os.utime(tree / "pkg" / "sub0" / "m001.py", (1, 1))
+        create_deterministic_zip(str(tree), str(tmp_path / "b.zip"), workers=3)
+        assert (tmp_path / "a.zip").read_bytes() == (tmp_path / "b.zip").read_bytes()
+
+    def test_streamed_large_file(self, tree, tmp_path, monkeypatch):
+        monkeypatch.setattr(det_zip, "STREAM_MIN", 1 << 10)
+        (tree / "pkg" / "big.bin").write_bytes(os.urandom(100 << 10))
+        create_deterministic_zip(str(tree), str(tmp_path / "a.zip"), workers=2)
+        monkeypatch.setattr(det_zip, "STREAM_MIN", 1 << 30)
+        create_deterministic_zip(str(tree), str(tmp_path / "b.zip"), workers=1)
+        assert (tmp_path / "a.zip").read_bytes() == (tmp_path / "b.zip").read_bytes()
+        with zipfile.ZipFile(tmp_path / "a.zip") as zf:
+            assert zf.read("pkg/big.bin") == (tree / "pkg" / "big.bin").read_bytes()
+
+
+class TestWheel:
+    def test_record_regenerated_and_last(self, tree, tmp_path):
+        (tree / "pkg" / "a,b.py").write_text("x = 1\n")
+        out = tmp_path / "pkg-1.0-py3-none-any.whl"
+        create_deterministic_zip(str(tree), str(out))
+        with zipfile.ZipFile(out) as zf:
+            names = zf.namelist()
+            record = zf.read("pkg-1.0.dist-info/RECORD").decode()
+        assert names[-1] == "pkg-1.0.dist-info/RECORD" and names[-3:-1] == ["pkg-1.0.dist-info/METADATA", "pkg-1.0.dist-info/WHEEL"]
+        assert "stale" not in record and record.endswith("pkg-1.0.dist-info/RECORD,,\n")
+        assert "pkg/run.sh,sha256=" in record and '"pkg/a,b.py",sha256=' in record
+        assert check_zip_determinism(str(out))["is_deterministic"]
+
+    def test_requires_dist_info(self, tmp_path):
+        (tmp_path / "src").mkdir()
+        (tmp_path / "src" / "a.py").write_text("")
+        with pytest.raises(ValueError, match="dist-info"):
+            create_deterministic_zip(str(tmp_path / "src"), str(tmp_path / "x.whl"))
+
+
+class TestVerifier:
+    def test_flags_zipfile_defaults(self, tree, tmp_path):
+        out = tmp_path / "plain.whl"
+        with zipfile.ZipFile(out, "w", zipfile.ZIP_DEFLATED) as zf:
+            zf.writestr("b.py", "b")
+            zf.writestr("a.py", "a")
+            zf.writestr("pkg-1.0.dist-info/RECORD", "a.py,sha256=x,1\n")
+        rep = check_zip_determinism(str(out))
+        assert not rep["is_deterministic"]
+        text = "\n".join(rep["issues"])
+        assert "not in sorted order" in text and "timestamp" in text and "b.py: not listed in RECORD" in text
+
+    def test_missing(self, tmp_path):
+        assert check_zip_determinism(str(tmp_path / "nope.zip"))["issues"] == ["Zip file does not exist"]
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -5,8 +5,10 @@ import tempfile
 import tarfile
 import gzip
 import pathlib
+import json
 from tools.verify_tar_determinism import check_tar_determinism, verify_file_order, verify_metadata
-from tools.verify_gzip_header import check_gzip_header, validate_gzip_os_byte
+from tools.verify_gzip_header import check_gzip_header, validate_gzip_os_byte, check_gzip_stream, check_paths, GzipIntegrityReader
+from tools import det_tar, verify_tar_determinism
 from tools.det_tar import create_deterministic_tar, normalize_tar_info
 
 
@@ -237,6 +239,138 @@ class TestVerifyGzipHeader:
         assert result["mtime"] == 0
 
 
+class TestGzipIntegrity:
+    """Full-stream gzip integrity checks"""
+
+    @pytest.fixture
+    def multi(self, tmp_path):
+        gz_path = tmp_path / "multi.gz"
+        gz_path.write_bytes(gzip.compress(b"first " * 50000, mtime=0) + gzip.compress(b"second", mtime=0))
+        return gz_path
+
+    def test_multi_member(self, multi):
+        """Should walk every member and check its trailer"""
+        result = check_gzip_stream(str(multi))
+        assert result["is_valid"] and result["deterministic"]
+        assert [m["size"] for m in result["members"]] == [300000, 6]
+        reader = GzipIntegrityReader(open(multi, "rb"))
+        assert reader.read(7) + reader.read() == b"first " * 50000 + b"second"
+
+    @pytest.mark.parametrize("damage, error", [
+        (lambda b: b[:-3], "truncated_trailer:member 1"),
+        (lambda b: b[:200] + bytes([b[200] ^ 0xFF]) + b[201:], "member 0"),
+        (lambda b: b + b"junk", "trailing_garbage"),
+    ])
+    def test_detect_damage(self, multi, damage, error):
+        """Should catch corruption that the header check passes"""
+        multi.write_bytes(damage(multi.read_bytes()))
+        assert check_gzip_header(str(multi))["is_valid"] is True
+        result = check_gzip_stream(str(multi))
+        assert result["is_valid"] is False and error in result["error"]
+
+    @pytest.mark.parametrize("name, data, error", [
+        ("empty.gz", b"", "empty"),
+        ("cut.gz", b"\x1f", "format_mismatch:gzip"),
+        ("text.tgz", b"plain text\n", "format_mismatch:gzip"),
+        ("gz-named.xz", gzip.compress(b"x", mtime=0), "found gzip"),
+    ])
+    def test_name_promises_format(self, tmp_path, name, data, error):
+        """Should fail an empty file or one whose suffix does not match its contents"""
+        (tmp_path / name).write_bytes(data)
+        result = check_gzip_stream(str(tmp_path / name))
+        assert result["is_valid"] is False and error in result["error"]
+
+    def test_report_header_flags(self, tmp_path):
+        """Should report FNAME (written by gzip.open) as non-deterministic"""
+        gz_path = tmp_path / "named.gz"
+        with gzip.open(gz_path, "wb") as f:
+            f.write(b"x")
+        result = check_gzip_stream(str(gz_path))
+        assert result["is_valid"] and result["flags"] == ["FNAME"] and not result["deterministic"]
+
+    def test_check_paths_pool(self, multi, tmp_path):
+        """Should return one report per archive in input order"""
+        bad = tmp_path / "bad.gz"
+        bad.write_bytes(multi.read_bytes()[:-1])
+        results = check_paths([str(multi), str(bad), str(multi)], workers=2)
+        assert [r["path"] for r in results] == [str(multi), str(bad), str(multi)]
+        assert [r["is_valid"] for r in results] == [True, False, True]
+
+    def test_main_dir(self, multi, tmp_path, monkeypatch):
+        """Should fail the directory run when one archive is damaged"""
+        from tools import verify_gzip_header
+        (tmp_path / "sub").mkdir()
+        (tmp_path / "sub" / "bad.tgz").write_bytes(multi.read_bytes()[:-1])
+        out = tmp_path / "report.json"
+        monkeypatch.setattr("sys.argv", ["verify_gzip_header.py", "--dir", str(tmp_path), "--workers", "1", "--out", str(out)])
+        with pytest.raises(SystemExit) as e:
+            verify_gzip_header.main()
+        assert e.value.code == 2
+        assert [a["is_valid"] for a in json.loads(out.read_text())["archives"]] == [True, False]
+
+    def test_shared_with_tar_check(self, tmp_path):
+        """Should check tar metadata and stream integrity in one pass"""
+        source_dir = tmp_path / "source"
+        source_dir.mkdir()
+        (source_dir / "a.txt").write_text("content a" * 1000)
+        tar_path = tmp_path / "out.tar.gz"
+        det_tar.create_deterministic_tar(str(source_dir), str(tar_path), "gzip")
+        result = verify_tar_determinism.check_tar(str(tar_path), integrity=True)
+        assert result["ok"] and result["integrity"]["is_valid"]
+        tar_path.write_bytes(tar_path.read_bytes()[:-4])
+        assert verify_tar_determinism.check_tar(str(tar_path))["ok"] is True
+        assert verify_tar_determinism.check_tar(str(tar_path), integrity=True)["ok"] is False
+        assert not verify_tar_determinism.check_tar_determinism(str(tar_path), integrity=True)["is_deterministic"]
+
+
+class TestBatchVerify:
+    """Batch mode of verify_tar_determinism"""
+
+    @pytest.fixture
+    def archives(self, tmp_path):
+        source_dir = tmp_path / "source"
+        source_dir.mkdir()
+        (source_dir / "a.txt").write_text("content a")
+        out = tmp_path / "dist"
+        for name in ("b.tar.gz", "a.tar", "c.tar.xz"):
+            det_tar.create_deterministic_tar(str(source_dir), str(out / name))
+        with tarfile.open(out / "bad.tar", "w") as tar:
+            info = tarfile.TarInfo("file.txt")
+            info.mtime = 1234567890
+            tar.addfile(info)
+        (out / "notes.txt").write_text("not an archive")
+        return out
+
+    def test_sorted_report_with_failures(self, archives):
+        """Should report every archive, sorted by path, whatever order the pool finishes in"""
+        paths = verify_tar_determinism.expand_globs([str(archives / "*")])
+        assert [pathlib.Path(p).name for p in paths] == ["a.tar", "b.tar.gz", "bad.tar", "c.tar.xz"]
+        rep = verify_tar_determinism.check_many(list(reversed(paths)), workers=3, integrity=True)
+        assert [a["path"] for a in rep["archives"]] == paths
+        assert rep["failed"] == [str(archives / "bad.tar")] and rep["ok"] is False and rep["count"] == 4
+        assert all(a["seconds"] >= 0 for a in rep["archives"])
+
+    def test_rbom_source(self, archives, tmp_path):
+        """Should verify the tar archives an RBOM lists"""
+        from tools.make_rbom import generate_rbom
+        rbom = archives / "release_bom.json"
+        doc = generate_rbom(archives, "v1")
+        for art in doc["artifacts"]:
+            art["path"] = "/elsewhere/" + art["name"]  # built on another machine: resolved next to the RBOM
+        rbom.write_text(json.dumps(doc))
+        assert [pathlib.Path(p).name for p in verify_tar_determinism.rbom_archives(str(rbom))] == ["a.tar", "b.tar.gz", "bad.tar", "c.tar.xz"]
+
+    def test_main_glob(self, archives, tmp_path, monkeypatch):
+        """Should write one aggregated report and pass when every archive passes"""
+        (archives / "bad.tar").unlink()
+        out = tmp_path / "tar_check.json"
+        monkeypatch.setattr("sys.argv", ["verify_tar_determinism.py", "--glob", str(archives / "*.tar*"),
+                                         "--workers", "1", "--out", str(out)])
+        verify_tar_determinism.main()
+        rep = json.loads(out.read_text())
+        assert rep["ok"] and rep["count"] == 3
+
+
 class TestDetTar:
     """Test deterministic tar creation"""
     
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""Test suite for tools/git_dirty.py - dirty-tree detection with one git status or the index stat cache"""
+import os
+import subprocess
+import pytest
+from tools import git_dirty, metrics
+
+
+@pytest.fixture
+def repo(tmp_path, monkeypatch):
+    monkeypatch.delenv("REPRO_STAT_SNAPSHOT", raising=False)
+    monkeypatch.setattr(git_dirty, "_snapshots", {})
+    root = tmp_path / "repo"
+    git = ["git", "-C", str(root), "-c", "user.name=t", "-c", "user.email=t@example.com"]
+    subprocess.run(["git", "init", "-q", str(root)], check=True)
+    for i in range(20):
+        d = root / "src" / f"d{i % 4}"
+        d.mkdir(parents=True, exist_ok=True)
+        (d / f"f{i}.txt").write_text(f"file {i}\n")
+    (root / ".gitignore").write_text("build/\n*.log\n")
+    (root / "build").mkdir()
+    (root / "build" / "out.bin").write_bytes(b"\0")
+    os.symlink("src/d0/f0.txt", root / "link")
+    subprocess.run(git + ["add", "."], check=True)
+    subprocess.run(git + ["commit", "-q", "-m", "init"], check=True)
+    return root, git
+
+
+def state(root, **kw):
+    """Index-engine answer, checked against `git status --porcelain` itself."""
+    got = git_dirty.dirty_state(str(root), engine="index", **kw)
+    args = ["git", "-C", str(root), "status", "--porcelain"] + ([] if kw.get("untracked", True) else ["-uno"])
+    assert got["dirty"] == bool(subprocess.check_output(args)), got
+    return got
+
+
+class TestIndexEngine:
+    def test_clean_and_touched(self, repo):
+        root, _ = repo
+        assert state(root) == {"dirty": False, "engine": "index", "reason": None}
+        os.utime(root / "src" / "d1" / "f1.txt", (1, 1))
+        metrics.reset()
+        assert not state(root)["dirty"]
+        assert metrics.snapshot()["counters"]["dirty_files_hashed_total"] >= 1
+
+    def test_tracked_changes(self, repo):
+        root, git = repo
+        (root / "src" / "d1" / "f5.txt").write_text("edited\n")
+        assert state(root)["reason"] == "modified: src/d1/f5.txt"
+        subprocess.run(git + ["checkout", "--", "src"], check=True)
+        (root / "src" / "d2" / "f2.txt").unlink()
+        assert state(root)["reason"] == "deleted: src/d2/f2.txt"
+        subprocess.run(git + ["checkout", "--", "src"], check=True)
+        os.chmod(root / "src" / "d3" / "f3.txt", 0o755)
+        assert state(root)["dirty"]
+
+    def test_staged_changes(self, repo):
+        root, git = repo
+        (root / "src" / "d0" / "f4.txt").write_text("staged\n")
+        subprocess.run(git + ["add", "src"], check=True)
+        assert state(root, untracked=False)["reason"] == "staged changes"
+
+    def test_untracked_and_ignored(self, repo):
+        root, _ = repo
+        (root / "src" / "d0" / "x.log").write_text("")
+        (root / "new" / "sub").mkdir(parents=True)
+        (root / "new" / "sub" / "y.log").write_text("")
+        assert not state(root)["dirty"]
+        (root / "new" / "sub" / "z.txt").write_text("")
+        assert state(root)["reason"] == "untracked: new/sub/z.txt"
+        assert not state(root, untracked=False)["dirty"]
+
+    def test_index_v4(self, repo):
+        root, git = repo
+        subprocess.run(git + ["update-index", "--index-version", "4"], check=True)
+        assert not state(root)["dirty"]
+        (root / "src" / "d2" / "f10.txt").write_text("edited\n")
+        assert state(root)["reason"] == "modified: src/d2/f10.txt"
+
+    def test_split_index_falls_back(self, repo):
+        root, git = repo
+        subprocess.run(git + ["update-index", "--split-index"], check=True)
+        got = git_dirty.dirty_state(str(root), engine="index")
+        assert got["engine"] == "git" and got["note"] == "split index" and not got["dirty"]
+
+
+class TestSnapshot:
+    def test_git_engine_by_default(self, repo):
+        root, _ = repo
+        got = git_dirty.dirty_state(str(root))
+        assert got["engine"] == "git" and not got["dirty"]
+        (root / "src" / "d0" / "new.txt").write_text("")
+        assert git_dirty.dirty_state(str(root / "src"))["dirty"]
+
+    def test_shared_between_processes(self, repo, tmp_path, monkeypatch):
+        root, _ = repo
+        monkeypatch.setenv("REPRO_STAT_SNAPSHOT", str(tmp_path / "stat.json"))
+        snap = git_dirty.snapshot_tree(str(root))
+        assert "src/d1/f1.txt" in snap and "build/out.bin" in snap and not any(p.startswith(".git/") for p in snap)
+        monkeypatch.setattr(git_dirty, "_snapshots", {})
+        monkeypatch.setenv("REPRO_DIRTY_ENGINE", "index")
+        got = git_dirty.dirty_state(str(root))
+        assert got == {"dirty": False, "engine": "index", "reason": None}
+        # The snapshot is what the check trusts: a file it does not list is deleted.
+        del snap["src/d3/f7.txt"]
+        assert git_dirty.dirty_state(str(root), snapshot=snap)["reason"] == "deleted: src/d3/f7.txt"
+        snap["src/d3/f7.txt"] = snap["notes.txt"] = snap["src/d0/f0.txt"]
+        assert git_dirty.dirty_state(str(root), snapshot=snap)["reason"] == "untracked: notes.txt"
+
+    def test_bad_engine(self, repo):
+        with pytest.raises(ValueError):
+            git_dirty.dirty_state(str(repo[0]), engine="fast")
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
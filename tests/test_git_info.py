@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""Test suite for tools/git_info.py - shared git queries over one cat-file process"""
+import subprocess
+import pytest
+from tools import git_info, metrics
+
+
+@pytest.fixture
+def repo(tmp_path):
+    git = ["git", "-C", str(tmp_path), "-c", "user.name=t", "-c", "user.email=t@example.com"]
+    subprocess.run(["git", "init", "-q", str(tmp_path)], check=True)
+    shas = []
+    for i in range(3):
+        (tmp_path / "f.txt").write_text(str(i))
+        subprocess.run(git + ["add", "f.txt"], check=True)
+        subprocess.run(git + ["commit", "-q", "-m", f"c{i}"], check=True)
+        shas.append(subprocess.check_output(git + ["rev-parse", "HEAD"], text=True).strip())
+    subprocess.run(git + ["tag", "-a", "v1.0", "-m", "v1.0"], check=True)
+    return tmp_path, shas
+
+
+class TestGitInfo:
+    def test_one_process_for_many_queries(self, repo):
+        path, shas = repo
+        g = git_info.GitInfo(str(path))
+        metrics.reset()
+        status = g.commit_status(shas * 100 + ["0" * 40])
+        assert all(status[s] == (True, "present") for s in shas) and status["0" * 40] == (False, "not_found")
+        assert g.rev_parse("HEAD") == shas[-1]
+        assert g.commit_exists(shas[0]) == (True, "present")
+        assert metrics.snapshot()["counters"]["git_processes_total"] == 1
+        g.close()
+
+    def test_objects_and_revisions(self, repo):
+        path, shas = repo
+        g = git_info.GitInfo(str(path))
+        blob = subprocess.check_output(["git", "-C", str(path), "rev-parse", "HEAD:f.txt"], text=True).strip()
+        assert g.commit_exists(blob) == (False, "not_found")
+        assert g.lookup(["v1.0", "HEAD~1"]) == {"v1.0": (g.rev_parse("v1.0"), "tag"), "HEAD~1": (shas[1], "commit")}
+        assert g.commit_exists("v1.0") == (True, "present")
+        with pytest.raises(ValueError):
+            g.lookup(["a\nb"])
+        assert g.commit_status([shas[0] + "\nHEAD", shas[0]]) == {shas[0] + "\nHEAD": (False, "not_found"), shas[0]: (True, "present")}
+        g.close()
+
+    def test_cached_commands(self, repo):
+        path, _ = repo
+        g = git_info.GitInfo(str(path))
+        metrics.reset()
+        assert g.describe("--tags") == "v1.0" and g.describe("--tags") == "v1.0"
+        assert g.cached("no-such-command") is None
+        assert metrics.snapshot()["cache"]["git_command"]["hits"] == 1
+
+    def test_not_a_repository(self, tmp_path):
+        g = git_info.GitInfo(str(tmp_path))
+        assert g.commit_exists("0" * 40) == (False, "not_found")
+        assert g.rev_parse() is None
+
+    def test_get_is_per_directory(self, repo, tmp_path, monkeypatch):
+        path, _ = repo
+        monkeypatch.chdir(path)
+        assert git_info.get() is git_info.get(str(path))
+        assert git_info.get(str(tmp_path / "..")) is not git_info.get()
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
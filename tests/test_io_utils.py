@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+"""Test suite for tools/io_utils.py - adaptive read strategies and hashing"""
+import hashlib
+import sys
+import threading
+import types
+import pytest
+from tools import io_utils
+
+
+@pytest.fixture(params=[0, 1, 4096, (256 << 10) + 7, io_utils.BufSize + 13])
+def blob(request, tmp_path):
+    data = bytes(range(256)) * (request.param // 256) + b"z" * (request.param % 256)
+    p = tmp_path / "blob.bin"
+    p.write_bytes(data)
+    return p, data
+
+
+class TestStrategies:
+    """Every strategy must produce the same bytes and digest"""
+
+    @pytest.mark.parametrize("strategy", io_utils.STRATEGIES)
+    def test_sha256_matches_hashlib(self, blob, strategy):
+        p, data = blob
+        assert io_utils.sha256_path(p, strategy=strategy) == hashlib.sha256(data).hexdigest()
+
+    @pytest.mark.parametrize("strategy", io_utils.STRATEGIES)
+    def test_read_chunks_returns_size(self, blob, strategy):
+        p, data = blob
+        out = bytearray()
+        assert io_utils.read_chunks(p, out.extend, strategy) == len(data)
+        assert bytes(out) == data
+
+    def test_unknown_strategy(self, tmp_path):
+        p = tmp_path / "x"
+        p.write_bytes(b"x" * (io_utils.SMALL_FILE_MAX + 1))
+        with pytest.raises(ValueError):
+            io_utils.sha256_path(p, strategy="bogus")
+
+
+class TestDigestPath:
+    """Test multi-digest single-pass hashing"""
+
+    def test_multiple_algorithms(self, blob):
+        p, data = blob
+        got = io_utils.digest_path(p, ["sha256", "SHA-512", "blake2b"])
+        assert got == {
+            "sha256": hashlib.sha256(data).hexdigest(),
+            "sha512": hashlib.sha512(data).hexdigest(),
+            "blake2b": hashlib.blake2b(data).hexdigest(),
+        }
+
+    def test_fanout_matches_sequential(self, blob, monkeypatch):
+        p, data = blob
+        monkeypatch.setattr(io_utils, "FANOUT_MIN", 1)
+        got = io_utils.digest_path(p, ["sha256", "sha512", "sha1"])
+        assert got["sha512"] == hashlib.sha512(data).hexdigest()
+        assert got["sha1"] == hashlib.sha1(data).hexdigest()
+
+    @pytest.mark.parametrize("name,key", [("SHA-256", "sha256"), ("sha-1", "sha1"), ("sha3-256", "sha3_256"), ("SHA3-512", "sha3_512")])
+    def test_hyphenated_names(self, blob, name, key):
+        p, data = blob
+        assert io_utils.digest_path(p, [name]) == {key: hashlib.new(key, data).hexdigest()}
+
+    @pytest.mark.parametrize("name", ["md55", "shake_128", ""])
+    def test_unsupported_algorithm(self, tmp_path, name):
+        p = tmp_path / "x"
+        p.write_bytes(b"x")
+        with pytest.raises(ValueError):
+            io_utils.digest_path(p, [name])
+
+
+class TestMerkle:
+    """Test chunk Merkle trees, proofs and partial verification"""
+
+    def _rfc6962_root(self, leaves):
+        if len(leaves) == 1:
+            return leaves[0]
+        k = io_utils._split(len(leaves))
+        return io_utils._merkle_node(self._rfc6962_root(leaves[:k]), self._rfc6962_root(leaves[k:]))
+
+    @pytest.mark.parametrize("n", [1, 2, 3, 5, 8, 13])
+    def test_root_and_every_proof(self, n):
+        leaves = [io_utils.merkle_leaf(bytes([i])) for i in range(n)]
+        root = io_utils.merkle_root(leaves)
+        assert root == self._rfc6962_root(leaves)
+        for i in range(n):
+            proof = io_utils.merkle_proof(leaves, i)
+            assert len(proof) <= n.bit_length()
+            assert io_utils.merkle_verify(leaves[i], i, n, proof, root)
+            assert not io_utils.merkle_verify(io_utils.merkle_leaf(b"evil"), i, n, proof, root)
+
+    def test_merkle_path_matches_chunks(self, tmp_path):
+        data = bytes(range(256)) * 40  # 10240 bytes -> 3 chunks of 4096
+        p = tmp_path / "big.bin"
+        p.write_bytes(data)
+        info = io_utils.merkle_path(p, chunk_size=4096)
+        leaves = [io_utils.merkle_leaf(data[i:i + 4096]) for i in range(0, len(data), 4096)]
+        assert info == {"root": io_utils.merkle_root(leaves).hex(), "chunk_size": 4096, "leaf_count": 3, "size": 10240}
+
+    def test_verify_chunks_detects_corruption(self, tmp_path):
+        p = tmp_path / "big.bin"
+        p.write_bytes(b"a" * 4096 + b"b" * 4096 + b"c" * 100)
+        leaves = []
+        root = io_utils.merkle_path(p, chunk_size=4096, leaves_out=leaves)["root"]
+        assert io_utils.verify_chunks(p, range(0, 3), root, leaves, 4096) == (True, [])
+        p.write_bytes(b"a" * 4096 + b"X" * 4096 + b"c" * 100)
+        assert io_utils.verify_chunks(p, [0, 1], root, leaves, 4096) == (False, [1])
+        # A tampered sidecar cannot make a chunk pass.
+        forged = list(leaves)
+        forged[1] = io_utils.merkle_leaf(b"X" * 4096)
+        assert io_utils.verify_chunks(p, [1], root, forged, 4096) == (False, [1])
+
+    def test_tree_proof_for_artifact(self):
+        arts = [{"name": n, "sha256": hashlib.sha256(n.encode()).hexdigest()} for n in ("c", "a", "b")]
+        root = bytes.fromhex(io_utils.tree_root(arts))
+        i, n, proof = io_utils.tree_proof(arts, "b")
+        assert (i, n) == (1, 3)
+        assert io_utils.merkle_verify(io_utils.tree_leaf("b", arts[2]["sha256"]), i, n, proof, root)
+        with pytest.raises(KeyError):
+            io_utils.tree_proof(arts, "missing")
+
+    @pytest.mark.parametrize("text,expected", [("3", range(3, 4)), ("1:4", range(1, 4))])
+    def test_parse_chunk_range(self, text, expected):
+        assert io_utils.parse_chunk_range(text) == expected
+
+    @pytest.mark.parametrize("text", ["", "x", "4:2", "-1"])
+    def test_parse_chunk_range_rejects(self, text):
+        with pytest.raises(ValueError):
+            io_utils.parse_chunk_range(text)
+
+
+class TestChooseStrategy:
+    """Test size thresholds"""
+
+    def test_thresholds(self):
+        assert io_utils.choose_strategy(0) == "read"
+        assert io_utils.choose_strategy(io_utils.SMALL_FILE_MAX) == "read"
+        assert io_utils.choose_strategy(io_utils.SMALL_FILE_MAX + 1) == "readinto"
+        assert io_utils.choose_strategy(io_utils.MMAP_MIN) == "mmap"
+        assert io_utils.choose_strategy(io_utils.DROP_CACHE_MIN) == "stream"
+
+    def test_buffer_is_per_thread_and_reused(self):
+        mine = io_utils._buffer()
+        assert io_utils._buffer() is mine
+        other = []
+        t = threading.Thread(target=lambda: other.append(io_utils._buffer()))
+        t.start(); t.join()
+        assert other[0] is not mine
+
+
+class TestFingerprint:
+    """Test the internal change-detection fingerprint"""
+
+    @pytest.mark.parametrize("backend", ["blake2b", "sha256"])
+    @pytest.mark.parametrize("strategy", io_utils.STRATEGIES)
+    def test_path_matches_bytes(self, blob, backend, strategy):
+        p, data = blob
+        fp = io_utils.fingerprint_path(p, strategy=strategy, backend=backend)
+        assert fp == io_utils.fingerprint_bytes(data, backend=backend)
+        assert fp == f"{backend}:" + hashlib.new(backend, data).hexdigest()
+
+    def test_backends_never_compare_equal(self):
+        assert io_utils.fingerprint_bytes(b"x", "blake2b") != io_utils.fingerprint_bytes(b"x", "sha256")
+
+    def test_env_selects_backend(self, monkeypatch):
+        monkeypatch.setattr(io_utils, "_fp_backend", None)
+        monkeypatch.setenv("REPRO_FINGERPRINT", "BLAKE2b")
+        assert io_utils.fingerprint_backend() == "blake2b"
+        assert io_utils.fingerprint_bytes(b"").startswith("blake2b:")
+
+    @pytest.mark.parametrize("spelling,name", [("SHA-256", "sha256"), ("xxh3-128", "xxh3_128"), ("XXH3_128", "xxh3_128")])
+    def test_env_spellings(self, monkeypatch, spelling, name):
+        monkeypatch.setitem(sys.modules, "xxhash", types.SimpleNamespace(xxh3_128=hashlib.sha256))
+        monkeypatch.setattr(io_utils, "_fp_backend", None)
+        monkeypatch.setenv("REPRO_FINGERPRINT", spelling)
+        assert io_utils.fingerprint_backend() == name
+
+    def test_default_is_fixed(self, monkeypatch):
+        monkeypatch.setattr(io_utils, "_fp_backend", None)
+        monkeypatch.delenv("REPRO_FINGERPRINT", raising=False)
+        assert io_utils.fingerprint_backend() == io_utils.DEFAULT_FINGERPRINT == "blake2b"
+
+    def test_unknown_backend(self, monkeypatch):
+        monkeypatch.setattr(io_utils, "_fp_backend", None)
+        monkeypatch.setenv("REPRO_FINGERPRINT", "crc32")
+        with pytest.raises(ValueError):
+            io_utils.fingerprint_backend()
+
+    def test_memo_tracks_content_changes(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(io_utils, "_FP_RACY_NS", -1)
+        p = tmp_path / "f"
+        p.write_bytes(b"one")
+        first = io_utils.fingerprint_path(p, backend="sha256")
+        assert io_utils.fingerprint_path(p, backend="sha256") == first
+        p.write_bytes(b"two!")
+        assert io_utils.fingerprint_path(p, backend="sha256") != first
+
+
+class TestPrefetchOrdered:
+    """Test the ordered read-ahead pool"""
+
+    def _files(self, tmp_path, sizes):
+        out = []
+        for i, n in enumerate(sizes):
+            p = tmp_path / f"f{i}"
+            p.write_bytes(bytes([i % 256]) * n)
+            out.append((i, p, n))
+        return out
+
+    def test_order_and_contents(self, tmp_path):
+        files = self._files(tmp_path, [10, 0, 3000, 7] * 10)
+        got = list(io_utils.prefetch_ordered(files, workers=4, max_bytes=1 << 20))
+        assert [i for i, _ in got] == [i for i, _, _ in files]
+        assert all(data == p.read_bytes() for (_, data), (_, p, _) in zip(got, files))
+
+    def test_over_cap_and_pathless_are_streamed(self, tmp_path):
+        files = self._files(tmp_path, [5, 500, 5]) + [("dir", None, 0)]
+        got = dict(io_utils.prefetch_ordered(files, workers=2, max_bytes=100))
+        assert got[1] is None and got["dir"] is None and got[0] == bytes([0]) * 5
+
+    def test_memory_cap(self, tmp_path, monkeypatch):
+        files = self._files(tmp_path, [40] * 20)
+        held, peak, real = [0], [0], io_utils._read_exact
+        lock = threading.Lock()
+
+        def read(path, size):
+            with lock:
+                held[0] += size; peak[0] = max(peak[0], held[0])
+            return real(path, size)
+        monkeypatch.setattr(io_utils, "_read_exact", read)
+        for _, data in io_utils.prefetch_ordered(files, workers=4, max_bytes=100):
+            with lock:
+                held[0] -= len(data)
+        assert peak[0] <= 100
+
+    def test_error_surfaces_at_its_item(self, tmp_path):
+        files = self._files(tmp_path, [3, 3])
+        files.insert(1, ("missing", tmp_path / "nope", 3))
+        it = io_utils.prefetch_ordered(files, workers=2)
+        assert next(it)[0] == 0
+        with pytest.raises(FileNotFoundError):
+            next(it)
+
+    def test_disabled(self, tmp_path, monkeypatch):
+        monkeypatch.setenv("REPRO_PREFETCH_WORKERS", "0")
+        files = self._files(tmp_path, [3])
+        assert list(io_utils.prefetch_ordered(files)) == [(0, None)]
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""Test suite for tools/make_vel_manifest.py - single and batch VEL manifest generation"""
+import json
+import subprocess
+import sys
+from pathlib import Path
+import pytest
+from tools import make_vel_manifest, repro_audit, vel_validator
+
+ROOT = Path(__file__).resolve().parents[1]
+SHA = "a" * 40
+
+
+@pytest.fixture
+def artifacts(tmp_path):
+    d = tmp_path / "dist"
+    d.mkdir()
+    for i in range(5):
+        (d / f"pkg-{i}.tar.gz").write_bytes(bytes([i]) * (2000 * (i + 1)))
+    return d
+
+
+class TestBatch:
+    def test_one_manifest_per_artifact(self, artifacts, tmp_path):
+        out = tmp_path / "manifests"
+        arts = make_vel_manifest.expand_artifacts([str(artifacts)])
+        rep = make_vel_manifest.make_batch(arts, str(out), ["sha512"], workers=3, repo="org/repo", git_sha=SHA)
+        assert rep["count"] == 5 and sorted(p.name for p in out.glob("*.json")) == [f"pkg-{i}.tar.gz.json" for i in range(5)]
+        docs = [json.loads(p.read_text()) for p in sorted(out.glob("*.json"))]
+        assert len({d["manifest_uuid"] for d in docs}) == 5
+        assert docs[2]["manifest_uuid"] == make_vel_manifest.artifact_uuid("org/repo", SHA, "pkg-2.tar.gz")
+        assert docs[2]["provenance"] == {"git_sha": SHA, **make_vel_manifest.artifact_digests(str(artifacts / "pkg-2.tar.gz"), ["sha512"])}
+        assert (out / "pkg-0.tar.gz.json").read_text() == json.dumps(docs[0], sort_keys=True, separators=(",", ":"))
+
+    def test_deterministic_across_worker_counts(self, artifacts, tmp_path):
+        arts = make_vel_manifest.expand_artifacts([str(artifacts / "*.tar.gz")])
+        make_vel_manifest.make_batch(arts, str(tmp_path / "a"), workers=1, repo="org/repo", git_sha=SHA)
+        make_vel_manifest.make_batch(arts, str(tmp_path / "b"), workers=4, repo="org/repo", git_sha=SHA)
+        for p in sorted((tmp_path / "a").iterdir()):
+            assert p.read_bytes() == (tmp_path / "b" / p.name).read_bytes()
+
+    def test_index_feeds_validator_and_audit(self, artifacts, tmp_path):
+        out = tmp_path / "manifests"
+        make_vel_manifest.make_batch(make_vel_manifest.expand_artifacts([str(artifacts)]), str(out), repo="org/repo", git_sha=SHA)
+        items = vel_validator.load_batch(str(out / "manifests.jsonl"))
+        assert len(items) == 5 and all(Path(i["artifact"]).resolve().parent == artifacts for i in items)
+        rep = vel_validator.validate_batch(items, str(ROOT / "schema" / "vel_manifest.schema.json"), workers=1)
+        assert rep["ok"] and rep["count"] == 5, rep["failed"]
+        audit = repro_audit.audit_release(repro_audit.manifest_jobs(str(out), str(artifacts)), workers=2)
+        assert audit["overall"] == "PASS" and audit["count"] == 5
+
+    def test_duplicate_names_rejected(self, artifacts, tmp_path):
+        (tmp_path / "other").mkdir()
+        (tmp_path / "other" / "pkg-1.tar.gz").write_bytes(b"x")
+        with pytest.raises(ValueError, match="pkg-1.tar.gz"):
+            make_vel_manifest.expand_artifacts([str(artifacts), str(tmp_path / "other")])
+
+    def test_cli(self, artifacts, tmp_path):
+        proc = subprocess.run([sys.executable, str(ROOT / "tools" / "make_vel_manifest.py"), "--artifacts", str(artifacts / "*.gz"),
+                               "--out-dir", str(tmp_path / "m"), "--merkle"], capture_output=True, text=True, cwd=tmp_path)
+        assert proc.returncode == 0, proc.stderr
+        assert (tmp_path / "m" / "pkg-4.tar.gz.merkle.json").exists()
+        assert "artifact_merkle_root" in json.loads((tmp_path / "m" / "pkg-4.tar.gz.json").read_text())["provenance"]
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
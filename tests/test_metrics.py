@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""Test suite for tools/metrics.py - per-tool counters, histograms and outputs"""
+import json
+import subprocess
+import sys
+from pathlib import Path
+import pytest
+from tools import metrics
+from tools.io_utils import sha256_path
+
+
+@pytest.fixture(autouse=True)
+def _clean_metrics():
+    metrics.reset()
+    yield
+    metrics.reset()
+
+
+class TestRecording:
+    """Test in-process recording"""
+
+    def test_counters_accumulate(self):
+        metrics.inc("files_total")
+        metrics.inc("files_total", 2)
+        assert metrics.snapshot()["counters"]["files_total"] == 3
+
+    def test_histogram_buckets_are_cumulative(self):
+        metrics.observe("lat_seconds", 0.0001)
+        metrics.observe("lat_seconds", 0.02)
+        metrics.observe("lat_seconds", 100.0)
+        h = metrics.snapshot()["histograms"]["lat_seconds"]
+        assert h["count"] == 3
+        assert h["buckets"]["0.0005"] == 1
+        assert h["buckets"]["0.05"] == 2
+        assert h["buckets"]["+Inf"] == 3
+
+    def test_cache_hit_rate(self):
+        metrics.cache("hash_cache", True)
+        metrics.cache("hash_cache", True)
+        metrics.cache("hash_cache", False)
+        c = metrics.snapshot()["cache"]["hash_cache"]
+        assert (c["hits"], c["misses"]) == (2, 1)
+        assert c["hit_rate"] == pytest.approx(2 / 3, abs=1e-6)
+
+    def test_phase_records_time(self):
+        with metrics.phase("walk"):
+            pass
+        assert metrics.snapshot()["phases"]["walk"] >= 0.0
+
+    def test_io_utils_reports_bytes_read(self, tmp_path):
+        f = tmp_path / "blob.bin"
+        f.write_bytes(b"x" * 1000)
+        sha256_path(f)
+        snap = metrics.snapshot()
+        assert snap["counters"]["bytes_read_total"] == 1000
+        assert snap["counters"]["files_hashed_total"] == 1
+        assert snap["histograms"]["hash_file_seconds"]["count"] == 1
+
+
+class TestOutputs:
+    """Test metrics.json merging and node-exporter textfile output"""
+
+    def test_write_json_merges_per_tool(self, tmp_path):
+        out = tmp_path / "metrics.json"
+        metrics.inc("a_total")
+        metrics.write_json(out, tool="det_tar")
+        metrics.reset()
+        metrics.inc("b_total", 5)
+        metrics.write_json(out, tool="make_rbom")
+        doc = json.loads(out.read_text(encoding="utf-8"))
+        assert doc["tools"]["det_tar"]["counters"] == {"a_total": 1}
+        assert doc["tools"]["make_rbom"]["counters"] == {"b_total": 5}
+
+    def test_parallel_tools_keep_their_sections(self, tmp_path):
+        out = tmp_path / "metrics.json"
+        code = "from tools import metrics; metrics.inc('runs_total')"
+        root = str(Path(__file__).resolve().parents[1])
+        procs = [subprocess.Popen([sys.executable, "-c", code], cwd=root,
+                                  env={"PYTHONPATH": root, "REPRO_METRICS": str(out), "REPRO_METRICS_TOOL": f"tool{i}"})
+                 for i in range(8)]
+        assert all(p.wait() == 0 for p in procs)
+        assert sorted(json.loads(out.read_text(encoding="utf-8"))["tools"]) == [f"tool{i}" for i in range(8)]
+
+    def test_textfile_format(self, tmp_path):
+        metrics.inc("bytes_read_total", 42)
+        metrics.observe("hash_file_seconds", 0.002)
+        metrics.cache("schema", False)
+        out = tmp_path / "repro.prom"
+        metrics.write_textfile(out, {"tools": {"det_tar": metrics.snapshot()}})
+        text = out.read_text(encoding="utf-8")
+        assert "# TYPE repro_bytes_read_total counter" in text
+        assert 'repro_bytes_read_total{tool="det_tar"} 42' in text
+        assert 'repro_hash_file_seconds_bucket{tool="det_tar",le="+Inf"} 1' in text
+        assert 'repro_cache_misses_total{tool="det_tar",cache="schema"} 1' in text
+        assert not list(tmp_path.glob("*.tmp"))
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""Test suite for tools/profiling.py - --profile / REPRO_PROFILE entry-point wrapper"""
+import pstats
+import sys
+import time
+import pytest
+from tools import profiling
+
+
+def _busy(seconds=0.05):
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        sum(range(200))
+
+
+class TestProfilePrefix:
+    """Test option/env parsing"""
+
+    def test_no_request_returns_none(self, monkeypatch):
+        monkeypatch.delenv("REPRO_PROFILE", raising=False)
+        argv = ["tool.py", "--out", "x.json"]
+        assert profiling.profile_prefix(argv) is None
+        assert argv == ["tool.py", "--out", "x.json"]
+
+    def test_flag_with_path_is_stripped(self, monkeypatch):
+        monkeypatch.delenv("REPRO_PROFILE", raising=False)
+        argv = ["tool.py", "--profile=/tmp/p/run", "--out", "x.json"]
+        assert profiling.profile_prefix(argv) == "/tmp/p/run"
+        assert argv == ["tool.py", "--out", "x.json"]
+
+    def test_env_directory_uses_tool_name(self, monkeypatch, tmp_path):
+        monkeypatch.setenv("REPRO_PROFILE", str(tmp_path))
+        monkeypatch.setenv("REPRO_METRICS_TOOL", "det_tar")
+        assert profiling.profile_prefix(["tool.py"]) == str(tmp_path / "det_tar")
+
+
+class TestRun:
+    """Test profiled execution"""
+
+    def test_writes_pstats_and_collapsed(self, monkeypatch, tmp_path):
+        prefix = tmp_path / "prof"
+        monkeypatch.setattr(sys, "argv", ["tool.py", f"--profile={prefix}"])
+        monkeypatch.setenv("REPRO_PROFILE_INTERVAL_MS", "1")
+        assert profiling.run(lambda: (_busy(), 7)[1]) == 7
+        stats = pstats.Stats(str(prefix) + ".pstats")
+        assert stats.total_calls > 0
+        lines = (tmp_path / "prof.collapsed").read_text(encoding="utf-8").splitlines()
+        assert lines
+        stack, count = lines[0].rsplit(" ", 1)
+        assert stack.startswith("MainThread;") and int(count) >= 1
+
+    def test_sample_mode_skips_cprofile(self, monkeypatch, tmp_path):
+        prefix = tmp_path / "prof"
+        monkeypatch.setattr(sys, "argv", ["tool.py"])
+        monkeypatch.setenv("REPRO_PROFILE", str(prefix))
+        monkeypatch.setenv("REPRO_PROFILE_MODE", "sample")
+        profiling.run(_busy)
+        assert (tmp_path / "prof.collapsed").exists()
+        assert not (tmp_path / "prof.pstats").exists()
+
+    def test_profile_written_on_system_exit(self, monkeypatch, tmp_path):
+        prefix = tmp_path / "prof"
+        monkeypatch.setattr(sys, "argv", ["tool.py", f"--profile={prefix}"])
+
+        def failing_main():
+            sys.exit(2)
+
+        with pytest.raises(SystemExit):
+            profiling.run(failing_main)
+        assert (tmp_path / "prof.pstats").exists()
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
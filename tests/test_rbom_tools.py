@@ -46,6 +46,18 @@ class TestMakeRBOM:
         expected_sha = hashlib.sha256(test_content).hexdigest()
         assert artifacts[0]["sha256"] == expected_sha
     
+    def test_artifact_extra_digests(self, tmp_path):
+        """Should add requested extra digests alongside sha256"""
+        test_content = b"provenance subject"
+        (tmp_path / "test.bin").write_bytes(test_content)
+        
+        artifacts = collect_artifacts(str(tmp_path), algorithms=["sha512", "blake2b"])
+        
+        import hashlib
+        assert artifacts[0]["sha256"] == hashlib.sha256(test_content).hexdigest()
+        assert artifacts[0]["sha512"] == hashlib.sha512(test_content).hexdigest()
+        assert artifacts[0]["blake2b"] == hashlib.blake2b(test_content).hexdigest()
+    
     def test_artifact_includes_size(self, tmp_path):
         """Should include file size for each artifact"""
         test_file = tmp_path / "test.bin"
@@ -71,6 +83,23 @@ class TestMakeRBOM:
         assert rbom["release_version"] == "v1.0.0"
         assert isinstance(rbom["artifacts"], list)
     
+    def test_cli_inputs_and_out(self, tmp_path):
+        """Should list --inputs globs by basename and write --out, leaving the RBOM itself out"""
+        import subprocess, sys
+        tool = pathlib.Path(__file__).resolve().parents[1] / "tools" / "make_rbom.py"
+        (tmp_path / "out").mkdir()
+        (tmp_path / "out" / "artifact.tar.gz").write_bytes(b"tar")
+        (tmp_path / "VEL_MANIFEST.json").write_text("{}")
+        for _ in range(2):
+            proc = subprocess.run([sys.executable, "-I", str(tool), "--inputs", "out/* VEL_MANIFEST.json *.json", "--out", "release_bom.json"],
+                                  cwd=tmp_path, capture_output=True, text=True)
+            assert proc.returncode == 0, proc.stderr
+        rbom = json.loads((tmp_path / "release_bom.json").read_text())
+        assert [a["name"] for a in rbom["artifacts"]] == ["VEL_MANIFEST.json", "artifact.tar.gz"]
+        (tmp_path / "artifact.tar.gz").write_bytes(b"clash")
+        proc = subprocess.run([sys.executable, "-I", str(tool), "--inputs", "out/* *.gz"], cwd=tmp_path, capture_output=True, text=True)
+        assert proc.returncode == 2 and "two inputs named artifact.tar.gz" in proc.stderr
+
     def test_generate_rbom_with_metadata(self, tmp_path):
         """Should include metadata in RBOM"""
         (tmp_path / "artifact.tar.gz").write_bytes(b"content")
@@ -291,6 +320,21 @@ class TestRBOMIntegration:
         # Check all artifacts present
         assert len(rbom["artifacts"]) == 3
     
+    def test_merkle_tree_root_roundtrip(self, tmp_path):
+        """Should record a tree_root that rbom_check recomputes"""
+        (tmp_path / "a.bin").write_bytes(b"a" * 100)
+        (tmp_path / "b.bin").write_bytes(b"b" * 100)
+        
+        rbom = generate_rbom(str(tmp_path), "v1.0.0", merkle=True)
+        assert len(rbom["tree_root"]) == 64
+        assert all(len(a["merkle_root"]) == 64 for a in rbom["artifacts"])
+        assert validate_rbom(rbom) == (True, [])
+        
+        rbom["artifacts"][0]["sha256"] = "0" * 64
+        ok, errors = validate_rbom(rbom)
+        assert ok is False
+        assert "tree_root_mismatch" in errors
+    
     def test_rbom_file_persistence(self, tmp_path):
         """Should save and load RBOM from file"""
         # Create artifacts
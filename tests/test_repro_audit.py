@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""Test suite for tools/repro_audit.py - release-wide audits against an RBOM or manifests"""
+import json
+import subprocess
+import sys
+from pathlib import Path
+import pytest
+from tools import repro_audit
+from tools.make_rbom import generate_rbom
+
+ROOT = Path(__file__).resolve().parents[1]
+
+
+@pytest.fixture
+def release(tmp_path):
+    rel = tmp_path / "release"
+    rel.mkdir()
+    for i in range(6):
+        (rel / f"app-{i}.tar.gz").write_bytes(bytes([i]) * (1000 + i * 5000))
+    rbom = generate_rbom(str(rel), "v1.0", algorithms=["sha512"], merkle=True)
+    (tmp_path / "release_bom.json").write_text(json.dumps(rbom), encoding="utf-8")
+    return rel, tmp_path / "release_bom.json"
+
+
+def run(*args):
+    return subprocess.run([sys.executable, str(ROOT / "tools" / "repro_audit.py"), *args], capture_output=True, text=True)
+
+
+class TestReleaseAudit:
+    def test_rbom_all_pass(self, release, tmp_path):
+        rel, bom = release
+        out = tmp_path / "reports" / "repro.md"
+        proc = run("--rbom", str(bom), "--release", str(rel), "-o", str(out), "--workers", "3")
+        assert proc.returncode == 0, proc.stderr
+        rep = json.loads(out.with_suffix(".json").read_text())
+        assert rep["overall"] == "PASS" and rep["passed"] == 6 and rep["tree_root"] == "PASS"
+        assert [a["name"] for a in rep["artifacts"]] == sorted(a["name"] for a in rep["artifacts"])
+        assert rep["bytes"] == sum(f.stat().st_size for f in rel.iterdir())
+        assert "| app-5.tar.gz | PASS |" in out.read_text()
+
+    def test_failures_reported(self, release):
+        rel, bom = release
+        (rel / "app-2.tar.gz").write_bytes(b"tampered")
+        (rel / "app-4.tar.gz").unlink()
+        jobs = repro_audit.rbom_jobs(json.loads(bom.read_text()), str(bom), str(rel))
+        data = (rel / "app-3.tar.gz").read_bytes()
+        (rel / "app-3.tar.gz").write_bytes(data[:-1] + b"\xff")
+        rep = repro_audit.audit_release(jobs, workers=2)
+        status = {a["name"]: (a["status"], a["detail"]) for a in rep["artifacts"]}
+        assert status["app-2.tar.gz"][0] == "FAIL" and status["app-2.tar.gz"][1].startswith("size")
+        assert status["app-3.tar.gz"] == ("FAIL", "mismatch: sha256,sha512")
+        assert status["app-4.tar.gz"] == ("ERROR", "missing")
+        assert rep["overall"] == "FAIL" and rep["failed"] == ["app-2.tar.gz", "app-3.tar.gz", "app-4.tar.gz"]
+
+    def test_fail_fast_skips_the_rest(self, release):
+        rel, bom = release
+        (rel / "app-5.tar.gz").write_bytes(b"\x09" * (1000 + 5 * 5000))  # largest, so audited first
+        jobs = repro_audit.rbom_jobs(json.loads(bom.read_text()), str(bom), str(rel))
+        rep = repro_audit.audit_release(jobs, workers=1, fail_fast=True)
+        assert rep["failed"] == ["app-5.tar.gz"] and len(rep["skipped"]) == 5 and rep["overall"] == "FAIL"
+
+    def test_manifest_directory(self, release, tmp_path):
+        rel, _ = release
+        mans = tmp_path / "manifests"
+        mans.mkdir()
+        for f in rel.iterdir():
+            digest = repro_audit.digest_path(f, ["sha256"])["sha256"]
+            (mans / f"{f.name}.json").write_text(json.dumps({"provenance": {"artifact_sha256": digest}}))
+        (mans / "app-0.tar.gz.merkle.json").write_text("{}")
+        jobs = repro_audit.manifest_jobs(str(mans), str(rel))
+        assert len(jobs) == 6 and repro_audit.audit_release(jobs, workers=2)["overall"] == "PASS"
+        out = tmp_path / "repro.md"
+        proc = run("--manifests", str(mans), "--release", str(tmp_path / "nowhere"), "-o", str(out))
+        assert proc.returncode == 2 and json.loads(out.with_suffix(".json").read_text())["failed"]
+
+    def test_unreadable_inputs_are_errors(self, release, tmp_path):
+        rel, _ = release
+        mans = tmp_path / "manifests"
+        mans.mkdir()
+        (mans / "app-0.tar.gz.json").write_text("{not json")
+        jobs = repro_audit.manifest_jobs(str(mans), str(rel))
+        row = repro_audit.audit_release(jobs, workers=1)["artifacts"][0]
+        assert row["status"] == "ERROR" and "manifest" in row["detail"]
+        for args in (["--rbom", str(tmp_path / "missing.json")], ["--rbom", str(mans / "app-0.tar.gz.json")],
+                     ["--manifests", str(tmp_path / "missing.jsonl")]):
+            proc = run(*args, "-o", str(tmp_path / "repro.md"))
+            assert proc.returncode == 2 and proc.stderr.startswith("ERROR:") and "Traceback" not in proc.stderr
+
+    def test_malformed_rbom_entries_are_errors(self, release, tmp_path, monkeypatch):
+        rel, bom = release
+        rbom = json.loads(bom.read_text())
+        rbom["artifacts"][0]["size"] = "3 bytes"
+        rbom["artifacts"].append("app-9.tar.gz")
+        bom.write_text(json.dumps(rbom))
+        proc = run("--rbom", str(bom), "-o", str(tmp_path / "repro.md"))
+        rep = json.loads((tmp_path / "repro.json").read_text())
+        assert proc.returncode == 2 and "Traceback" not in proc.stderr and rep["tree_root"] == "ERROR"
+        assert {a["name"]: a["status"] for a in rep["artifacts"] if a["status"] != "PASS"} == {"app-0.tar.gz": "ERROR", "artifacts[6]": "ERROR"}
+
+        def unreadable(path, algorithms):
+            raise PermissionError(13, "Permission denied", str(path))
+        monkeypatch.setattr(repro_audit, "digest_path", unreadable)
+        jobs = repro_audit.rbom_jobs(json.loads(bom.read_text()), str(bom), str(rel))
+        rep = repro_audit.audit_release(jobs[1:3], workers=2)
+        assert [a["status"] for a in rep["artifacts"]] == ["ERROR", "ERROR"] and "Permission denied" in rep["artifacts"][0]["detail"]
+
+    def test_single_artifact_mode_unchanged(self, release, tmp_path):
+        rel, bom = release
+        proc = run("--rbom", str(bom), "--artifact", str(rel / "app-1.tar.gz"), "--stdout")
+        assert proc.returncode == 0 and "Overall: **PASS**" in proc.stdout
+
+
+
+class TestChunkAudit:
+    def test_bad_range_or_sidecar_is_an_error(self, tmp_path):
+        from tools.make_vel_manifest import merkle_fields
+        art = tmp_path / "a.bin"
+        art.write_bytes(b"x" * 10000)
+        leaves = tmp_path / "a.bin.merkle.json"
+        m = {"provenance": merkle_fields(str(art), str(leaves))}
+        assert repro_audit.verify_artifact_chunks(m, art, "0", leaves) == ("PASS", [])
+        assert repro_audit.verify_artifact_chunks(m, art, "5:2", leaves) == ("ERROR", ["bad chunk range: '5:2'"])
+        leaves.write_text("not json")
+        assert repro_audit.verify_artifact_chunks(m, art, "0", leaves)[0] == "ERROR"
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
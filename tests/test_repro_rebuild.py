@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""Test suite for tools/repro_rebuild.py - double-build comparison"""
+import gzip
+import io
+import tarfile
+import pytest
+from tools import repro_rebuild
+from tools.config import ROOT
+
+
+def _tgz(path, members, mtime=0):
+    """Write a .tar.gz of (name, data, mode) tuples."""
+    buf = io.BytesIO()
+    with tarfile.open(fileobj=buf, mode="w") as tf:
+        for name, data, mode in members:
+            ti = tarfile.TarInfo(name)
+            ti.size, ti.mode = len(data), mode
+            tf.addfile(ti, io.BytesIO(data))
+    with open(path, "wb") as raw, gzip.GzipFile(filename="", mode="wb", fileobj=raw, mtime=mtime) as gz:
+        gz.write(buf.getvalue())
+    return str(path)
+
+
+class TestBuildEnv:
+    """Test perturbation specs"""
+
+    def test_contract_build(self):
+        spec = repro_rebuild.build_env()
+        assert spec["umask"] == "022" and not spec["reverse"]
+        assert spec["env"]["LC_ALL"] == "C" and spec["env"]["TZ"] == "UTC"
+
+    def test_default_perturbations_keep_contract(self):
+        spec = repro_rebuild.build_env(repro_rebuild.DEFAULT_PERTURBATIONS)
+        assert spec["umask"] == "077" and spec["reverse"]
+        assert spec["env"]["PYTHONHASHSEED"] != "0"
+        assert spec["env"]["LANG"] != "C"
+        assert spec["env"]["LC_ALL"] == "C" and spec["env"]["TZ"] == "UTC"
+
+    def test_unknown_perturbation(self):
+        with pytest.raises(ValueError):
+            repro_rebuild.build_env(["moon_phase"])
+
+
+class TestFirstDivergence:
+    """Test member-by-member archive comparison"""
+
+    def test_identical(self, tmp_path):
+        members = [("a", b"A", 0o644), ("b", b"B", 0o644)]
+        assert repro_rebuild.first_divergence(_tgz(tmp_path / "1.tgz", members), _tgz(tmp_path / "2.tgz", members)) is None
+
+    def test_metadata_field(self, tmp_path):
+        a = _tgz(tmp_path / "1.tgz", [("a", b"A", 0o644), ("b", b"B", 0o644)])
+        b = _tgz(tmp_path / "2.tgz", [("a", b"A", 0o644), ("b", b"B", 0o600)])
+        assert repro_rebuild.first_divergence(a, b) == {"name": "b", "change": "metadata", "field": "mode", "a": "0o644", "b": "0o600"}
+
+    def test_content_offset(self, tmp_path):
+        a = _tgz(tmp_path / "1.tgz", [("a", b"x" * 70000 + b"1", 0o644)])
+        b = _tgz(tmp_path / "2.tgz", [("a", b"x" * 70000 + b"2", 0o644)])
+        div = repro_rebuild.first_divergence(a, b)
+        assert (div["change"], div["offset"]) == ("content", 70000)
+
+    def test_missing_member(self, tmp_path):
+        a = _tgz(tmp_path / "1.tgz", [("a", b"A", 0o644)])
+        b = _tgz(tmp_path / "2.tgz", [("a", b"A", 0o644), ("b", b"B", 0o644)])
+        assert repro_rebuild.first_divergence(a, b) == {"name": "b", "change": "added"}
+
+    def test_container_only(self, tmp_path):
+        members = [("a", b"A", 0o644)]
+        div = repro_rebuild.first_divergence(_tgz(tmp_path / "1.tgz", members), _tgz(tmp_path / "2.tgz", members, mtime=1))
+        assert (div["change"], div["offset"]) == ("archive", 4)
+
+
+class TestRebuild:
+    """End-to-end double build of this repository"""
+
+    def test_perturbed_rebuild_is_identical(self, tmp_path):
+        rep = repro_rebuild.rebuild(ROOT, workdir=str(tmp_path))
+        assert rep["ok"], rep
+        assert rep["mismatches"] == []
+        assert {b["label"] for b in rep["builds"]} == {"a", "b"}
+        assert not any(tmp_path.iterdir())
+
+    def test_tz_perturbation_changes_manifest(self, tmp_path):
+        rep = repro_rebuild.rebuild(ROOT, ["tz"], workdir=str(tmp_path))
+        assert not rep["ok"]
+        assert "manifest" in rep["mismatches"]
+        assert rep["divergence"]["name"] == "VEL_MANIFEST.json"
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
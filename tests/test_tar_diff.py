@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""Test suite for tools/tar_diff.py - streaming archive diff"""
+import io
+import tarfile
+import pytest
+from tools import tar_diff
+
+
+def _tar(path, members, mode="w:gz"):
+    """Write an archive of (name, data, mode) tuples; data None makes a directory."""
+    with tarfile.open(path, mode) as tf:
+        for name, data, perm in members:
+            ti = tarfile.TarInfo(name)
+            ti.mode = perm
+            if data is None:
+                ti.type = tarfile.DIRTYPE
+                tf.addfile(ti)
+            else:
+                ti.size = len(data)
+                tf.addfile(ti, io.BytesIO(data))
+    return str(path)
+
+
+BASE = [("d/", None, 0o755), ("d/a", b"alpha", 0o644), ("d/b", b"beta" * 1000, 0o644), ("z", b"zed", 0o644)]
+
+
+class TestDiffTars:
+    """Test the full report"""
+
+    def test_identical(self, tmp_path):
+        rep = tar_diff.diff_tars(_tar(tmp_path / "a.tgz", BASE), _tar(tmp_path / "b.tgz", BASE))
+        assert rep["identical"]
+        assert (rep["members_a"], rep["members_b"], rep["held"]) == (4, 4, 0)
+
+    def test_added_removed(self, tmp_path):
+        b = [m for m in BASE if m[0] != "d/a"] + [("y", b"new", 0o644)]
+        rep = tar_diff.diff_tars(_tar(tmp_path / "a.tgz", BASE), _tar(tmp_path / "b.tgz", sorted(b)))
+        assert rep["removed"] == ["d/a"] and rep["added"] == ["y"]
+        assert rep["metadata"] == [] and rep["content"] == []
+
+    def test_metadata_and_content(self, tmp_path):
+        b = list(BASE)
+        b[1] = ("d/a", b"alpha", 0o600)
+        b[2] = ("d/b", b"beta" * 500 + b"BETA" + b"beta" * 499, 0o644)
+        rep = tar_diff.diff_tars(_tar(tmp_path / "a.tgz", BASE), _tar(tmp_path / "b.tar", b, "w"))
+        assert rep["metadata"] == [{"name": "d/a", "field": "mode", "a": "0o644", "b": "0o600"}]
+        (c,) = rep["content"]
+        assert c["name"] == "d/b" and c["offset"] == 2000
+        assert c["sha256_a"] != c["sha256_b"]
+
+    def test_reordered_members_are_matched(self, tmp_path):
+        b = [BASE[0], BASE[2], BASE[1], ("z", b"zeD", 0o644)]
+        rep = tar_diff.diff_tars(_tar(tmp_path / "a.tgz", BASE), _tar(tmp_path / "b.tgz", b))
+        assert rep["added"] == [] and rep["removed"] == []
+        assert [c["name"] for c in rep["content"]] == ["z"]
+        assert rep["held"] == 2
+
+    def test_det_tar_order_holds_only_changes(self, tmp_path):
+        files = [(f"src/f{i:03d}", b"x%d" % i, 0o644) for i in range(200)]
+        a = [("src/", None, 0o755), ("src/a_top", b"t", 0o644), *files, ("src/sub/", None, 0o755), ("src/sub/z", b"z", 0o644)]
+        new = [(f"src/e{i:03d}", b"new", 0o644) for i in range(50)]
+        b = [a[0], *new, *files, *a[-2:]]  # a_top removed, 50 members shift the rest
+        rep = tar_diff.diff_tars(_tar(tmp_path / "a.tgz", a), _tar(tmp_path / "b.tgz", b))
+        assert rep["added"] == [m[0] for m in new] and rep["removed"] == ["src/a_top"]
+        assert rep["metadata"] == [] and rep["content"] == [] and rep["held"] == 51
+
+    def test_size_change_reports_offset(self, tmp_path):
+        b = [m if m[0] != "z" else ("z", b"zed!", 0o644) for m in BASE]
+        rep = tar_diff.diff_tars(_tar(tmp_path / "a.tgz", BASE), _tar(tmp_path / "b.tgz", b))
+        assert rep["metadata"] == [{"name": "z", "field": "size", "a": 3, "b": 4}]
+        assert rep["content"][0]["offset"] == 3
+
+
+class TestMain:
+    """Test the command line"""
+
+    def test_exit_codes(self, tmp_path, monkeypatch, capsys):
+        a, b = _tar(tmp_path / "a.tgz", BASE), _tar(tmp_path / "b.tgz", BASE[:-1])
+        out = tmp_path / "diff.json"
+        monkeypatch.setattr("sys.argv", ["tar_diff.py", a, b, "--out", str(out)])
+        with pytest.raises(SystemExit) as e:
+            tar_diff.main()
+        assert e.value.code == 1
+        assert "- z" in capsys.readouterr().out
+        assert out.exists()
+        monkeypatch.setattr("sys.argv", ["tar_diff.py", a, str(tmp_path / "missing.tgz")])
+        with pytest.raises(SystemExit) as e:
+            tar_diff.main()
+        assert e.value.code == 2
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
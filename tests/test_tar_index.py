@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""Test suite for tools/tar_index.py - random-access member index"""
+import json
+import random
+import tarfile
+import pytest
+from tools import metrics, tar_index
+from tools.det_tar import build_tar, create_deterministic_tar
+
+INTERVAL = 16 << 10
+
+
+@pytest.fixture
+def tree(tmp_path):
+    rng = random.Random(7)
+    src = tmp_path / "src"
+    for i in range(60):
+        d = src / f"d{i // 10}"
+        d.mkdir(parents=True, exist_ok=True)
+        # Text-like content so gzip has history to depend on across seek points.
+        words = [rng.choice(["alpha", "beta", "gamma", "delta", str(i)]) for _ in range(rng.randint(0, 2000))]
+        (d / f"f{i:02d}.txt").write_text(" ".join(words))
+    (src / "d0" / "link").symlink_to("f00.txt")
+    return src
+
+
+def _build(tree, out, compression="gzip"):
+    create_deterministic_tar(str(tree), str(out), compression, index=tar_index.index_path_for(out), index_interval=INTERVAL)
+    return tar_index.load_index(tar_index.index_path_for(out))
+
+
+class TestIndex:
+    """Sidecar contents"""
+
+    def test_offsets_match_tarfile(self, tree, tmp_path):
+        doc = _build(tree, tmp_path / "a.tar.gz")
+        with tarfile.open(tmp_path / "a.tar.gz") as tf:
+            members = tf.getmembers()
+        assert [m.name for m in members] == [r["name"].rstrip("/") for r in doc["members"]]
+        assert [(m.offset, m.offset_data) for m in members] == [(r["header_offset"], r["data_offset"]) for r in doc["members"]]
+        assert len(doc["seek_points"]) > 3 and doc["compression"] == "gzip"
+
+    def test_reproducible(self, tree, tmp_path):
+        _build(tree, tmp_path / "a.tar.gz"); _build(tree, tmp_path / "b.tar.gz")
+        assert (tmp_path / "a.tar.gz").read_bytes() == (tmp_path / "b.tar.gz").read_bytes()
+        ia, ib = (json.loads((tmp_path / n).read_text()) for n in ("a.tar.gz.index.json", "b.tar.gz.index.json"))
+        assert ia["members"] == ib["members"] and ia["seek_points"] == ib["seek_points"]
+
+    def test_build_tar_index(self, tmp_path):
+        a = tmp_path / "artifact.json"; a.write_text("{}")
+        m = tmp_path / "VEL_MANIFEST.json"; m.write_text('{"x":1}')
+        out = tmp_path / "artifact.tar.gz"
+        build_tar(str(out), [str(a), str(m)], index=tar_index.index_path_for(out))
+        assert tar_index.read_member(str(out), "VEL_MANIFEST.json") == b'{"x":1}'
+
+
+class TestRead:
+    """Random access and verification"""
+
+    @pytest.mark.parametrize("compression", ["gzip", "none", "xz"])
+    def test_every_member(self, tree, tmp_path, compression):
+        out = tmp_path / "a.tar"
+        doc = _build(tree, out, compression)
+        for p in sorted(tree.rglob("*.txt")):
+            assert tar_index.read_member(str(out), str(p.relative_to(tree)), doc) == p.read_bytes()
+        assert tar_index.verify_all(str(out), doc) == []
+
+    def test_inflate_is_bounded(self, tree, tmp_path):
+        out = tmp_path / "a.tar.gz"
+        doc = _build(tree, out)
+        last = [r for r in doc["members"] if r["type"] == "0"][-1]
+        metrics.reset()
+        tar_index.read_member(str(out), last["name"], doc)
+        inflated = metrics.snapshot()["counters"]["index_bytes_inflated_total"]
+        assert inflated < INTERVAL + last["size"] + (1 << 20)
+        assert inflated < last["data_offset"]
+
+    def test_detects_tampering(self, tree, tmp_path):
+        out = tmp_path / "a.tar.gz"
+        doc = _build(tree, out)
+        rec = next(r for r in doc["members"] if r["name"] == "d3/f35.txt")
+        rec["sha256"] = "0" * 64
+        assert not tar_index.verify_member(str(out), "d3/f35.txt", doc)
+        assert tar_index.verify_all(str(out), doc) == ["d3/f35.txt"]
+        with open(out, "ab") as f:
+            f.write(b"\0")
+        with pytest.raises(ValueError, match="does not match"):
+            tar_index.read_member(str(out), "d0/f00.txt", doc)
+
+    @pytest.mark.parametrize("compression", ["gzip", "none"])
+    def test_dedup_hardlinks(self, tree, tmp_path, compression):
+        for i in range(3):
+            (tree / "d5" / f"copy{i}.txt").write_bytes((tree / "d0" / "f01.txt").read_bytes())
+        out = tmp_path / "a.tar"
+        create_deterministic_tar(str(tree), str(out), compression, dedup=True, index=tar_index.index_path_for(out), index_interval=INTERVAL)
+        doc = tar_index.load_index(tar_index.index_path_for(out))
+        assert sum(r["type"] == "1" for r in doc["members"]) == 3
+        for p in sorted(tree.rglob("*.txt")):
+            assert tar_index.read_member(str(out), str(p.relative_to(tree)), doc) == p.read_bytes()
+        assert tar_index.extract_member(str(out), "d5/copy2.txt", str(tmp_path / "x"), doc) and (tmp_path / "x").read_bytes() == (tree / "d0" / "f01.txt").read_bytes()
+        assert tar_index.verify_all(str(out), doc) == []
+
+    def test_not_a_file(self, tree, tmp_path):
+        doc = _build(tree, tmp_path / "a.tar.gz")
+        with pytest.raises(ValueError, match="not a regular file"):
+            tar_index.read_member(str(tmp_path / "a.tar.gz"), "d0/link", doc)
+        with pytest.raises(KeyError):
+            tar_index.read_member(str(tmp_path / "a.tar.gz"), "nope", doc)
+
+
+class TestMain:
+    def test_extract_and_verify(self, tree, tmp_path, monkeypatch, capsys):
+        out = tmp_path / "a.tar.gz"
+        _build(tree, out)
+        dest = tmp_path / "x.txt"
+        monkeypatch.setattr("sys.argv", ["tar_index.py", str(out), "--extract", "d2/f21.txt", "-o", str(dest)])
+        tar_index.main()
+        assert dest.read_bytes() == (tree / "d2" / "f21.txt").read_bytes()
+        monkeypatch.setattr("sys.argv", ["tar_index.py", str(out), "--verify"])
+        with pytest.raises(SystemExit) as e:
+            tar_index.main()
+        assert e.value.code == 0 and "Verified 60/60" in capsys.readouterr().out
+
+    def test_missing_index(self, tmp_path, monkeypatch):
+        (tmp_path / "a.tar.gz").write_bytes(b"")
+        monkeypatch.setattr("sys.argv", ["tar_index.py", str(tmp_path / "a.tar.gz"), "--list"])
+        with pytest.raises(SystemExit) as e:
+            tar_index.main()
+        assert e.value.code == 2
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
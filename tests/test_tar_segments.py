@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""Test suite for tools/tar_segments.py - incremental segmented .tar.gz builds"""
+import gzip
+import json
+import tarfile
+import pytest
+from tools import tar_segments
+from tools.det_tar import create_deterministic_tar
+
+
+@pytest.fixture
+def tree(tmp_path):
+    src = tmp_path / "src"
+    for i in range(200):
+        d = src / f"pkg{i // 50}"
+        d.mkdir(parents=True, exist_ok=True)
+        (d / f"m{i:03d}.py").write_text(f"# module {i}\n" + "x = 1\n" * (i % 40))
+    (src / "big.bin").write_bytes(bytes(range(256)) * ((tar_segments.SOLO_MIN >> 8) + 1))
+    return src
+
+
+def _segments(out):
+    return json.loads((out.parent / (out.name + ".segments.json")).read_text())["segments"]
+
+
+class TestIncremental:
+    def test_valid_archive(self, tree, tmp_path):
+        out = tmp_path / "a.tar.gz"
+        stats = create_deterministic_tar(str(tree), str(out), incremental=True)
+        assert stats["reused"] == 0 and stats["segments"] > 3
+        with tarfile.open(out) as tf:
+            assert tf.extractfile("pkg1/m060.py").read() == (tree / "pkg1" / "m060.py").read_bytes()
+            assert len(tf.getmembers()) == stats["members"]
+        # One gzip member per segment plus the end-of-archive member.
+        assert out.read_bytes().count(b"\x1f\x8b\x08\x00\x00\x00\x00\x00") >= stats["segments"]
+
+    def test_rebuild_reuses_and_matches_clean_build(self, tree, tmp_path):
+        out = tmp_path / "a.tar.gz"
+        create_deterministic_tar(str(tree), str(out), incremental=True)
+        (tree / "pkg2" / "m120.py").write_text("changed\n")
+        stats = create_deterministic_tar(str(tree), str(out), incremental=True)
+        assert stats["compressed"] == 1 and stats["reused"] == stats["segments"] - 2
+        clean = tmp_path / "clean.tar.gz"
+        create_deterministic_tar(str(tree), str(clean), incremental=True, previous="")
+        assert out.read_bytes() == clean.read_bytes()
+        assert _segments(out) == _segments(clean)
+        assert gzip.decompress(out.read_bytes()) == gzip.decompress(clean.read_bytes())
+
+    def test_tampered_previous_is_not_copied(self, tree, tmp_path):
+        out = tmp_path / "a.tar.gz"
+        create_deterministic_tar(str(tree), str(out), incremental=True)
+        good = out.read_bytes()
+        seg = _segments(out)[1]
+        data = bytearray(good); data[seg["offset"] + 20] ^= 0xFF
+        out.write_bytes(bytes(data))
+        stats = create_deterministic_tar(str(tree), str(out), incremental=True)
+        assert stats["compressed"] == 1
+        assert out.read_bytes() == good
+
+    def test_rejects_other_compression(self, tree, tmp_path):
+        with pytest.raises(ValueError):
+            create_deterministic_tar(str(tree), str(tmp_path / "a.tar.xz"), incremental=True)
+
+
+def test_boundaries_follow_names_not_content():
+    from tools.tar_writer import REGTYPE, TarEntry
+    entries = [TarEntry(f"f{i}", None, REGTYPE, 0o644, i) for i in range(500)]
+    runs = [[e.name for e in r] for r in tar_segments.segment(entries)]
+    for e in entries:
+        e.size += 7
+    assert runs == [[e.name for e in r] for r in tar_segments.segment(entries)]
+    assert 5 < len(runs) < 100
@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""Test suite for tools/tar_writer.py - raw ustar/PAX headers must match tarfile"""
+import io
+import os
+import tarfile
+import pytest
+from tools import io_utils, tar_writer
+from tools.det_tar import build_tar, create_deterministic_tar
+
+
+def _tarfile_header(name, mode, size=0, type=tarfile.REGTYPE, linkname=""):
+    ti = tarfile.TarInfo(name)
+    ti.mode, ti.size, ti.type, ti.linkname = mode, size, type, linkname
+    ti.uid = ti.gid = ti.mtime = 0
+    ti.uname = ti.gname = "root"
+    return ti.tobuf(tarfile.PAX_FORMAT, tarfile.ENCODING, "surrogateescape")
+
+
+class TestHeader:
+    """header() against TarInfo.tobuf for the cases that switch to PAX"""
+
+    @pytest.mark.parametrize("name,mode,size,type,linkname", [
+        ("a.txt", 0o644, 5, tarfile.REGTYPE, ""),
+        ("dir/", 0o644, 0, tarfile.DIRTYPE, ""),
+        ("x" * 100, 0o755, 1, tarfile.REGTYPE, ""),
+        ("d/" + "y" * 150, 0o644, 0, tarfile.REGTYPE, ""),
+        ("café/naïve.txt", 0o644, 3, tarfile.REGTYPE, ""),
+        ("huge.bin", 0o644, 9 << 30, tarfile.REGTYPE, ""),
+        ("link", 0o777, 0, tarfile.SYMTYPE, "t/" * 80),
+        ("hard", 0o644, 0, tarfile.LNKTYPE, "a.txt"),
+        ("bad\udcff", 0o644, 0, tarfile.REGTYPE, ""),
+        ("fifo", 0o600, 0, tarfile.FIFOTYPE, ""),
+    ])
+    def test_matches_tarfile(self, name, mode, size, type, linkname):
+        assert tar_writer.header(name, mode, size, type, linkname) == _tarfile_header(name, mode, size, type, linkname)
+
+
+class TestTarWriter:
+    """Whole archives"""
+
+    def test_readable_and_padded(self, tmp_path):
+        big = tmp_path / "big"; big.write_bytes(os.urandom((1 << 20) + 7))
+        small = tmp_path / "small"; small.write_bytes(b"hi")
+        buf = io.BytesIO()
+        tw = tar_writer.TarWriter(buf)
+        tw.add(tar_writer.TarEntry("d/", None, tar_writer.DIRTYPE, 0o644))
+        tw.add(tar_writer.TarEntry("d/small", str(small), tar_writer.REGTYPE, 0o644, 2))
+        tw.add(tar_writer.TarEntry("d/big", str(big), tar_writer.REGTYPE, 0o644, big.stat().st_size))
+        tw.close()
+        assert len(buf.getvalue()) % tar_writer.RECORDSIZE == 0 and tw.offset == len(buf.getvalue())
+        buf.seek(0)
+        with tarfile.open(fileobj=buf) as tf:
+            assert tf.getnames() == ["d", "d/small", "d/big"]
+            assert tf.extractfile("d/big").read() == big.read_bytes()
+
+    def test_short_file_raises(self, tmp_path):
+        f = tmp_path / "f"; f.write_bytes(b"abc")
+        tw = tar_writer.TarWriter(io.BytesIO())
+        with pytest.raises(OSError, match="unexpected end of data"):
+            tw.add(tar_writer.TarEntry("f", str(f), tar_writer.REGTYPE, 0o644, 10))
+
+
+def _tree(root):
+    (root / "sub" / "deep").mkdir(parents=True)
+    (root / "A.txt").write_text("alpha\n")
+    (root / "run.sh").write_text("#!/bin/sh\n"); (root / "run.sh").chmod(0o700)
+    (root / "sub" / ("long-" * 30 + ".txt")).write_text("long name\n")
+    (root / "sub" / "über.txt").write_text("unicode\n")
+    (root / "sub" / "deep" / "copy.txt").write_text("alpha\n")
+    (root / "sub" / "skip.pyc").write_bytes(b"\0")
+    (root / "sub" / "__pycache__").mkdir()
+    os.symlink("A.txt", root / "sub" / "to_a")
+    os.link(root / "A.txt", root / "sub" / "hard.txt")
+    return root
+
+
+@pytest.mark.parametrize("dedup,compression", [(False, "gzip"), (True, "gzip"), (False, "none")])
+def test_det_tar_matches_tarfile_reference(tmp_path, monkeypatch, dedup, compression):
+    """The raw writer and REPRO_TAR_WRITER=tarfile produce byte-identical archives."""
+    src = _tree(tmp_path / "src")
+    (src / "sub" / "big.bin").write_bytes(os.urandom(300 << 10))
+    raw = create_deterministic_tar(str(src), str(tmp_path / "raw.tar.gz"), compression, dedup=dedup)
+    monkeypatch.setenv("REPRO_TAR_WRITER", "tarfile")
+    ref = create_deterministic_tar(str(src), str(tmp_path / "ref.tar.gz"), compression, dedup=dedup)
+    assert raw == ref
+    assert (tmp_path / "raw.tar.gz").read_bytes() == (tmp_path / "ref.tar.gz").read_bytes()
+
+
+def test_build_tar_matches_tarfile(tmp_path):
+    a = tmp_path / "a.txt"; a.write_text("a")
+    b = tmp_path / "b.sh"; b.write_text("b"); b.chmod(0o750)
+    build_tar(str(tmp_path / "out.tar"), [str(b), str(a), str(tmp_path / "missing")])
+    buf = io.BytesIO()
+    with tarfile.open(fileobj=buf, mode="w") as tf:
+        for p in (a, b):
+            ti = tf.gettarinfo(str(p), p.name)
+            ti.uid = ti.gid = ti.mtime = 0; ti.uname = ti.gname = "root"
+            ti.mode = 0o755 if ti.mode & 0o111 else 0o644
+            with open(p, "rb") as f:
+                tf.addfile(ti, f)
+    assert (tmp_path / "out.tar").read_bytes() == buf.getvalue()
+
+
+@pytest.mark.parametrize("workers,cap", [("0", 64 << 20), ("3", 16)])
+def test_det_tar_independent_of_prefetch(tmp_path, monkeypatch, workers, cap):
+    """Read-ahead on, off, or with a budget smaller than most files gives the same archive."""
+    src = _tree(tmp_path / "src")
+    create_deterministic_tar(str(src), str(tmp_path / "base.tar"))
+    monkeypatch.setenv("REPRO_PREFETCH_WORKERS", workers)
+    monkeypatch.setattr(io_utils, "PREFETCH_BYTES", cap)
+    create_deterministic_tar(str(src), str(tmp_path / "other.tar"))
+    assert (tmp_path / "base.tar").read_bytes() == (tmp_path / "other.tar").read_bytes()
+
+
+class TestZeroCopy:
+    """Kernel copy for uncompressed output, and its fallbacks"""
+
+    def _inputs(self, tmp_path):
+        files = []
+        for i, n in enumerate([10, (256 << 10) + 3, 5 << 20, 0]):
+            p = tmp_path / f"in{i}.bin"; p.write_bytes(os.urandom(n)); files.append(str(p))
+        return files
+
+    def _reference(self, files):
+        buf = io.BytesIO()
+        with tarfile.open(fileobj=buf, mode="w") as tf:
+            for f in sorted(files, key=os.path.basename):
+                ti = tf.gettarinfo(f, os.path.basename(f))
+                ti.uid = ti.gid = ti.mtime = 0; ti.uname = ti.gname = "root"
+                ti.mode = 0o755 if ti.mode & 0o111 else 0o644
+                with open(f, "rb") as fh:
+                    tf.addfile(ti, fh)
+        return buf.getvalue()
+
+    @pytest.mark.parametrize("broken", [(), ("copy_file_range",), ("copy_file_range", "sendfile")])
+    def test_same_bytes_with_and_without_kernel_copy(self, tmp_path, monkeypatch, broken):
+        import errno
+        from tools import compress
+        monkeypatch.setattr(compress, "_NO_KERNEL_COPY", set())
+
+        def unsupported(*a):
+            raise OSError(errno.EXDEV, "cross-device")
+        for name in broken:
+            monkeypatch.setattr(os, name, unsupported, raising=False)
+        files = self._inputs(tmp_path)
+        build_tar(str(tmp_path / "out.tar"), files)
+        assert (tmp_path / "out.tar").read_bytes() == self._reference(files)
+        assert set(broken) <= compress._NO_KERNEL_COPY
+
+    def test_partial_kernel_copy_is_completed(self, tmp_path, monkeypatch):
+        from tools import compress
+        real = os.copy_file_range
+        monkeypatch.setattr(compress, "_NO_KERNEL_COPY", {"sendfile"})
+        # Stop after the first 100000 bytes, as a copy that hits a quota or signal would.
+        monkeypatch.setattr(os, "copy_file_range", lambda i, o, n: real(i, o, min(n, 100000)) if os.lseek(i, 0, os.SEEK_CUR) == 0 else 0)
+        files = self._inputs(tmp_path)
+        build_tar(str(tmp_path / "out.tar"), files)
+        assert (tmp_path / "out.tar").read_bytes() == self._reference(files)
+
+    def test_compressed_output_has_no_kernel_copy(self, tmp_path):
+        from tools.compress import open_writer
+        with open_writer(tmp_path / "x.tar.gz") as gz, open_writer(tmp_path / "x.tar", "none") as plain:
+            assert not tar_writer.TarWriter(gz).zero_copy
+            assert tar_writer.TarWriter(plain).zero_copy
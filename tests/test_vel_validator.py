@@ -6,11 +6,22 @@ import tempfile
 import pathlib
 import subprocess
 from unittest.mock import patch, MagicMock
+from tools import metrics, vel_validator
 from tools.vel_validator import (
     read_json, validate_schema_builtin, validate_schema_jsonschema,
-    check_git_sha_exists_locally, check_artifact_sha
+    check_git_sha_exists_locally, check_artifact_sha, load_batch, validate_batch
 )
 
+SCHEMA = str(pathlib.Path(__file__).resolve().parents[1] / "schema" / "vel_manifest.schema.json")
+
+
+def _manifest(artifact_sha):
+    return {
+        "provenance": {"git_sha": "a" * 40, "artifact_sha256": artifact_sha},
+        "environment": {"python_version": "3.11.9", "system_locale": "C.UTF-8", "decimal_context": "prec=28"},
+        "results_contract": {"canonical_ratio": "1/1", "rounding_precision": 6}
+    }
+
 
 class TestReadJson:
     """Test JSON file reading"""
@@ -118,28 +129,33 @@ class TestValidateSchemaJsonschema:
 class TestCheckGitShaExistsLocally:
     """Test git commit verification"""
     
-    @patch('subprocess.check_call')
-    def test_commit_exists(self, mock_check_call):
+    @pytest.fixture
+    def repo(self, tmp_path, monkeypatch):
+        subprocess.run(["git", "init", "-q", str(tmp_path)], check=True)
+        (tmp_path / "f.txt").write_text("x")
+        git = ["git", "-C", str(tmp_path), "-c", "user.name=t", "-c", "user.email=t@example.com"]
+        subprocess.run(git + ["add", "f.txt"], check=True)
+        subprocess.run(git + ["commit", "-q", "-m", "init"], check=True)
+        monkeypatch.chdir(tmp_path)
+        return subprocess.check_output(["git", "-C", str(tmp_path), "rev-parse", "HEAD"], text=True).strip()
+    
+    def test_commit_exists(self, repo):
         """Should return True when git commit exists"""
-        mock_check_call.return_value = None
-        exists, reason = check_git_sha_exists_locally("abc123")
+        exists, reason = check_git_sha_exists_locally(repo)
         assert exists is True
         assert reason == "present"
-        mock_check_call.assert_called_once()
     
-    @patch('subprocess.check_call')
-    def test_commit_not_found(self, mock_check_call):
+    def test_commit_not_found(self, repo):
         """Should return False when git commit not found"""
-        mock_check_call.side_effect = subprocess.CalledProcessError(1, 'git')
-        exists, reason = check_git_sha_exists_locally("missing123")
+        exists, reason = check_git_sha_exists_locally("0" * 40)
         assert exists is False
         assert reason == "not_found"
     
-    @patch('subprocess.check_call')
-    def test_git_not_installed(self, mock_check_call):
+    def test_git_not_installed(self, tmp_path, monkeypatch):
         """Should return False when git command missing"""
-        mock_check_call.side_effect = FileNotFoundError()
-        exists, reason = check_git_sha_exists_locally("abc123")
+        monkeypatch.chdir(tmp_path)
+        with patch("subprocess.Popen", side_effect=FileNotFoundError()):
+            exists, reason = check_git_sha_exists_locally("abc123")
         assert exists is False
         assert reason == "git_missing"
 
@@ -186,6 +202,105 @@ class TestCheckArtifactSha:
         assert "failed to hash artifact" in captured.err
 
 
+class TestCompiledSchema:
+    """Compiled, cached JSON Schema validators"""
+
+    def test_compiled_once_per_schema(self, tmp_path, monkeypatch):
+        """Should check the schema once and reuse the validator until the schema changes"""
+        monkeypatch.setattr(vel_validator, "_validators", {})
+        schema_file = tmp_path / "schema.json"
+        schema_file.write_text(json.dumps({"type": "object", "required": ["name"]}))
+        metrics.reset()
+        assert validate_schema_jsonschema({"name": "x"}, str(schema_file)) is True
+        assert validate_schema_jsonschema({}, str(schema_file)) is False
+        cache = metrics.snapshot()["cache"]["schema_validator"]
+        assert (cache["hits"], cache["misses"]) == (1, 1)
+        schema_file.write_text(json.dumps({"type": "object", "required": ["other"]}))
+        assert validate_schema_jsonschema({"name": "x"}, str(schema_file)) is False
+
+    def test_disk_marker_skips_metaschema_check(self, tmp_path, monkeypatch):
+        """Should skip check_schema in a fresh process once the schema has been checked"""
+        monkeypatch.setattr(vel_validator, "_validators", {})
+        vel_validator.schema_validator(SCHEMA)
+        monkeypatch.setattr(vel_validator, "_validators", {})
+        import jsonschema
+        cls = jsonschema.validators.validator_for(json.loads(pathlib.Path(SCHEMA).read_text()))
+        with patch.object(cls, "check_schema", side_effect=AssertionError("checked again")):
+            assert vel_validator.schema_errors(_manifest("0" * 64), SCHEMA) == []
+
+    def test_invalid_schema_rejected(self, tmp_path, capsys):
+        """Should fail on a schema that is itself invalid"""
+        schema_file = tmp_path / "bad.json"
+        schema_file.write_text(json.dumps({"type": 12}))
+        assert validate_schema_jsonschema({}, str(schema_file)) is False
+        assert "validation failed" in capsys.readouterr().err
+
+
+class TestBatch:
+    """Batch manifest validation"""
+
+    @pytest.fixture
+    def batch(self, tmp_path):
+        import hashlib
+        artifact = tmp_path / "artifact.tar.gz"
+        artifact.write_bytes(b"artifact content")
+        good = _manifest(hashlib.sha256(b"artifact content").hexdigest())
+        rows = []
+        for i in range(12):
+            doc = dict(good)
+            if i == 4:
+                doc = {**good, "provenance": {**good["provenance"], "artifact_sha256": "0" * 64}}
+            if i == 7:
+                doc = {**good, "results_contract": {"canonical_ratio": 1}}
+            (tmp_path / f"m{i:02d}.json").write_text(json.dumps(doc))
+            rows.append({"manifest": f"m{i:02d}.json", "artifact": "artifact.tar.gz"})
+        path = tmp_path / "batch.jsonl"
+        path.write_text("\n".join(json.dumps(r) for r in rows) + "\n")
+        return path
+
+    @pytest.mark.parametrize("workers", [1, 3])
+    def test_report_in_input_order(self, batch, workers):
+        """Should validate every manifest and report failures in input order"""
+        items = load_batch(str(batch))
+        with patch.object(vel_validator, "check_git_sha_exists_locally", return_value=(False, "not_found")) as git:
+            rep = validate_batch(items, SCHEMA, workers=workers)
+        git.assert_called_once()
+        assert [pathlib.Path(r["manifest"]).name for r in rep["manifests"]] == [f"m{i:02d}.json" for i in range(12)]
+        assert [pathlib.Path(m).name for m in rep["failed"]] == ["m04.json", "m07.json"]
+        assert rep["manifests"][4]["errors"] == ["artifact sha256 mismatch"]
+        assert rep["manifests"][7]["errors"][0].startswith("schema: ")
+        assert rep["ok"] is False and rep["count"] == 12 and rep["manifests"][0]["git"] == "not_found"
+
+    def test_strict_git(self, batch):
+        """Should fail manifests whose commit git cannot confirm under strict_git"""
+        items = load_batch(str(batch))[:2]
+        with patch.object(vel_validator, "check_git_sha_exists_locally", return_value=(False, "not_found")):
+            assert validate_batch(items, SCHEMA, workers=1)["ok"] is True
+            assert validate_batch(items, SCHEMA, workers=1, strict_git=True)["ok"] is False
+
+    def test_non_object_manifest_is_reported(self, batch, tmp_path, monkeypatch):
+        """Should report a manifest that is valid JSON but not an object, not crash the batch"""
+        (tmp_path / "m03.json").write_text("[]")
+        out = tmp_path / "vel_check.json"
+        monkeypatch.setattr("sys.argv", ["vel_validator.py", "--schema", SCHEMA, "--batch", str(batch),
+                                         "--workers", "1", "--out", str(out)])
+        with pytest.raises(SystemExit) as e:
+            vel_validator.main()
+        rep = json.loads(out.read_text())
+        assert e.value.code == 2 and rep["manifests"][3]["errors"] == ["read: not a JSON object"]
+        assert [pathlib.Path(m).name for m in rep["failed"]] == ["m03.json", "m04.json", "m07.json"]
+
+    def test_main_batch(self, batch, tmp_path, monkeypatch):
+        """Should write the consolidated report and exit 2 on failures"""
+        out = tmp_path / "vel_check.json"
+        monkeypatch.setattr("sys.argv", ["vel_validator.py", "--schema", SCHEMA, "--batch", str(batch),
+                                         "--workers", "1", "--out", str(out)])
+        with pytest.raises(SystemExit) as e:
+            vel_validator.main()
+        assert e.value.code == 2
+        assert json.loads(out.read_text())["count"] == 12
+
+
 class TestIntegrationValidation:
     """Integration tests for complete validation workflow"""
     
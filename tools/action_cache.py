@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+"""Action cache: skip a build step whose inputs have not changed and restore its outputs instead.
+
+A step (`make build`, `make tar`, `make rbom`) is described by what it reads: files,
+config.yml values, environment variables, optionally the git HEAD, plus every
+tools/*.py source, the Python version and the command line itself. Those are
+fingerprinted (io_utils.fingerprint_path with SHA-256 on every host, memoized per
+process) into an action key.
+After a successful run the outputs go into a content-addressed store, keyed by
+SHA-256, and an action record maps the key to them. The next run with the same key
+copies the outputs back, checking every blob's SHA-256 on the way out, and does not
+run the command. Outputs are only ever written to the step's declared --output paths,
+with mode 0644 or 0755; a record listing other paths is a miss.
+
+Stores are tools/cas.py stores: REPRO_ACTION_STORE, default <cache_dir>/actions.
+REPRO_ACTION_SHARED names a second one shared by CI runners, either a directory or
+the URL of a `cas.py serve` server. It is consulted after the local store, and hits
+from it are copied into the local one. REPRO_CAS_MAX_BYTES bounds a directory store
+(least recently used blobs are evicted).
+
+REPRO_ACTION_CACHE=off always runs the step. REPRO_ACTION_CACHE=strict (or --strict)
+runs the step even on a hit, for audits, and fails if the outputs differ from the
+cached ones.
+
+    python tools/action_cache.py --name tar --input field/timeline/latest.json \\
+        --config paths.tarball_base --output out/artifact.tar.gz -- python -I tools/det_tar.py
+"""
+from __future__ import annotations
+
+import argparse
+import glob
+import hashlib
+import json
+import os
+import pathlib
+import platform
+import subprocess
+import sys
+from typing import List, Optional, Sequence
+
+if __package__ in (None, ""): sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[1]))
+from tools import git_info, metrics, profiling
+from tools.cas import Store, open_store
+from tools.io_utils import cache_dir, fingerprint_path, sha256_path
+
+__all__ = ["Action", "action_key", "default_stores", "run_action"]
+
+ROOT = pathlib.Path(__file__).resolve().parents[1]
+KEY_VERSION = 2
+
+
+class Action:
+    """What a build step reads and writes, and the command that does it."""
+
+    def __init__(self, name: str, argv: Sequence[str], inputs: Sequence[str] = (), outputs: Sequence[str] = (),
+                 config: Sequence[str] = (), env: Sequence[str] = (), git_head: bool = False) -> None:
+        self.name = name
+        self.argv = list(argv)
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+        self.config = list(config)
+        self.env = list(env)
+        self.git_head = git_head
+
+
+def _input_files(patterns: Sequence[str]) -> List[str]:
+    """Files named by each input: a file, every file under a directory, or a (recursive) glob."""
+    out = set()
+    for pat in patterns:
+        if os.path.isdir(pat):
+            out.update(str(p) for p in pathlib.Path(pat).rglob("*") if p.is_file())
+        elif glob.has_magic(pat):
+            out.update(p for p in glob.glob(pat, recursive=True) if os.path.isfile(p))
+        else:
+            out.add(pat)  # a missing file is part of the key too
+    return sorted(out)
+
+
+def _config_value(dotted: str) -> object:
+    from tools.config import CONFIG
+    cur: object = CONFIG
+    for part in dotted.split("."):
+        cur = cur.get(part) if isinstance(cur, dict) else None
+    return cur
+
+
+def action_key(action: Action) -> str:
+    """SHA-256 over everything the step reads; equal keys mean the step would produce the same outputs."""
+    # One fixed algorithm, so every runner sharing a store computes the same key.
+    inputs = {p: fingerprint_path(p, backend="sha256") if os.path.isfile(p) else None for p in _input_files(action.inputs)}
+    tools = {p.name: fingerprint_path(p, backend="sha256") for p in sorted((ROOT / "tools").glob("*.py"))}
+    doc = {
+        "v": KEY_VERSION,
+        "name": action.name,
+        "argv": action.argv,
+        "inputs": inputs,
+        "outputs": action.outputs,
+        "config": {k: _config_value(k) for k in action.config},
+        "env": {k: os.environ.get(k) for k in action.env},
+        "git_head": git_info.get().rev_parse("HEAD") if action.git_head else None,
+        "tools": tools,
+        "python": [platform.python_implementation(), platform.python_version()],
+    }
+    return hashlib.sha256(json.dumps(doc, sort_keys=True, separators=(",", ":")).encode("utf-8")).hexdigest()
+
+
+def default_stores() -> List[Store]:
+    local = os.environ.get("REPRO_ACTION_STORE") or cache_dir("actions")
+    shared = os.environ.get("REPRO_ACTION_SHARED")
+    return [open_store(str(s)) for s in (local, shared) if s]
+
+
+def _get_record(store: Store, key: str, action: Action) -> Optional[dict]:
+    """The record for `key`, or None if there is none or it does not list exactly `action`'s outputs."""
+    try:
+        data = store.get_ref(key)
+        record = json.loads(data) if data is not None else None
+        if record is None or [o["path"] for o in record["outputs"]] != action.outputs:
+            return None
+        return record
+    except (OSError, ValueError, LookupError, TypeError):
+        return None
+
+
+def _put_record(store: Store, key: str, record: dict) -> None:
+    store.put_ref(key, json.dumps(record, sort_keys=True, separators=(",", ":")).encode("utf-8"))
+
+
+def _save(store: Store, key: str, record: dict) -> None:
+    """Store `record` and its outputs; an unreachable or failing store is a warning, since the step itself succeeded."""
+    try:
+        for o in record["outputs"]:
+            store.put_file(o["path"], o["sha256"])
+        _put_record(store, key, record)
+        if store.max_bytes is not None:
+            store.gc()
+    except OSError as e:
+        print(f"WARN: could not save action {record['name']} to {store!r}: {e}", file=sys.stderr)
+
+
+def _outputs_record(action: Action, key: str) -> dict:
+    outs = []
+    for p in action.outputs:
+        if not os.path.isfile(p):
+            raise FileNotFoundError(f"declared output was not produced: {p}")
+        outs.append({"path": p, "sha256": sha256_path(p), "size": os.path.getsize(p), "mode": os.stat(p).st_mode & 0o777})
+    return {"key": key, "name": action.name, "outputs": outs}
+
+
+def _file_mode(mode: object) -> int:
+    """0755 for a recorded executable, else 0644: a record never sets other permission bits."""
+    return 0o755 if isinstance(mode, int) and mode & 0o111 else 0o644
+
+
+def _restore(record: dict, store: Store) -> bool:
+    """Fetch every output of `record`; False if one is missing or fails its SHA-256 check."""
+    try:
+        if not all(store.has(o["sha256"]) for o in record["outputs"]):
+            return False
+        return all(store.get_file(o["sha256"], o["path"], _file_mode(o.get("mode"))) for o in record["outputs"])
+    except (OSError, ValueError):
+        return False
+
+
+def _lookup(key: str, action: Action, stores: Sequence[Store]) -> Optional[dict]:
+    """Restore the outputs recorded for `key` from the first store that has all of them; copies shared hits locally."""
+    for i, store in enumerate(stores):
+        record = _get_record(store, key, action)
+        if record is None or not _restore(record, store):
+            continue
+        for local in stores[:i]:
+            _save(local, key, record)
+        return record
+    return None
+
+
+def run_action(action: Action, mode: Optional[str] = None, stores: Optional[Sequence[Store]] = None) -> dict:
+    """
+    Run or restore one step. mode: "on" (default), "off" or "strict" (REPRO_ACTION_CACHE).
+        {"name", "key", "status": "hit" | "miss" | "off" | "verified" | "mismatch" | "failed", "returncode", "outputs", "mismatched"}
+    """
+    mode = mode or os.environ.get("REPRO_ACTION_CACHE", "on")
+    if mode not in ("on", "off", "strict"):
+        raise ValueError(f"unknown action cache mode {mode!r}")
+    stores = default_stores() if stores is None else list(stores)
+    rep = {"name": action.name, "key": None, "status": "off", "returncode": 0, "outputs": [], "mismatched": []}
+    if mode == "off" or not stores:
+        rep["returncode"] = subprocess.run(action.argv).returncode
+        rep["status"] = "off" if rep["returncode"] == 0 else "failed"
+        return rep
+    with metrics.phase("action_key"):
+        key = rep["key"] = action_key(action)
+    cached = None
+    if mode == "strict":  # "on" only needs the record _lookup fetches; a shared store costs a round trip per fetch
+        for store in stores:
+            cached = _get_record(store, key, action)
+            if cached is not None:
+                break
+    if mode == "on":
+        with metrics.phase("action_restore"):
+            hit = _lookup(key, action, stores)
+        metrics.cache("action", hit is not None)
+        if hit is not None:
+            rep.update(status="hit", outputs=[o["path"] for o in hit["outputs"]])
+            return rep
+    with metrics.phase("action_run"):
+        rep["returncode"] = subprocess.run(action.argv).returncode
+    if rep["returncode"] != 0:
+        rep["status"] = "failed"
+        return rep
+    record = _outputs_record(action, key)
+    rep["outputs"] = [o["path"] for o in record["outputs"]]
+    if mode == "strict" and cached is not None:
+        want = {o["path"]: o["sha256"] for o in cached["outputs"]}
+        rep["mismatched"] = [o["path"] for o in record["outputs"] if want.get(o["path"]) != o["sha256"]]
+        rep["status"] = "mismatch" if rep["mismatched"] else "verified"
+        return rep
+    for store in stores:
+        _save(store, key, record)
+    rep["status"] = "miss"
+    return rep
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Run a build step, or restore its outputs if nothing it reads has changed")
+    ap.add_argument("--name", required=True, help="Step name (part of the key)")
+    ap.add_argument("--input", action="append", default=[], metavar="PATH", help="File, directory or glob the step reads; repeatable")
+    ap.add_argument("--output", action="append", default=[], metavar="PATH", help="File the step writes; repeatable")
+    ap.add_argument("--config", action="append", default=[], metavar="KEY", help="Dotted config.yml key the step uses (e.g. paths.artifact)")
+    ap.add_argument("--env", action="append", default=[], metavar="NAME", help="Environment variable the step uses; repeatable")
+    ap.add_argument("--git-head", action="store_true", help="The step records the git HEAD commit")
+    ap.add_argument("--strict", action="store_true", help="Rerun even on a hit and fail if outputs differ (REPRO_ACTION_CACHE=strict)")
+    ap.add_argument("--out", help="Write the JSON report here")
+    ap.add_argument("command", nargs=argparse.REMAINDER, help="-- command ...")
+    args = ap.parse_args()
+    argv = args.command[1:] if args.command[:1] == ["--"] else args.command
+    if not argv:
+        ap.error("no command given (put it after --)")
+    action = Action(args.name, argv, args.input, args.output, args.config, args.env, args.git_head)
+    try:
+        rep = run_action(action, "strict" if args.strict else None)
+    except OSError as e:
+        print(f"ERROR: {e}", file=sys.stderr)
+        sys.exit(2)
+    if args.out:
+        pathlib.Path(args.out).write_text(json.dumps(rep, sort_keys=True, separators=(",", ":")), encoding="utf-8")
+    if rep["status"] == "failed":
+        sys.exit(rep["returncode"] or 1)
+    if rep["status"] == "mismatch":
+        print(f"action {action.name}: outputs differ from the cached build: {', '.join(rep['mismatched'])}", file=sys.stderr)
+        sys.exit(2)
+    print(f"action {action.name}: {rep['status']}" + (f" ({len(rep['outputs'])} outputs restored)" if rep["status"] == "hit" else ""))
+
+
+if __name__ == "__main__":
+    profiling.run(main)
@@ -0,0 +1,463 @@
+#!/usr/bin/env python3
+"""Content-addressed blob store keyed by SHA-256, on a local directory or a shared HTTP server.
+
+Blobs are stored under their SHA-256 and checked against it on every fetch, so a
+corrupt or truncated copy is never handed back. Small named records (refs, e.g.
+action_cache's action records) live next to the blobs. Two backends share the
+interface:
+
+  DirBackend    <root>/cas/<sha[:2]>/<sha> and <root>/ac/<name>; atomic writes, so
+                concurrent runners can share a directory (NFS, a mounted volume)
+  HttpBackend   the same layout over HTTP: HEAD/GET/PUT /cas/<sha> and GET/PUT /ac/<name>;
+                `python tools/cas.py serve --root DIR` is a stand-in server for it,
+                refusing any blob whose body does not hash to its name
+
+open_store(spec) picks one from a path or an http(s):// URL. put_many()/get_many()
+move many blobs on a thread pool. A directory store with max_bytes
+(REPRO_CAS_MAX_BYTES, e.g. 20G) evicts least recently used blobs (fetches
+refresh the mtime) once it grows past the bound.
+
+The server is meant for a trusted network. With a token (serve --token or
+REPRO_CAS_TOKEN) every PUT must carry `Authorization: Bearer <token>`, which
+HttpBackend sends from REPRO_CAS_TOKEN; reads stay open. serve refuses to listen
+beyond loopback without one, since anyone who can write action records decides
+what other runners restore.
+
+    store = cas.open_store("http://cas.internal:8750")
+    shas = cas.put_many(store, ["out/artifact.tar.gz", "VEL_MANIFEST.json"])
+    cas.get_many(store, {shas["out/artifact.tar.gz"]: "restored.tar.gz"})
+"""
+from __future__ import annotations
+
+import argparse
+import hashlib
+import hmac
+import json
+import os
+import pathlib
+import re
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import BinaryIO, Dict, Iterable, List, Optional, Tuple, Union
+
+if __package__ in (None, ""): sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[1]))
+from tools import metrics, profiling
+from tools.io_utils import sha256_path, verify_workers
+
+__all__ = ["IntegrityError", "DirBackend", "HttpBackend", "open_store", "put_many", "get_many", "parse_size", "serve"]
+
+_CHUNK = 1 << 20
+_NAME = re.compile(r"^[0-9a-f]{64}$")
+_MAX_REF_BYTES = 1 << 20  # refs are small JSON records (action_cache writes a few hundred bytes)
+_SIZE_SUFFIX = {"": 1, "K": 1 << 10, "M": 1 << 20, "G": 1 << 30, "T": 1 << 40}
+Store = Union["DirBackend", "HttpBackend"]
+
+
+class IntegrityError(OSError):
+    """A blob's content does not hash to its name."""
+
+
+def _check_name(name: str) -> str:
+    if not _NAME.match(name):
+        raise ValueError(f"not a SHA-256 hex name: {name!r}")
+    return name
+
+
+def parse_size(text: str) -> int:
+    """Bytes in "512M", "20G", "1048576"."""
+    m = re.match(r"^\s*(\d+)\s*([KMGT]?)I?B?\s*$", text.upper())
+    if not m:
+        raise ValueError(f"bad size: {text!r}")
+    return int(m.group(1)) * _SIZE_SUFFIX[m.group(2)]
+
+
+def _copy_verified(src: BinaryIO, dest: str, sha: str, mode: int = 0o644) -> int:
+    """Stream `src` into `dest` atomically; IntegrityError (and no `dest`) unless it hashes to `sha`."""
+    parent = os.path.dirname(os.path.abspath(dest))
+    os.makedirs(parent, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=parent, prefix=".tmp-")
+    h, total = hashlib.sha256(), 0
+    try:
+        with os.fdopen(fd, "wb") as out:
+            while True:
+                chunk = src.read(_CHUNK)
+                if not chunk:
+                    break
+                h.update(chunk)
+                out.write(chunk)
+                total += len(chunk)
+        if h.hexdigest() != sha:
+            raise IntegrityError(f"blob {sha} fetched with sha256 {h.hexdigest()}")
+        os.chmod(tmp, mode)
+        os.replace(tmp, dest)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+        raise
+    return total
+
+
+class DirBackend:
+    """Blobs and refs in a directory, optionally size-bounded with LRU eviction."""
+
+    def __init__(self, root: Union[str, os.PathLike], max_bytes: Optional[int] = None) -> None:
+        self.root = pathlib.Path(root)
+        self.max_bytes = max_bytes
+        self._gc_lock = threading.Lock()
+
+    def __repr__(self) -> str:
+        return f"DirBackend({str(self.root)!r})"
+
+    def blob_path(self, sha: str) -> pathlib.Path:
+        return self.root / "cas" / sha[:2] / _check_name(sha)
+
+    def _ref_path(self, name: str) -> pathlib.Path:
+        return self.root / "ac" / name[:2] / f"{_check_name(name)}.json"
+
+    def has(self, sha: str) -> bool:
+        return self.blob_path(sha).is_file()
+
+    def put_file(self, path: Union[str, os.PathLike], sha: Optional[str] = None) -> str:
+        """Store the file's contents; returns its SHA-256. A blob already present is not rewritten."""
+        sha = sha or sha256_path(path)
+        dest = self.blob_path(sha)
+        if dest.is_file():
+            os.utime(dest)
+            return sha
+        with open(path, "rb") as src:
+            _copy_verified(src, str(dest), sha)
+        metrics.inc("cas_bytes_uploaded_total", dest.stat().st_size)
+        return sha
+
+    def get_file(self, sha: str, dest: Union[str, os.PathLike], mode: int = 0o644) -> bool:
+        """Write blob `sha` to `dest`; False if absent, IntegrityError if the stored copy is corrupt."""
+        src = self.blob_path(sha)
+        try:
+            f = open(src, "rb")
+        except FileNotFoundError:
+            return False
+        with f:
+            n = _copy_verified(f, os.fspath(dest), sha, mode)
+        os.utime(src)  # LRU: a fetch makes the blob recent
+        metrics.inc("cas_bytes_downloaded_total", n)
+        return True
+
+    def delete(self, sha: str) -> None:
+        try:
+            self.blob_path(sha).unlink()
+        except FileNotFoundError:
+            pass
+
+    def get_ref(self, name: str) -> Optional[bytes]:
+        try:
+            return self._ref_path(name).read_bytes()
+        except OSError:
+            return None
+
+    def put_ref(self, name: str, data: bytes) -> None:
+        dest = self._ref_path(name)
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=dest.parent, prefix=".tmp-")
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp, dest)
+
+    def blobs(self) -> List[Tuple[str, int, int]]:
+        """(sha, size, mtime_ns) of every stored blob."""
+        out = []
+        base = self.root / "cas"
+        if not base.is_dir():
+            return out
+        for d in os.scandir(base):
+            if not d.is_dir():
+                continue
+            for e in os.scandir(d.path):
+                if _NAME.match(e.name):
+                    st = e.stat()
+                    out.append((e.name, st.st_size, st.st_mtime_ns))
+        return out
+
+    def gc(self, max_bytes: Optional[int] = None) -> Dict[str, int]:
+        """Delete least recently used blobs until the store holds at most max_bytes (default: self.max_bytes)."""
+        limit = self.max_bytes if max_bytes is None else max_bytes
+        with self._gc_lock:
+            blobs = sorted(self.blobs(), key=lambda b: b[2])
+            total = sum(b[1] for b in blobs)
+            evicted = freed = 0
+            if limit is not None:
+                for sha, size, _ in blobs:
+                    if total <= limit:
+                        break
+                    self.delete(sha)
+                    total -= size
+                    evicted += 1
+                    freed += size
+        metrics.inc("cas_blobs_evicted_total", evicted)
+        return {"blobs": len(blobs) - evicted, "bytes": total, "evicted": evicted, "freed": freed}
+
+
+class HttpBackend:
+    """Client for the HTTP layout `cas.py serve` implements; every GET is checked against its SHA-256."""
+
+    def __init__(self, base_url: str, timeout: float = 60.0, token: Optional[str] = None) -> None:
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.token = token if token is not None else os.environ.get("REPRO_CAS_TOKEN")
+        self.max_bytes = None  # eviction is the server's business
+
+    def __repr__(self) -> str:
+        return f"HttpBackend({self.base_url!r})"
+
+    def _request(self, method: str, path: str, data: Optional[Union[bytes, BinaryIO]] = None, size: Optional[int] = None):
+        req = urllib.request.Request(self.base_url + path, data=data, method=method)
+        if self.token:
+            req.add_header("Authorization", f"Bearer {self.token}")
+        if size is not None:
+            req.add_header("Content-Length", str(size))
+            req.add_header("Content-Type", "application/octet-stream")
+        return urllib.request.urlopen(req, timeout=self.timeout)
+
+    def _exists(self, path: str) -> bool:
+        try:
+            with self._request("HEAD", path):
+                return True
+        except urllib.error.HTTPError as e:
+            if e.code == 404:
+                return False
+            raise
+
+    def has(self, sha: str) -> bool:
+        return self._exists(f"/cas/{_check_name(sha)}")
+
+    def put_file(self, path: Union[str, os.PathLike], sha: Optional[str] = None) -> str:
+        sha = sha or sha256_path(path)
+        if self.has(sha):
+            return sha
+        size = os.path.getsize(path)
+        with open(path, "rb") as f, self._request("PUT", f"/cas/{sha}", f, size):
+            pass
+        metrics.inc("cas_bytes_uploaded_total", size)
+        return sha
+
+    def get_file(self, sha: str, dest: Union[str, os.PathLike], mode: int = 0o644) -> bool:
+        try:
+            resp = self._request("GET", f"/cas/{_check_name(sha)}")
+        except urllib.error.HTTPError as e:
+            if e.code == 404:
+                return False
+            raise
+        with resp:
+            n = _copy_verified(resp, os.fspath(dest), sha, mode)
+        metrics.inc("cas_bytes_downloaded_total", n)
+        return True
+
+    def get_ref(self, name: str) -> Optional[bytes]:
+        try:
+            with self._request("GET", f"/ac/{_check_name(name)}") as resp:
+                return resp.read()
+        except urllib.error.HTTPError as e:
+            if e.code == 404:
+                return None
+            raise
+
+    def put_ref(self, name: str, data: bytes) -> None:
+        with self._request("PUT", f"/ac/{_check_name(name)}", data, len(data)):
+            pass
+
+
+def open_store(spec: str, max_bytes: Optional[int] = None) -> Store:
+    """HttpBackend for an http(s):// URL, else a DirBackend; max_bytes defaults to REPRO_CAS_MAX_BYTES."""
+    if spec.startswith(("http://", "https://")):
+        return HttpBackend(spec)
+    if max_bytes is None and os.environ.get("REPRO_CAS_MAX_BYTES"):
+        max_bytes = parse_size(os.environ["REPRO_CAS_MAX_BYTES"])
+    return DirBackend(spec, max_bytes)
+
+
+def put_many(store: Store, paths: Iterable[Union[str, os.PathLike]], workers: Optional[int] = None) -> Dict[str, str]:
+    """Upload files concurrently; {path: sha256}. A bounded directory store is collected afterwards."""
+    paths = [os.fspath(p) for p in paths]
+    workers = verify_workers(workers, len(paths))
+    with metrics.phase("cas_put"), ThreadPoolExecutor(workers) as pool:
+        shas = dict(zip(paths, pool.map(store.put_file, paths)))
+    if isinstance(store, DirBackend) and store.max_bytes is not None:
+        store.gc()
+    return shas
+
+
+def get_many(store: Store, wanted: Dict[str, Union[str, os.PathLike]], workers: Optional[int] = None) -> Dict[str, bool]:
+    """Fetch {sha: dest} concurrently; {sha: found}. IntegrityError if any fetched blob is corrupt."""
+    items = list(wanted.items())
+    workers = verify_workers(workers, len(items))
+    with metrics.phase("cas_get"), ThreadPoolExecutor(workers) as pool:
+        found = list(pool.map(lambda kv: store.get_file(kv[0], kv[1]), items))
+    return {sha: ok for (sha, _), ok in zip(items, found)}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    store: DirBackend
+    token: Optional[str] = None
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, fmt, *args):  # quiet; the store is shared by many clients
+        pass
+
+    def _route(self) -> Tuple[Optional[str], Optional[str]]:
+        parts = self.path.strip("/").split("/")
+        if len(parts) == 2 and parts[0] in ("cas", "ac") and _NAME.match(parts[1]):
+            return parts[0], parts[1]
+        return None, None
+
+    def _reply(self, code: int, body: bytes = b"", length: Optional[int] = None, close: bool = False) -> None:
+        self.send_response(code)
+        self.send_header("Content-Length", str(len(body) if length is None else length))
+        if close:
+            self.send_header("Connection", "close")
+        self.end_headers()
+        if body:
+            self.wfile.write(body)
+
+    def do_HEAD(self):
+        kind, name = self._route()
+        if kind == "cas" and self.store.has(name):
+            self._reply(200, length=self.store.blob_path(name).stat().st_size)
+        elif kind == "ac" and self.store.get_ref(name) is not None:
+            self._reply(200, length=len(self.store.get_ref(name) or b""))
+        else:
+            self._reply(404)
+
+    def do_GET(self):
+        kind, name = self._route()
+        if kind == "ac":
+            data = self.store.get_ref(name)
+            return self._reply(200, data) if data is not None else self._reply(404)
+        if kind != "cas":
+            return self._reply(404)
+        try:
+            f = open(self.store.blob_path(name), "rb")
+        except FileNotFoundError:
+            return self._reply(404)
+        with f:
+            size = os.fstat(f.fileno()).st_size
+            self._reply(200, length=size)
+            shutil.copyfileobj(f, self.wfile, _CHUNK)
+        os.utime(self.store.blob_path(name))
+
+    def do_PUT(self):
+        kind, name = self._route()
+        try:
+            length = int(self.headers["Content-Length"])
+            if length < 0:
+                raise ValueError(length)
+        except (KeyError, TypeError, ValueError):
+            # Without a usable length the body cannot be skipped, so the connection cannot be reused.
+            return self._reply(400, b"missing or bad Content-Length", close=True)
+        if self.token and not hmac.compare_digest(self.headers.get("Authorization", "").encode("utf-8"), f"Bearer {self.token}".encode("utf-8")):
+            _Limited(self.rfile, length).drain()
+            return self._reply(401)
+        if kind is None:
+            _Limited(self.rfile, length).drain()
+            return self._reply(404)
+        if kind == "ac":
+            if length > _MAX_REF_BYTES:
+                _Limited(self.rfile, length).drain()
+                return self._reply(413, f"refs are limited to {_MAX_REF_BYTES} bytes".encode())
+            self.store.put_ref(name, self.rfile.read(length))
+            return self._reply(201)
+        body = _Limited(self.rfile, length)
+        try:
+            _copy_verified(body, str(self.store.blob_path(name)), name)
+        except IntegrityError as e:
+            body.drain()
+            return self._reply(400, str(e).encode())
+        self._reply(201)
+        if self.store.max_bytes is not None:
+            self.store.gc()
+
+
+class _Limited:
+    """At most `left` bytes of a request body."""
+
+    def __init__(self, f: BinaryIO, left: int) -> None:
+        self.f, self.left = f, left
+
+    def read(self, n: int) -> bytes:
+        data = self.f.read(min(n, self.left)) if self.left > 0 else b""
+        self.left -= len(data)
+        return data
+
+    def drain(self) -> None:
+        while self.read(_CHUNK):
+            pass
+
+
+def serve(root: str, host: str = "127.0.0.1", port: int = 8750, max_bytes: Optional[int] = None,
+          token: Optional[str] = None) -> ThreadingHTTPServer:
+    """
+    A ThreadingHTTPServer for `root` (not started; call serve_forever()). port=0 picks a free port.
+    With a token, PUTs without `Authorization: Bearer <token>` get 401.
+    """
+    handler = type("CasHandler", (_Handler,), {"store": open_store(root, max_bytes), "token": token or None})
+    return ThreadingHTTPServer((host, port), handler)
+
+
+def main():
+    ap = argparse.ArgumentParser(description="SHA-256 content-addressed blob store")
+    ap.add_argument("--store", default=os.environ.get("REPRO_CAS"), help="Directory or http(s):// URL (default: REPRO_CAS)")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    p = sub.add_parser("put", help="Store files; prints '<sha256>  <path>' per file")
+    p.add_argument("paths", nargs="+")
+    p.add_argument("--workers", type=int)
+    g = sub.add_parser("get", help="Fetch a blob into DEST, verifying its SHA-256")
+    g.add_argument("sha")
+    g.add_argument("dest")
+    c = sub.add_parser("gc", help="Evict least recently used blobs down to a size bound")
+    c.add_argument("--max-size", required=True, help="e.g. 20G")
+    s = sub.add_parser("serve", help="Serve a directory store over HTTP")
+    s.add_argument("--root", required=True)
+    s.add_argument("--host", default="127.0.0.1", help="Address to listen on; anything but loopback needs --token")
+    s.add_argument("--port", type=int, default=8750)
+    s.add_argument("--max-size", help="Evict least recently used blobs past this size")
+    s.add_argument("--token", default=os.environ.get("REPRO_CAS_TOKEN"), help="Bearer token required for uploads (default: REPRO_CAS_TOKEN)")
+    args = ap.parse_args()
+    if args.cmd == "serve":
+        if not args.token and args.host not in ("127.0.0.1", "::1", "localhost"):
+            ap.error(f"serving on {args.host} needs --token or REPRO_CAS_TOKEN; without one, anyone who can reach it can write action records")
+        server = serve(args.root, args.host, args.port, parse_size(args.max_size) if args.max_size else None, args.token)
+        print(f"Serving {args.root} on http://{args.host}:{server.server_address[1]}", flush=True)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        return
+    if not args.store:
+        ap.error("--store or REPRO_CAS is required")
+    store = open_store(args.store)
+    try:
+        if args.cmd == "put":
+            t0 = time.perf_counter()
+            for path, sha in put_many(store, args.paths, args.workers).items():
+                print(f"{sha}  {path}")
+            print(f"Stored {len(args.paths)} blobs in {time.perf_counter() - t0:.2f}s", file=sys.stderr)
+        elif args.cmd == "get":
+            if not store.get_file(args.sha, args.dest):
+                print(f"ERROR: {args.sha} not in {store!r}", file=sys.stderr)
+                sys.exit(2)
+        elif args.cmd == "gc":
+            if not isinstance(store, DirBackend):
+                ap.error("gc needs a directory store; an HTTP server collects with serve --max-size")
+            print(json.dumps(store.gc(parse_size(args.max_size)), sort_keys=True, separators=(",", ":")))
+    except (OSError, ValueError) as e:
+        print(f"ERROR: {e}", file=sys.stderr)
+        sys.exit(2)
+
+
+if __name__ == "__main__":
+    profiling.run(main)
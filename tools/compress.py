@@ -0,0 +1,368 @@
+#!/usr/bin/env python3
+"""Deterministic compressor backends for release archives.
+
+Every backend pins the settings that would otherwise leak build-time state
+into the output, and has a header verifier that checks them:
+  gzip  zlib deflate, no file name, mtime 0, OS byte 3 (what `gzip -n` writes)
+  xz    stdlib lzma, fixed LZMA2 filter chain and CRC64 check, single-threaded
+  zstd  `zstandard` (optional), checksummed frames without dictionary id;
+        always multi-threaded (workers >= 1), whose output does not depend
+        on the worker count, so any machine reproduces the same bytes
+  none  plain tar
+
+backend_for_path() picks a backend from the file suffix; open_reader()
+sniffs the magic bytes, so readers never need to be told the format. The
+"none" writer also offers copy_from(fd, count), which appends file bodies with
+copy_file_range / sendfile when the kernel and filesystems allow it.
+"""
+from __future__ import annotations
+
+import errno
+import gzip
+import lzma
+import os
+import struct
+import zlib
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from pathlib import Path
+from typing import BinaryIO, Dict, Iterator, Optional, Tuple, Union
+
+__all__ = ["BACKENDS", "Backend", "get_backend", "backend_for_path", "detect", "open_writer", "open_reader", "verify_header"]
+
+PathLike = Union[str, Path]
+
+
+class _GzipWriter:
+    """Single-member gzip stream with a fixed header; body identical to GzipFile's deflate.
+
+    seek_point() (after track_window()) makes a place where inflate can restart
+    without the preceding data, as zlib's examples/zran.c does: the deflate
+    stream is sync-flushed to a byte boundary and the last 32 KiB of input is
+    returned as the dictionary. The extra flushes change the compressed bytes,
+    so only archives that are indexed use them.
+    """
+
+    HEADER_SIZE = 10
+    WINDOW = 32 << 10
+
+    def __init__(self, raw: BinaryIO, level: int) -> None:
+        self.raw = raw
+        self._z = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS, zlib.DEF_MEM_LEVEL, 0)
+        self._crc = 0
+        self._size = 0
+        self._out = self.HEADER_SIZE
+        self._tail: Optional[bytes] = None
+        xfl = 2 if level == 9 else 4 if level == 1 else 0
+        raw.write(b"\x1f\x8b\x08\x00\x00\x00\x00\x00" + bytes((xfl, 3)))
+
+    def write(self, data) -> int:
+        self._crc = zlib.crc32(data, self._crc)
+        self._size += len(data)
+        out = self._z.compress(data)
+        self._out += len(out)
+        self.raw.write(out)
+        if self._tail is not None:
+            self._tail = bytes(data[-self.WINDOW:]) if len(data) >= self.WINDOW else (self._tail + bytes(data))[-self.WINDOW:]
+        return len(data)
+
+    def track_window(self) -> None:
+        """Keep the last 32 KiB of input from now on, for seek_point()."""
+        if self._tail is None:
+            self._tail = b""
+
+    def seek_point(self) -> Tuple[int, int, bytes]:
+        """Sync-flush; returns (uncompressed offset, compressed file offset, inflate dictionary)."""
+        out = self._z.flush(zlib.Z_SYNC_FLUSH)
+        self._out += len(out)
+        self.raw.write(out)
+        return self._size, self._out, self._tail or b""
+
+    def tell(self) -> int:
+        return self._size
+
+    def close(self) -> None:
+        if self._z is not None:
+            self.raw.write(self._z.flush() + struct.pack("<II", self._crc, self._size & 0xFFFFFFFF))
+            self._z = None
+
+
+# Kernel copy calls that failed with "not supported here"; not retried for the rest of the process.
+_NO_KERNEL_COPY: set = set()
+_UNSUPPORTED = {errno.EXDEV, errno.ENOSYS, errno.EOPNOTSUPP, errno.EINVAL, errno.EBADF, errno.ENOTSUP}
+
+
+def _kernel_copy(fd_in: int, fd_out: int, count: int) -> int:
+    """Copy up to `count` bytes from fd_in's offset to fd_out's without passing them through Python.
+
+    Tries copy_file_range (reflink / in-kernel copy), then sendfile. Returns
+    the bytes copied, short if fd_in hit EOF or neither call works here.
+    """
+    done = 0
+    for name in ("copy_file_range", "sendfile"):
+        fn = getattr(os, name, None)
+        if fn is None or name in _NO_KERNEL_COPY:
+            continue
+        try:
+            while done < count:
+                n = fn(fd_in, fd_out, count - done) if name == "copy_file_range" else fn(fd_out, fd_in, None, count - done)
+                if n == 0:
+                    return done
+                done += n
+            return done
+        except OSError as e:
+            if e.errno not in _UNSUPPORTED:
+                raise
+            _NO_KERNEL_COPY.add(name)
+    return done
+
+
+class _Passthrough:
+    def __init__(self, raw: BinaryIO) -> None:
+        self.raw = raw
+        self._size = 0
+
+    def write(self, data) -> int:
+        self._size += len(data)
+        return self.raw.write(data)
+
+    def copy_from(self, fd_in: int, count: int) -> int:
+        """Append up to `count` bytes from fd_in (at its current offset) with a kernel copy; returns bytes copied."""
+        try:
+            fd_out = self.raw.fileno()
+        except (AttributeError, OSError, ValueError):
+            return 0
+        self.raw.flush()
+        n = _kernel_copy(fd_in, fd_out, count)
+        if n:
+            # Resync the buffered writer with the descriptor the kernel advanced.
+            self.raw.seek(os.lseek(fd_out, 0, os.SEEK_CUR))
+            self._size += n
+        return n
+
+    def tell(self) -> int:
+        return self._size
+
+    def close(self) -> None:
+        pass
+
+
+class _Counting:
+    """Adds tell() (uncompressed bytes written) to writers that lack a usable one."""
+
+    def __init__(self, inner) -> None:
+        self.inner = inner
+        self._size = 0
+
+    def write(self, data) -> int:
+        self._size += len(data)
+        self.inner.write(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._size
+
+    def close(self) -> None:
+        self.inner.close()
+
+
+class Backend(ABC):
+    """One compression format: deterministic writer, reader and header verifier."""
+
+    name = ""
+    suffixes: Tuple[str, ...] = ()
+    magic = b""
+    default_level: Optional[int] = None
+
+    def available(self) -> bool:
+        return True
+
+    @abstractmethod
+    def writer(self, raw: BinaryIO, level: Optional[int] = None):
+        """Writable stream that compresses into `raw`; closing it ends the compressed stream."""
+
+    @abstractmethod
+    def reader(self, raw: BinaryIO) -> BinaryIO:
+        """Stream of the decompressed contents of `raw`."""
+
+    @abstractmethod
+    def verify(self, head: bytes, tail: bytes) -> Dict[str, object]:
+        """Check the deterministic settings from the first and last bytes of a file."""
+
+
+class NoneBackend(Backend):
+    name = "none"
+    suffixes = (".tar",)
+
+    def writer(self, raw, level=None):
+        return _Passthrough(raw)
+
+    def reader(self, raw):
+        return raw
+
+    def verify(self, head, tail):
+        return {"is_valid": True, "deterministic": True, "error": None}
+
+
+class GzipBackend(Backend):
+    name = "gzip"
+    suffixes = (".gz", ".tgz")
+    magic = b"\x1f\x8b"
+    default_level = 9
+    FLAGS = {"FTEXT": 0x01, "FHCRC": 0x02, "FEXTRA": 0x04, "FNAME": 0x08, "FCOMMENT": 0x10}
+
+    def writer(self, raw, level=None):
+        return _GzipWriter(raw, self.default_level if level is None else level)
+
+    def reader(self, raw):
+        return gzip.GzipFile(fileobj=raw, mode="rb")
+
+    def verify(self, head, tail):
+        if len(head) < 10 or head[:2] != self.magic:
+            return {"is_valid": False, "deterministic": False, "error": "bad_magic"}
+        flg = head[3]
+        mtime = int.from_bytes(head[4:8], "little")
+        flags = sorted(k for k, bit in self.FLAGS.items() if flg & bit)
+        return {"is_valid": head[2] == 8, "method": head[2], "flags": flags, "mtime": mtime, "os": head[9],
+                "deterministic": mtime == 0 and not {"FNAME", "FCOMMENT", "FEXTRA"} & set(flags),
+                "error": None if head[2] == 8 else "bad_method"}
+
+
+class XzBackend(Backend):
+    name = "xz"
+    suffixes = (".xz", ".txz")
+    magic = b"\xfd7zXZ\x00"
+    default_level = 6
+    CHECK = lzma.CHECK_CRC64
+
+    def filters(self, level: int):
+        # Spelled out so a future change of liblzma preset defaults cannot alter output.
+        return [{"id": lzma.FILTER_LZMA2, "preset": level, "dict_size": 8 << 20, "lc": 3, "lp": 0, "pb": 2,
+                 "mode": lzma.MODE_NORMAL, "nice_len": 64, "mf": lzma.MF_BT4, "depth": 0}]
+
+    def writer(self, raw, level=None):
+        level = self.default_level if level is None else level
+        return _Counting(lzma.LZMAFile(raw, "wb", format=lzma.FORMAT_XZ, check=self.CHECK, filters=self.filters(level)))
+
+    def reader(self, raw):
+        return lzma.LZMAFile(raw, "rb")
+
+    def verify(self, head, tail):
+        if len(head) < 12 or head[:6] != self.magic:
+            return {"is_valid": False, "deterministic": False, "error": "bad_magic"}
+        if zlib.crc32(head[6:8]) != int.from_bytes(head[8:12], "little"):
+            return {"is_valid": False, "deterministic": False, "error": "bad_header_crc"}
+        if len(tail) < 12 or tail[-2:] != b"YZ" or tail[-4:-2] != head[6:8]:
+            return {"is_valid": False, "deterministic": False, "error": "bad_footer"}
+        check = head[7] & 0x0F
+        return {"is_valid": True, "check": check, "deterministic": check == self.CHECK, "error": None}
+
+
+class ZstdBackend(Backend):
+    name = "zstd"
+    suffixes = (".zst", ".tzst", ".zstd")
+    magic = b"\x28\xb5\x2f\xfd"
+    default_level = 19
+
+    @staticmethod
+    def _module():
+        try:
+            import zstandard
+        except ImportError:
+            return None
+        return zstandard
+
+    def available(self):
+        return self._module() is not None
+
+    def _require(self):
+        zstd = self._module()
+        if zstd is None:
+            raise RuntimeError("zstd compression needs the 'zstandard' package (pip install zstandard)")
+        return zstd
+
+    def writer(self, raw, level=None):
+        zstd = self._require()
+        threads = max(1, int(os.environ.get("REPRO_ZSTD_THREADS", os.cpu_count() or 1)))
+        cctx = zstd.ZstdCompressor(level=self.default_level if level is None else level, threads=threads,
+                                   write_checksum=True, write_content_size=False, write_dict_id=False)
+        return _Counting(cctx.stream_writer(raw, closefd=False))
+
+    def reader(self, raw):
+        return self._require().ZstdDecompressor().stream_reader(raw, read_across_frames=True, closefd=False)
+
+    def verify(self, head, tail):
+        if len(head) < 5 or head[:4] != self.magic:
+            return {"is_valid": False, "deterministic": False, "error": "bad_magic"}
+        fhd = head[4]
+        checksum, dict_id = bool(fhd & 0x04), fhd & 0x03
+        return {"is_valid": not fhd & 0x08, "checksum": checksum, "dict_id": bool(dict_id),
+                "content_size": bool(fhd >> 6 or fhd & 0x20), "deterministic": checksum and not dict_id,
+                "error": "reserved_bit_set" if fhd & 0x08 else None}
+
+
+BACKENDS: Dict[str, Backend] = {b.name: b for b in (NoneBackend(), GzipBackend(), XzBackend(), ZstdBackend())}
+
+
+def get_backend(name: str) -> Backend:
+    try:
+        return BACKENDS[name.lower()]
+    except KeyError:
+        raise ValueError(f"unknown compression: {name} (choose from {', '.join(BACKENDS)})") from None
+
+
+def backend_for_path(path: PathLike, default: str = "gzip") -> Backend:
+    """Backend named by the suffix of `path` (.gz/.tgz, .xz/.txz, .zst/.tzst, .tar), else `default`."""
+    suffix = Path(path).suffix.lower()
+    for b in BACKENDS.values():
+        if suffix in b.suffixes and b.name != "none":
+            return b
+    return get_backend(default)
+
+
+def detect(head: bytes) -> Backend:
+    """Backend whose magic starts `head`; NoneBackend for anything else."""
+    for b in BACKENDS.values():
+        if b.magic and head.startswith(b.magic):
+            return b
+    return BACKENDS["none"]
+
+
+@contextmanager
+def open_writer(path: PathLike, compression: Optional[str] = None, level: Optional[int] = None, default: str = "gzip") -> Iterator[object]:
+    """Write-only stream to `path` compressed with `compression` (default: from the suffix)."""
+    backend = get_backend(compression) if compression else backend_for_path(path, default)
+    with open(path, "wb") as raw:
+        w = backend.writer(raw, level)
+        try:
+            yield w
+        finally:
+            w.close()
+
+
+@contextmanager
+def open_reader(path: PathLike) -> Iterator[BinaryIO]:
+    """Decompressed read stream of `path`, format sniffed from its magic bytes."""
+    with open(path, "rb") as raw:
+        backend = detect(raw.read(8))
+        raw.seek(0)
+        r = backend.reader(raw)
+        try:
+            yield r
+        finally:
+            if r is not raw:
+                r.close()
+
+
+def verify_header(path: PathLike) -> Dict[str, object]:
+    """Sniff `path` and check its backend's deterministic header settings ({"format", "is_valid", "deterministic", ...})."""
+    try:
+        with open(path, "rb") as f:
+            head = f.read(64)
+            size = f.seek(0, os.SEEK_END)
+            f.seek(max(0, size - 64))
+            tail = f.read()
+    except OSError as e:
+        return {"format": None, "is_valid": False, "deterministic": False, "error": str(e)}
+    backend = detect(head)
+    return {"format": backend.name, **backend.verify(head, tail)}
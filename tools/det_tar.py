@@ -1,13 +1,26 @@
 #!/usr/bin/env python3
-"""Deterministic tar helpers used by tests."""
+"""Deterministic tar helpers used by tests and `make tar`."""
 from __future__ import annotations
 
+import argparse
+import filecmp
 import os
+import stat
+import sys
 import tarfile
+import time
 from pathlib import Path
-from typing import Iterable
+from typing import Dict, Iterable, Iterator, Optional, Tuple
 
-__all__ = ["normalize_tar_info", "create_deterministic_tar", "build_tar"]
+if __package__ in (None, ""): sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from tools import metrics, profiling
+from tools.compress import BACKENDS, backend_for_path, get_backend, open_writer
+from tools.io_utils import fingerprint_path, prefetch_ordered
+from tools.tar_index import DEFAULT_INTERVAL, TarIndex, index_path_for
+from tools.tar_segments import write_segmented
+from tools.tar_writer import BLKTYPE, CHRTYPE, DIRTYPE, FIFOTYPE, LNKTYPE, REGTYPE, SYMTYPE, TarEntry, TarWriter, ZERO_COPY_MIN
+
+__all__ = ["IGNORE_DIRS", "SKIP_SUFFIXES", "normalize_tar_info", "create_deterministic_tar", "build_tar"]
 
 
 def normalize_tar_info(ti: tarfile.TarInfo) -> tarfile.TarInfo:
@@ -16,7 +29,9 @@ def normalize_tar_info(ti: tarfile.TarInfo) -> tarfile.TarInfo:
       - uid/gid = 0
       - uname/gname = "root"
       - mtime = 0
-      - mode: keep only rw bits (0644 for files, 0755 for dirs) if not already set
+      - mode: regular files (and hardlinks) become 0755 if any execute bit is
+        set, else 0644, so the builder's umask never reaches the archive;
+        other entries get 0644 / 0755 (dirs) if no permission bits are set
     """
     ti.uid = 0
     ti.gid = 0
@@ -24,7 +39,9 @@ def normalize_tar_info(ti: tarfile.TarInfo) -> tarfile.TarInfo:
     ti.gname = "root"
     ti.mtime = 0
     # Normalize modes to common deterministic defaults if missing/odd
-    if ti.isdir():
+    if ti.isreg() or ti.islnk():
+        ti.mode = 0o755 if ti.mode & 0o111 else 0o644
+    elif ti.isdir():
         if (ti.mode & 0o777) == 0:
             ti.mode = 0o755
     else:
@@ -33,36 +50,214 @@ def normalize_tar_info(ti: tarfile.TarInfo) -> tarfile.TarInfo:
     return ti
 
 
+def _record_member(ti, t0: float) -> None:
+    metrics.inc("files_archived_total")
+    metrics.inc("bytes_archived_total", ti.size)
+    metrics.observe("archive_file_seconds", time.perf_counter() - t0)
+
+
+# Exclude VCS and CI noise; det_zip skips the same files.
+IGNORE_DIRS = frozenset({".git", ".github", "__pycache__", ".pytest_cache", ".venv", "venv"})
+SKIP_SUFFIXES = (".pyc", ".pyo")
+_FILE_TYPES = {stat.S_IFREG: REGTYPE, stat.S_IFLNK: SYMTYPE, stat.S_IFCHR: CHRTYPE, stat.S_IFBLK: BLKTYPE, stat.S_IFIFO: FIFOTYPE}
+
+
 def _iter_paths_sorted(root: Path) -> Iterable[Path]:
     # Walk and yield files/dirs in sorted order for stable inclusion.
-    # Exclude VCS and CI noise.
-    ignore_dirs = {".git", ".github", "__pycache__", ".pytest_cache", ".venv", "venv"}
     for dirpath, dirnames, filenames in os.walk(root, followlinks=False):
         # filter directories in-place (affects walk order)
-        dirnames[:] = sorted(d for d in dirnames if d not in ignore_dirs)
+        dirnames[:] = sorted(d for d in dirnames if d not in IGNORE_DIRS)
         # yield directory record first (so tar has the parent before files)
         rel_dir = Path(dirpath).relative_to(root)
         yield rel_dir
         for fn in sorted(filenames):
-            if fn.endswith((".pyc", ".pyo")):
+            if fn.endswith(SKIP_SUFFIXES):
                 continue
             yield rel_dir / fn
 
 
-def create_deterministic_tar(source_dir: str, tar_path: str) -> None:
+def _entry(path: str, arcname: str, st: os.stat_result, inodes: Dict[Tuple[int, int], str]) -> Optional[TarEntry]:
+    """TarEntry equal to normalize_tar_info(TarFile.gettarinfo(path, arcname)) from an existing lstat; None for sockets."""
+    kind = _FILE_TYPES.get(stat.S_IFMT(st.st_mode))
+    if kind is None:
+        return None
+    perm = st.st_mode & 0o7777
+    if kind == REGTYPE:
+        mode = 0o755 if perm & 0o111 else 0o644
+        inode = (st.st_ino, st.st_dev)
+        # Same inode bookkeeping as tarfile: a second name for a seen inode is a hardlink.
+        if st.st_nlink > 1 and inode in inodes and arcname != inodes[inode]:
+            return TarEntry(arcname, path, LNKTYPE, mode, 0, inodes[inode])
+        if st.st_ino:
+            inodes[inode] = arcname
+        return TarEntry(arcname, path, REGTYPE, mode, st.st_size, "", st.st_ino, st.st_dev, st.st_nlink)
+    mode = perm if perm & 0o777 else 0o644
+    linkname = os.readlink(path) if kind == SYMTYPE else ""
+    return TarEntry(arcname, path, kind, mode, 0, linkname, rdev=st.st_rdev)
+
+
+def _scan_sorted(root: str, rel: str = "") -> Iterator[Tuple[str, Optional[os.DirEntry]]]:
+    """(relative path, DirEntry) in _iter_paths_sorted order, keeping scandir's cached stat data.
+
+    Directories come as (rel, None); the tree root itself is not yielded.
     """
-    Create a .tar.gz from source_dir with deterministic metadata and path order.
+    try:
+        with os.scandir(root) as it:
+            entries = list(it)
+    except OSError:
+        return
+    dirs, files = [], []
+    for e in entries:
+        try:
+            is_dir = e.is_dir()
+        except OSError:
+            is_dir = False
+        (dirs if is_dir else files).append(e)
+    if rel:
+        yield rel, None
+    for e in sorted(files, key=lambda e: e.name):
+        if not e.name.endswith(SKIP_SUFFIXES):
+            yield (f"{rel}/{e.name}" if rel else e.name), e
+    for d in sorted((d for d in dirs if d.name not in IGNORE_DIRS), key=lambda d: d.name):
+        if not d.is_symlink():
+            yield from _scan_sorted(d.path, f"{rel}/{d.name}" if rel else d.name)
+
+
+def _dedup(member, full: Path, seen: Dict[Tuple[int, int, str], Tuple[str, Path]], stats: Dict[str, int]) -> bool:
+    """Turn `member` (TarInfo or TarEntry) into a hardlink to an identical earlier file if there is one."""
+    target = _dedup_link(member, full, seen)
+    if target is None:
+        return False
+    stats["dedup_links"] += 1
+    stats["bytes_saved"] += member.size
+    metrics.inc("dedup_links_total")
+    metrics.inc("dedup_bytes_saved_total", member.size)
+    member.type, member.linkname, member.size = LNKTYPE, target, 0
+    return True
+
+
+def _dedup_link(ti: tarfile.TarInfo, full: Path, seen: Dict[Tuple[int, int, str], Tuple[str, Path]]) -> Optional[str]:
+    """Arcname of an earlier member with identical content and mode, registering `ti` if there is none."""
+    key = (ti.size, ti.mode, fingerprint_path(full))
+    first = seen.get(key)
+    if first is None:
+        seen[key] = (ti.name, full)
+        return None
+    # The fingerprint only nominates a candidate; the bytes decide.
+    return first[0] if filecmp.cmp(first[1], full, shallow=False) else None
+
+
+def create_deterministic_tar(source_dir: str, tar_path: str, compression: Optional[str] = None, dedup: bool = False,
+                             index: Optional[str] = None, index_interval: int = DEFAULT_INTERVAL,
+                             incremental: bool = False, previous: Optional[str] = None) -> Dict[str, int]:
+    """
+    Create a compressed tar from source_dir with deterministic metadata and path order.
+
+    `compression` is a tools.compress backend name (gzip, xz, zstd, none); by
+    default it follows the suffix of tar_path, and anything unrecognised
+    (including plain .tar) gets gzip as before. Compressed headers are pinned
+    too (gzip: no name, mtime 0), so the whole file is reproducible.
+
+    With `dedup`, a non-empty regular file whose content and normalized mode
+    match an earlier member is stored as a hardlink to the first such member
+    in archive order, so repeated licenses/assets are stored once.
+
+    Headers are encoded by tools.tar_writer from the scandir lstat results;
+    REPRO_TAR_WRITER=tarfile switches to the tarfile implementation, which
+    writes the same bytes and is kept as the reference.
+
+    `index` is a sidecar path for tools/tar_index.py (member offsets and
+    SHA-256, plus gzip seek points every `index_interval` bytes). The seek
+    points add sync flushes, so an indexed .gz differs from an unindexed one,
+    though both are reproducible.
+
+    `incremental` writes a segmented .tar.gz (tools/tar_segments.py) and
+    copies unchanged segments from `previous` (default: the existing
+    tar_path) instead of recompressing them. The result depends only on the
+    tree, but differs from the single-stream gzip of a normal build.
+
+    Returns {"members", "files", "dedup_links", "bytes_saved"}, plus
+    {"segments", "reused", "compressed", "bytes_reused"} when incremental.
     """
     src = Path(source_dir).resolve()
     out = Path(tar_path).resolve()
     out.parent.mkdir(parents=True, exist_ok=True)
+    stats = {"members": 0, "files": 0, "dedup_links": 0, "bytes_saved": 0}
+    if incremental:
+        if (get_backend(compression) if compression else backend_for_path(out)).name != "gzip" or index:
+            raise ValueError("incremental builds write gzip segments and cannot be indexed")
+        with metrics.phase("tar_write"):
+            stats.update(write_segmented(_counted(_raw_entries(src, dedup, stats), stats), str(out),
+                                         previous=str(out) if previous is None else previous))
+        return stats
+    idx = TarIndex(index_interval) if index else None
+    with metrics.phase("tar_write"), open_writer(out, compression) as stream:
+        if os.environ.get("REPRO_TAR_WRITER", "raw") == "tarfile":
+            if idx is not None:
+                raise ValueError("an index needs the raw writer (unset REPRO_TAR_WRITER)")
+            _write_tree_tarfile(src, stream, dedup, stats)
+        else:
+            _write_tree_raw(src, stream, dedup, stats, idx)
+    if idx is not None:
+        idx.write(str(out), index)
+    return stats
+
+
+def _raw_entries(src: Path, dedup: bool, stats: Dict[str, int]) -> Iterator[Tuple[TarEntry, Optional[str], int]]:
+    """(entry, path to read or None, size) in archive order, dedup already applied."""
+    seen: Dict[Tuple[int, int, str], Tuple[str, Path]] = {}
+    inodes: Dict[Tuple[int, int], str] = {}
+    for rel, e in _scan_sorted(str(src)):
+        arcname = rel.strip("./")
+        if arcname == "":
+            continue
+        if e is None:
+            yield TarEntry(arcname + "/", None, DIRTYPE, 0o644), None, 0
+            continue
+        entry = _entry(e.path, arcname, e.stat(follow_symlinks=False), inodes)
+        if entry is None:
+            continue
+        if dedup and entry.type == REGTYPE and entry.size:
+            _dedup(entry, Path(e.path), seen, stats)
+        yield entry, (entry.path if entry.type == REGTYPE and entry.size else None), entry.size
+
+
+def _counted(entries: Iterator[Tuple[TarEntry, Optional[str], int]], stats: Dict[str, int]) -> Iterator[TarEntry]:
+    for entry, _, _ in entries:
+        stats["members"] += 1
+        if entry.type != DIRTYPE:
+            stats["files"] += 1
+        yield entry
+
+
+def _write_tree_raw(src: Path, stream, dedup: bool, stats: Dict[str, int], index: Optional[TarIndex] = None) -> None:
+    """tools.tar_writer path: one lstat per file (from scandir), headers encoded directly.
 
-    # Use gzip with mtime=0 for stable .gz header across runs
-    # Python's tarfile doesn't let us set gzip mtime directly via "w:gz",
-    # but setting TarInfo.mtime=0 plus sorted order gives deterministic tar.
-    # The gzip header mtime may still vary across Python versions; tests
-    # focus on tar entries (order/meta), not gzip wrapper.
-    with tarfile.open(out, mode="w:gz") as tf:
+    File contents are read ahead in archive order by io_utils.prefetch_ordered
+    while earlier members are compressed; files over the prefetch budget are
+    streamed by the writer as before, so the bytes do not depend on it. For
+    uncompressed output, bodies of ZERO_COPY_MIN bytes or more skip the
+    prefetch and are copied by the kernel instead.
+    """
+    tw = TarWriter(stream, index)
+    entries = _raw_entries(src, dedup, stats)
+    if tw.zero_copy:
+        # Large bodies go file-to-file in the kernel; only read the small ones ahead.
+        entries = ((e, path if size < ZERO_COPY_MIN else None, size) for e, path, size in entries)
+    for entry, data in prefetch_ordered(entries):
+        t0 = time.perf_counter()
+        tw.add(entry, data)
+        if entry.type != DIRTYPE:
+            stats["files"] += 1
+            _record_member(entry, t0)
+        stats["members"] += 1
+    tw.close()
+
+
+def _write_tree_tarfile(src: Path, stream, dedup: bool, stats: Dict[str, int]) -> None:
+    """Reference path through tarfile (REPRO_TAR_WRITER=tarfile); produces the same bytes as the raw writer."""
+    seen: Dict[Tuple[int, int, str], Tuple[str, Path]] = {}
+    with tarfile.open(fileobj=stream, mode="w") as tf:
         for rel in _iter_paths_sorted(src):
             arcname = str(rel).strip("./")
             # Skip the root (empty arcname) record
@@ -76,16 +271,30 @@ def create_deterministic_tar(source_dir: str, tar_path: str) -> None:
                 ti = normalize_tar_info(ti)
                 tf.addfile(ti)
             else:
+                t0 = time.perf_counter()
                 ti = tf.gettarinfo(name=str(full), arcname=arcname)
                 ti = normalize_tar_info(ti)
-                with open(full, "rb") as f:
-                    tf.addfile(ti, fileobj=f)
+                if dedup and ti.isreg() and ti.size:
+                    _dedup(ti, full, seen, stats)
+                if ti.isreg():
+                    with open(full, "rb") as f:
+                        tf.addfile(ti, fileobj=f)
+                else:
+                    tf.addfile(ti)
+                stats["files"] += 1
+                _record_member(ti, t0)
+            stats["members"] += 1
 
 
-def build_tar(output_path: str, input_files: list[str]) -> None:
+def build_tar(output_path: str, input_files: list[str], compression: Optional[str] = None, index: Optional[str] = None,
+              index_interval: int = DEFAULT_INTERVAL) -> None:
     """
     Build a deterministic tar from a list of input files.
-    Expected by tests.
+    Expected by tests. Uncompressed unless `compression` is given or
+    output_path ends in a compressed suffix (.gz, .xz, .zst). Uncompressed
+    output moves file bodies with copy_file_range / sendfile where the
+    filesystem allows it (see tools/tar_writer.py); the bytes are the same.
+    `index` writes a tools/tar_index.py sidecar, as for create_deterministic_tar.
     """
     out = Path(output_path)
     out.parent.mkdir(parents=True, exist_ok=True)
@@ -93,14 +302,60 @@ def build_tar(output_path: str, input_files: list[str]) -> None:
     # Sort files by basename for deterministic order
     files = sorted(input_files, key=lambda x: Path(x).name)
     
-    with tarfile.open(out, mode="w") as tf:
+    inodes: Dict[Tuple[int, int], str] = {}
+    idx = TarIndex(index_interval) if index else None
+    with metrics.phase("tar_write"), open_writer(out, compression, default="none") as stream:
+        tw = TarWriter(stream, idx)
         for fpath in files:
             p = Path(fpath)
             if not p.exists():
                 continue
             # Use basename as arcname
-            arcname = p.name
-            ti = tf.gettarinfo(name=str(p), arcname=arcname)
-            ti = normalize_tar_info(ti)
-            with open(p, "rb") as f:
-                tf.addfile(ti, fileobj=f)
+            t0 = time.perf_counter()
+            entry = _entry(str(p), p.name, os.lstat(p), inodes)
+            if entry is not None:
+                tw.add(entry)
+                _record_member(entry, t0)
+        tw.close()
+    if idx is not None:
+        idx.write(str(out), index)
+
+
+def main():
+    from tools.config import get_path
+    ap = argparse.ArgumentParser(description="Create a deterministic (compressed) tar")
+    ap.add_argument("source_dir", nargs="?", help="Directory to archive")
+    ap.add_argument("--files", nargs="+", help="Archive these files by basename instead of a directory")
+    ap.add_argument("--output", "-o", help="Output path; the suffix picks the compression")
+    ap.add_argument("--compression", choices=sorted(BACKENDS), help="Override the suffix-based choice")
+    ap.add_argument("--dedup", action="store_true", help="Store repeated file contents once, as hardlinks to the first copy")
+    ap.add_argument("--index", nargs="?", const="", metavar="PATH",
+                    help="Write a random-access index sidecar for tools/tar_index.py (default path: <output>.index.json)")
+    ap.add_argument("--index-interval", type=int, default=DEFAULT_INTERVAL, metavar="BYTES",
+                    help="Uncompressed bytes between gzip seek points in the index")
+    ap.add_argument("--incremental", action="store_true",
+                    help="Write independently compressed gzip segments and reuse unchanged ones from the previous build")
+    ap.add_argument("--previous", metavar="ARCHIVE", help="Previous segmented build to reuse (default: the output path)")
+    args = ap.parse_args()
+    index = None
+    if args.source_dir:
+        out = args.output or Path(args.source_dir).resolve().name + ".tar.gz"
+        if args.index is not None:
+            index = args.index or index_path_for(out)
+        stats = create_deterministic_tar(args.source_dir, out, args.compression, args.dedup, index, args.index_interval,
+                                         args.incremental, args.previous)
+        if args.incremental:
+            print(f"Segments: {stats['reused']} reused, {stats['compressed']} compressed ({stats['bytes_reused']} bytes copied)")
+        if args.dedup:
+            print(f"Dedup: {stats['dedup_links']} of {stats['files']} files linked, {stats['bytes_saved']} bytes saved")
+    else:
+        # Default: the release tarball of `make tar` (artifact + manifest).
+        out = args.output or get_path("tarball_base") + ".gz"
+        if args.index is not None:
+            index = args.index or index_path_for(out)
+        build_tar(out, args.files or [get_path("artifact"), get_path("manifest")], args.compression, index, args.index_interval)
+    print(f"Wrote {out}" + (f" and {index}" if index else ""))
+
+
+if __name__ == "__main__":
+    profiling.run(main)
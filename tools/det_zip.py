@@ -0,0 +1,297 @@
+#!/usr/bin/env python3
+"""Deterministic ZIP / wheel writer, the zip counterpart of det_tar.
+
+Every entry is normalized the same way:
+  - entries sorted by archive path; for wheels the .dist-info files go last
+    and RECORD is the final entry (PEP 427)
+  - timestamp 1980-01-01 00:00:00 (the earliest a ZIP can hold)
+  - "made by" Unix, mode 0755 if any execute bit is set else 0644, no
+    directory entries, no extra fields (unless ZIP64 is required), no comments,
+    no data descriptors; UTF-8 flag only for non-ASCII names
+  - deflate at a fixed level (raw deflate, as zipfile writes it)
+For a wheel (.whl output, or wheel=True) *.dist-info/RECORD is regenerated
+from the archived bytes: archive order, CSV rows "path,sha256=<urlsafe b64>,size"
+with "\\n" line endings, and "RECORD,," for itself.
+
+Entries compress independently, so deflate runs on a process pool
+(REPRO_ZIP_WORKERS, default: CPU count) in batches of small files and the
+results are written back in archive order; the bytes do not depend on the
+worker count. Files of STREAM_MIN bytes or more are deflated in the main
+process, streaming, with the local header patched afterwards.
+"""
+from __future__ import annotations
+
+import argparse
+import base64
+import csv
+import hashlib
+import io
+import os
+import struct
+import sys
+import zlib
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+if __package__ in (None, ""): sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from tools import metrics, profiling
+from tools.det_tar import IGNORE_DIRS, SKIP_SUFFIXES
+
+__all__ = ["DOS_DATE", "DOS_TIME", "zip_order", "wheel_record", "create_deterministic_zip"]
+
+DOS_DATE = (0 << 9) | (1 << 5) | 1  # 1980-01-01
+DOS_TIME = 0
+DEFAULT_LEVEL = 9
+STREAM_MIN = 16 << 20
+_BATCH_FILES = 64
+_BATCH_BYTES = 1 << 20
+_CHUNK = 1 << 20
+_ZIP64_LIMIT = 0xFFFFFFFF
+_FLAG_UTF8 = 0x800
+
+
+def zip_order(names: Sequence[str], wheel: bool = False) -> List[str]:
+    """Archive order: sorted; for wheels .dist-info last and RECORD at the very end."""
+    if not wheel:
+        return sorted(names)
+
+    def key(n: str) -> Tuple[bool, bool, str]:
+        top = n.split("/", 1)[0]
+        dist = top.endswith(".dist-info")
+        return dist, dist and n == f"{top}/RECORD", n
+    return sorted(names, key=key)
+
+
+def _record_hash(sha256: bytes) -> str:
+    return "sha256=" + base64.urlsafe_b64encode(sha256).rstrip(b"=").decode("ascii")
+
+
+def wheel_record(record_name: str, entries: Sequence[Tuple[str, bytes, int]]) -> bytes:
+    """RECORD contents for (name, sha256 digest, size) entries in archive order, then RECORD itself without hash."""
+    buf = io.StringIO()
+    w = csv.writer(buf, lineterminator="\n")  # quotes names with commas or quotes, as wheel tools do
+    w.writerows([n, _record_hash(h), size] for n, h, size in entries if n != record_name)
+    w.writerow([record_name, "", ""])
+    return buf.getvalue().encode("utf-8")
+
+
+def _deflate(data: bytes, level: int) -> bytes:
+    c = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS)
+    return c.compress(data) + c.flush()
+
+
+def _deflate_batch(paths: Sequence[str], level: int) -> List[Tuple[int, int, bytes, bytes]]:
+    """(crc32, size, sha256, deflated) per file; runs in the pool workers."""
+    out = []
+    for p in paths:
+        with open(p, "rb") as f:
+            data = f.read()
+        out.append((zlib.crc32(data), len(data), hashlib.sha256(data).digest(), _deflate(data, level)))
+    return out
+
+
+def _scan(src: Path) -> Dict[str, Tuple[str, int, int]]:
+    """arcname -> (path, size, mode) for regular files (symlinks followed) under src, det_tar's exclusions applied."""
+    files: Dict[str, Tuple[str, int, int]] = {}
+    for dirpath, dirnames, filenames in os.walk(src):
+        dirnames[:] = [d for d in dirnames if d not in IGNORE_DIRS]
+        rel = Path(dirpath).relative_to(src)
+        for fn in filenames:
+            if fn.endswith(SKIP_SUFFIXES):
+                continue
+            full = os.path.join(dirpath, fn)
+            try:
+                st = os.stat(full)
+            except OSError:
+                continue  # dangling symlink
+            if not os.path.isfile(full):
+                continue
+            files[(rel / fn).as_posix()] = (full, st.st_size, 0o755 if st.st_mode & 0o111 else 0o644)
+    return files
+
+
+class _ZipOut:
+    """Appends local entries to a seekable file and keeps what the central directory needs."""
+
+    def __init__(self, f) -> None:
+        self.f = f
+        self.central: List[bytes] = []
+
+    @staticmethod
+    def _names(name: str) -> Tuple[bytes, int]:
+        return name.encode("utf-8"), 0 if name.isascii() else _FLAG_UTF8
+
+    def _local(self, name_b: bytes, flags: int, crc: int, csize: int, usize: int, zip64: bool) -> bytes:
+        extra = struct.pack("<HHQQ", 1, 16, usize, csize) if zip64 else b""
+        c, u = (_ZIP64_LIMIT, _ZIP64_LIMIT) if zip64 else (csize, usize)
+        return struct.pack("<IHHHHHIIIHH", 0x04034B50, 45 if zip64 else 20, flags, 8, DOS_TIME, DOS_DATE, crc, c, u,
+                           len(name_b), len(extra)) + name_b + extra
+
+    def _add_central(self, name_b: bytes, flags: int, crc: int, csize: int, usize: int, mode: int, offset: int) -> None:
+        fields = []
+        c, u, off = csize, usize, offset
+        if usize >= _ZIP64_LIMIT or csize >= _ZIP64_LIMIT:
+            fields += [usize, csize]; c = u = _ZIP64_LIMIT
+        if offset >= _ZIP64_LIMIT:
+            fields.append(offset); off = _ZIP64_LIMIT
+        extra = struct.pack(f"<HH{len(fields)}Q", 1, 8 * len(fields), *fields) if fields else b""
+        version = 45 if fields else 20
+        self.central.append(struct.pack("<IHHHHHHIIIHHHHHII", 0x02014B50, (3 << 8) | version, version, flags, 8, DOS_TIME,
+                                        DOS_DATE, crc, c, u, len(name_b), len(extra), 0, 0, 0, (0o100000 | mode) << 16, off)
+                            + name_b + extra)
+
+    def add(self, name: str, mode: int, crc: int, usize: int, deflated: bytes) -> None:
+        name_b, flags = self._names(name)
+        offset = self.f.tell()
+        zip64 = usize >= _ZIP64_LIMIT or len(deflated) >= _ZIP64_LIMIT
+        self.f.write(self._local(name_b, flags, crc, len(deflated), usize, zip64))
+        self.f.write(deflated)
+        self._add_central(name_b, flags, crc, len(deflated), usize, mode, offset)
+
+    def add_stream(self, name: str, mode: int, path: str, size: int, level: int) -> Tuple[int, bytes]:
+        """Deflate a large file in chunks, then patch its local header; returns (size, sha256)."""
+        name_b, flags = self._names(name)
+        offset = self.f.tell()
+        zip64 = size * 1.05 >= _ZIP64_LIMIT  # decided from the input size, before the compressed size is known
+        self.f.write(self._local(name_b, flags, 0, 0, 0, zip64))
+        c = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS)
+        crc, usize, csize, sha = 0, 0, 0, hashlib.sha256()
+        with open(path, "rb") as src:
+            for block in iter(lambda: src.read(_CHUNK), b""):
+                crc = zlib.crc32(block, crc); usize += len(block); sha.update(block)
+                out = c.compress(block); csize += len(out); self.f.write(out)
+        out = c.flush(); csize += len(out); self.f.write(out)
+        if not zip64 and (usize >= _ZIP64_LIMIT or csize >= _ZIP64_LIMIT):
+            raise OSError(f"{path}: grew past the ZIP64 threshold while being archived")
+        end = self.f.tell()
+        self.f.seek(offset)
+        self.f.write(self._local(name_b, flags, crc, csize, usize, zip64))
+        self.f.seek(end)
+        self._add_central(name_b, flags, crc, csize, usize, mode, offset)
+        return usize, sha.digest()
+
+    def close(self) -> None:
+        cd_offset = self.f.tell()
+        for rec in self.central:
+            self.f.write(rec)
+        cd_size, count = self.f.tell() - cd_offset, len(self.central)
+        if count >= 0xFFFF or cd_offset >= _ZIP64_LIMIT or cd_size >= _ZIP64_LIMIT:
+            eocd64 = self.f.tell()
+            self.f.write(struct.pack("<IQHHIIQQQQ", 0x06064B50, 44, 45, 45, 0, 0, count, count, cd_size, cd_offset))
+            self.f.write(struct.pack("<IIQI", 0x07064B50, 0, eocd64, 1))
+            count, cd_size, cd_offset = min(count, 0xFFFF), min(cd_size, _ZIP64_LIMIT), min(cd_offset, _ZIP64_LIMIT)
+        self.f.write(struct.pack("<IHHHHIIH", 0x06054B50, 0, 0, count, count, cd_size, cd_offset, 0))
+
+
+def _workers() -> int:
+    return max(1, int(os.environ.get("REPRO_ZIP_WORKERS", os.cpu_count() or 1)))
+
+
+def create_deterministic_zip(source_dir: str, zip_path: str, level: int = DEFAULT_LEVEL, workers: Optional[int] = None,
+                             wheel: Optional[bool] = None) -> Dict[str, int]:
+    """
+    Zip source_dir into zip_path with normalized entries (see module docstring).
+    `wheel` defaults to zip_path ending in .whl. Returns {"entries", "bytes_in", "bytes_out"}.
+    """
+    src = Path(source_dir).resolve()
+    out = Path(zip_path).resolve()
+    out.parent.mkdir(parents=True, exist_ok=True)
+    wheel = out.suffix == ".whl" if wheel is None else wheel
+    workers = _workers() if workers is None else max(1, workers)
+    files = _scan(src)
+    record = None
+    if wheel:
+        records = sorted(n for n in files if n.count("/") == 1 and n.split("/")[0].endswith(".dist-info") and n.endswith("/RECORD"))
+        if len(records) > 1:
+            raise ValueError(f"more than one .dist-info/RECORD: {', '.join(records)}")
+        dist = sorted({n.split("/")[0] for n in files if n.split("/")[0].endswith(".dist-info")})
+        if not dist:
+            raise ValueError("wheel has no .dist-info directory")
+        record = records[0] if records else f"{dist[-1]}/RECORD"
+        files.pop(record, None)
+    order = zip_order(list(files) + ([record] if record else []), wheel)
+    hashes: List[Tuple[str, bytes, int]] = []
+    stats = {"entries": len(order), "bytes_in": 0, "bytes_out": 0}
+
+    # Batches of consecutive small files for the pool; large files become single streamed items.
+    items: List[Tuple[str, List[str]]] = []
+    batch: List[str] = []
+    size = 0
+    for name in order:
+        if name == record:
+            continue
+        if files[name][1] >= STREAM_MIN:
+            if batch:
+                items.append(("batch", batch)); batch, size = [], 0
+            items.append(("stream", [name]))
+            continue
+        batch.append(name); size += files[name][1]
+        if len(batch) >= _BATCH_FILES or size >= _BATCH_BYTES:
+            items.append(("batch", batch)); batch, size = [], 0
+    if batch:
+        items.append(("batch", batch))
+
+    pool = ProcessPoolExecutor(workers) if workers > 1 else None
+    try:
+        with metrics.phase("zip_write"), open(out, "wb") as f:
+            zout = _ZipOut(f)
+            window: deque = deque()
+            pending = iter(items)
+
+            def submit() -> None:
+                for kind, names in pending:
+                    paths = [files[n][0] for n in names]
+                    fut = pool.submit(_deflate_batch, paths, level) if (pool and kind == "batch") else None
+                    window.append((kind, names, fut))
+                    if len(window) >= 4 * workers:
+                        return
+
+            submit()
+            while window:
+                kind, names, fut = window.popleft()
+                if kind == "stream":
+                    name = names[0]
+                    n, digest = zout.add_stream(name, files[name][2], files[name][0], files[name][1], level)
+                    hashes.append((name, digest, n)); stats["bytes_in"] += n
+                else:
+                    results = fut.result() if fut is not None else _deflate_batch([files[n][0] for n in names], level)
+                    for name, (crc, n, digest, deflated) in zip(names, results):
+                        zout.add(name, files[name][2], crc, n, deflated)
+                        hashes.append((name, digest, n)); stats["bytes_in"] += n
+                metrics.inc("files_archived_total", len(names))
+                submit()
+            if record is not None:
+                data = wheel_record(record, hashes)
+                zout.add(record, 0o644, zlib.crc32(data), len(data), _deflate(data, level))
+            zout.close()
+            stats["bytes_out"] = f.tell()
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+    metrics.inc("bytes_archived_total", stats["bytes_in"])
+    return stats
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Create a deterministic zip or wheel")
+    ap.add_argument("source_dir", help="Directory to archive (for a wheel: the unpacked wheel contents)")
+    ap.add_argument("--output", "-o", required=True, help="Output .zip / .whl")
+    ap.add_argument("--level", type=int, default=DEFAULT_LEVEL, help="Deflate level (default 9)")
+    ap.add_argument("--workers", type=int, help="Deflate processes (default: REPRO_ZIP_WORKERS or CPU count)")
+    ap.add_argument("--wheel", action="store_true", default=None, help="Treat as a wheel even without the .whl suffix")
+    args = ap.parse_args()
+    if not Path(args.source_dir).is_dir():
+        print(f"ERROR: not a directory: {args.source_dir}", file=sys.stderr)
+        sys.exit(2)
+    try:
+        stats = create_deterministic_zip(args.source_dir, args.output, args.level, args.workers, args.wheel)
+    except (OSError, ValueError) as e:
+        print(f"ERROR: {e}", file=sys.stderr)
+        sys.exit(2)
+    print(f"Wrote {args.output} ({stats['entries']} entries, {stats['bytes_out']} bytes)")
+
+
+if __name__ == "__main__":
+    profiling.run(main)
@@ -1,6 +1,8 @@
 #!/usr/bin/env python3
 from __future__ import annotations
-import json, pathlib, datetime
+import json, pathlib, datetime, sys
+if __package__ in (None, ""): sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[1]))
+from tools import profiling
 ROOT=pathlib.Path(".")
 FILES={"env_snapshot":"env_snapshot.json","pins_report":"pins_report.json","permissions_report":"permissions_report.json","json_check":"json_check_report.json","tar_check":"tar_check.json","gzip_check":"gzip_check.json","meta_trace":"meta_trace.json","policy_index":"schema/policy_index.json","repro_json":"reports/repro.md.json"}
 POLICY={"env_snapshot":"Deterministic env","pins_report":"SHA-pinned actions","permissions_report":"Least-privilege","json_check":"Canonical JSON","tar_check":"Deterministic tar","gzip_check":"Gzip header","meta_trace":"Repo hygiene","policy_index":"Policy index","repro_json":"Repro audit"}
@@ -25,4 +27,4 @@ def main():
         md.append(f"- {mark} **{k}** → `{r['file']}` — {POLICY.get(k,'')}")
     pathlib.Path("EVIDENCE_MATRIX.md").write_text("\n".join(md)+"\n", encoding="utf-8")
     print("Wrote evidence_index.json and EVIDENCE_MATRIX.md")
-if __name__=="__main__": main()
+if __name__=="__main__": profiling.run(main)
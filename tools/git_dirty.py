@@ -0,0 +1,441 @@
+#!/usr/bin/env python3
+"""Is the working tree dirty? One `git status`, or the git index's stat cache against a stat snapshot.
+
+version_stamp used to run `git describe --dirty` and then `git status --porcelain`:
+two full passes over the tree, each stat'ing every tracked file. dirty_state()
+answers the same question in one pass. By default that pass is a single `git status`
+(`--untracked-files=no` when untracked files do not matter); git uses the untracked
+cache and fsmonitor on its own when the repository has them configured, and its
+threaded stat loop in C beats anything done from Python on a warm page cache.
+
+Where stat calls are what costs (network filesystems, cold caches), the index
+engine (REPRO_DIRTY_ENGINE=index) reads .git/index itself and compares each
+entry's cached stat data against a snapshot of the tree: snapshot_tree() sweeps a
+tree once per process, and with REPRO_STAT_SNAPSHOT set the sweep is saved to (and
+later loaded from) that file, so tools in one CI job share it and the dirty check
+makes no stat calls at all. Without a snapshot the engine lists only directories
+that contain tracked files. Only entries whose stat data changed (or is "racy",
+i.e. not older than the index) have their blob hashed; a directory with no tracked
+files is one untracked candidate, not a subtree to walk, and all candidates go to a
+single `git check-ignore`. Staged changes are read from the index's cache-tree and
+compared against HEAD's tree over the shared git_info pipe. The engine stops at the
+first change it finds.
+
+Git stays the authority whenever the index engine cannot be sure: changed content
+is confirmed with `git diff --quiet` (clean/smudge filters such as autocrlf can make
+a file whose hash differs unchanged as far as git is concerned), and repositories
+using index features this module does not parse (split or sparse index,
+submodules) or an fsmonitor get `git status` after all.
+
+    from tools import git_dirty
+    git_dirty.dirty_state()["dirty"]                 # tracked changes, staged changes, untracked files
+    git_dirty.dirty_state(untracked=False)           # like --untracked-files=no
+    git_dirty.dirty_state(engine="index", snapshot=git_dirty.snapshot_tree())
+"""
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import os
+import pathlib
+import stat
+import struct
+import subprocess
+import sys
+from typing import Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
+
+if __package__ in (None, ""): sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[1]))
+from tools import git_info, metrics, profiling
+
+__all__ = ["IndexEntry", "read_index", "snapshot_tree", "load_snapshot", "dirty_state"]
+
+# path -> (st_mode, st_size, st_mtime_ns, st_ino), relative to the tree root with "/" separators
+Snapshot = Dict[str, Tuple[int, int, int, int]]
+
+_SKIP_WORKTREE = 0x4000    # extended flags (index v3+)
+_INTENT_TO_ADD = 0x2000
+_ASSUME_VALID = 0x8000     # flags
+_UNSUPPORTED_EXT = {b"link": "split index", b"sdir": "sparse index"}
+_CONFIRM_MAX = 1000        # more changed-content candidates than this: one whole-tree `git diff` instead
+_snapshots: Dict[str, Snapshot] = {}
+
+
+class Unsupported(Exception):
+    """The index uses something this module does not handle; ask git instead."""
+
+
+class IndexEntry(NamedTuple):
+    path: str
+    mode: int
+    size: int
+    mtime_ns: int
+    ino: int
+    oid: bytes
+    stage: int
+    flags: int  # assume-valid / skip-worktree / intent-to-add bits
+
+
+class Index(NamedTuple):
+    entries: List[IndexEntry]
+    mtime_ns: int
+    tree: Optional[bytes]  # cache-tree root, None if absent or invalidated
+    extensions: Set[bytes]
+
+
+def _varint(data: bytes, pos: int) -> Tuple[int, int]:
+    """git's offset varint (index v4 path prefix lengths)."""
+    c = data[pos]; pos += 1
+    val = c & 0x7F
+    while c & 0x80:
+        c = data[pos]; pos += 1
+        val = ((val + 1) << 7) | (c & 0x7F)
+    return val, pos
+
+
+def _cache_tree_root(data: bytes, oid_len: int) -> Optional[bytes]:
+    path_end = data.index(b"\0")
+    count, _ = data[path_end + 1:data.index(b"\n", path_end)].split(b" ")
+    if path_end != 0 or int(count) < 0:
+        return None
+    start = data.index(b"\n", path_end) + 1
+    return data[start:start + oid_len]
+
+
+def read_index(git_dir: str, oid_len: int = 20) -> Index:
+    """Parse <git_dir>/index (versions 2-4). Raises Unsupported for layouts git should handle itself."""
+    path = os.path.join(git_dir, "index")
+    try:
+        with open(path, "rb") as f:
+            st = os.fstat(f.fileno())
+            data = f.read()
+    except FileNotFoundError:
+        raise Unsupported("no index") from None
+    if data[:4] != b"DIRC":
+        raise Unsupported("not an index file")
+    version, count = struct.unpack_from(">II", data, 4)
+    if version not in (2, 3, 4):
+        raise Unsupported(f"index version {version}")
+    entries: List[IndexEntry] = []
+    pos, prev = 12, b""
+    head_fmt = struct.Struct(f">8xII4xII8xI{oid_len}sH")  # ctime, mtime, dev, ino, mode, uid, gid, size
+    fixed = head_fmt.size
+    unpack, find, ns = head_fmt.unpack_from, data.index, 1_000_000_000
+    for _ in range(count):
+        m_s, m_ns, ino, mode, size, oid, flags = unpack(data, pos)
+        head = fixed
+        ext = 0
+        if flags & 0x4000 and version >= 3:
+            (ext,) = struct.unpack_from(">H", data, pos + fixed)
+            head += 2
+        if version == 4:
+            strip, name_start = _varint(data, pos + head)
+            end = find(b"\0", name_start)
+            name = prev[:len(prev) - strip] + data[name_start:end]
+            pos = end + 1
+            prev = name
+        else:
+            end = find(b"\0", pos + head)
+            name = data[pos + head:end]
+            pos += (head + len(name) + 8) & ~7
+        if mode == 0o160000:
+            raise Unsupported("submodules")
+        if mode & 0o170000 == 0o040000:
+            raise Unsupported("sparse index")
+        entries.append(IndexEntry(name.decode("utf-8", "surrogateescape"), mode, size, m_s * ns + m_ns, ino, oid,
+                                  (flags >> 12) & 3, (flags & _ASSUME_VALID) | ext))
+    tree, exts = None, set()
+    while pos + 8 <= len(data) - oid_len:
+        sig, size = data[pos:pos + 4], struct.unpack_from(">I", data, pos + 4)[0]
+        if sig in _UNSUPPORTED_EXT:
+            raise Unsupported(_UNSUPPORTED_EXT[sig])
+        exts.add(sig)
+        if sig == b"TREE" and size:
+            tree = _cache_tree_root(data[pos + 8:pos + 8 + size], oid_len)
+        pos += 8 + size
+    return Index(entries, st.st_mtime_ns, tree, exts)
+
+
+def _git_dir(root: str) -> Tuple[str, Optional[str]]:
+    """(work tree top level, git directory) for `root` or its nearest parent with a .git."""
+    top = root
+    while True:
+        dot = os.path.join(top, ".git")
+        if os.path.isdir(dot):
+            return top, dot
+        if os.path.isfile(dot):
+            with open(dot, encoding="utf-8") as f:
+                line = f.readline().strip()
+            return top, (os.path.normpath(os.path.join(top, line[8:])) if line.startswith("gitdir: ") else None)
+        parent = os.path.dirname(top)
+        if parent == top:
+            return root, None
+        top = parent
+
+
+def _parent_dirs(paths: Iterable[str]) -> Set[str]:
+    dirs: Set[str] = set()
+    for p in paths:
+        i = p.rfind("/")
+        while i > 0 and p[:i] not in dirs:
+            dirs.add(p[:i])
+            i = p.rfind("/", 0, i)
+    return dirs
+
+
+def _git(root: str, args: List[str], stdin: Optional[bytes] = None) -> subprocess.CompletedProcess:
+    metrics.inc("git_processes_total")
+    try:
+        return subprocess.run(["git", *args], cwd=root, input=stdin, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    except OSError:
+        return subprocess.CompletedProcess(args, 127, b"")
+
+
+def snapshot_tree(root: str = ".") -> Snapshot:
+    """lstat of every file under `root` (except .git), once per process; shared through REPRO_STAT_SNAPSHOT if set."""
+    key = os.path.realpath(root)
+    snap = _snapshots.get(key) or load_snapshot(key)
+    if snap is not None:
+        metrics.cache("stat_snapshot", True)
+        return snap
+    metrics.cache("stat_snapshot", False)
+    snap = {}
+    with metrics.phase("stat_snapshot"):
+        stack = [""]
+        while stack:
+            rel = stack.pop()
+            with os.scandir(os.path.join(key, rel)) as it:
+                for e in it:
+                    p = rel + e.name
+                    if e.name == ".git":
+                        continue
+                    if e.is_dir(follow_symlinks=False):
+                        stack.append(p + "/")
+                        continue
+                    st = e.stat(follow_symlinks=False)
+                    snap[p] = (st.st_mode, st.st_size, st.st_mtime_ns, st.st_ino)
+    _snapshots[key] = snap
+    out = os.environ.get("REPRO_STAT_SNAPSHOT")
+    if out:
+        tmp = out + ".tmp"
+        pathlib.Path(tmp).write_text(json.dumps({"root": key, "files": snap}, separators=(",", ":")), encoding="utf-8")
+        os.replace(tmp, out)
+    return snap
+
+
+def load_snapshot(root: str) -> Optional[Snapshot]:
+    """The snapshot saved in $REPRO_STAT_SNAPSHOT, if there is one for `root`."""
+    src = os.environ.get("REPRO_STAT_SNAPSHOT")
+    key = os.path.realpath(root)
+    if not src:
+        return None
+    try:
+        doc = json.loads(pathlib.Path(src).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+    if doc.get("root") != key:
+        return None
+    snap = _snapshots[key] = {p: tuple(v) for p, v in doc["files"].items()}  # type: ignore[misc]
+    return snap
+
+
+def _sweep(root: str, tracked: Set[str], tracked_dirs: Set[str]) -> Tuple[Snapshot, List[str]]:
+    """lstat tracked files by listing only directories that contain some; untracked names become candidates."""
+    stats: Snapshot = {}
+    untracked: List[str] = []
+    stack = [""]
+    while stack:
+        rel = stack.pop()
+        try:
+            it = os.scandir(os.path.join(root, rel) if rel else root)
+        except (FileNotFoundError, NotADirectoryError):
+            continue
+        with it:
+            for e in it:
+                p = rel + e.name
+                if e.name == ".git":
+                    continue
+                if e.is_dir(follow_symlinks=False):
+                    if p in tracked_dirs:
+                        stack.append(p + "/")
+                    else:
+                        untracked.append(p + "/")
+                elif p in tracked:
+                    st = e.stat(follow_symlinks=False)
+                    stats[p] = (st.st_mode, st.st_size, st.st_mtime_ns, st.st_ino)
+                else:
+                    untracked.append(p)
+    return stats, untracked
+
+
+def _untracked_from(snap: Snapshot, tracked: Set[str], tracked_dirs: Set[str]) -> List[str]:
+    out: Dict[str, None] = {}
+    for p in snap:
+        if p in tracked:
+            continue
+        parts = p.split("/")
+        for i in range(1, len(parts)):
+            d = "/".join(parts[:i])
+            if d not in tracked_dirs:
+                out[d + "/"] = None
+                break
+        else:
+            out[p] = None
+    return list(out)
+
+
+def _first_unignored(root: str, candidates: List[str]) -> Optional[str]:
+    """First candidate `git status` would list as untracked, descending into directories that are not ignored."""
+    while candidates:
+        proc = _git(root, ["check-ignore", "--stdin", "-z"], "\0".join(candidates).encode() + b"\0")
+        if proc.returncode not in (0, 1):
+            raise Unsupported("git check-ignore failed")
+        ignored = set(os.fsdecode(p) for p in proc.stdout.split(b"\0") if p)
+        nxt: List[str] = []
+        for c in candidates:
+            if c in ignored:
+                continue
+            if not c.endswith("/"):
+                return c
+            try:
+                with os.scandir(os.path.join(root, c)) as it:
+                    children = [(e.name, e.is_dir(follow_symlinks=False)) for e in it]
+            except OSError:
+                continue
+            if any(name == ".git" for name, _ in children):
+                return c  # nested repository: git lists the directory itself
+            nxt += [c + name + ("/" if is_dir else "") for name, is_dir in children]
+        candidates = nxt
+    return None
+
+
+def _blob_id(path: str, is_link: bool, oid_len: int) -> Optional[bytes]:
+    try:
+        data = os.fsencode(os.readlink(path)) if is_link else pathlib.Path(path).read_bytes()
+    except OSError:
+        return None
+    h = hashlib.sha1() if oid_len == 20 else hashlib.sha256()
+    h.update(b"blob %d\0" % len(data))
+    h.update(data)
+    return h.digest()
+
+
+def _compare(root: str, index: Index, stats: Snapshot, oid_len: int) -> Tuple[Optional[str], List[str]]:
+    """(definite reason the tree is dirty or None, paths whose content git must confirm)."""
+    confirm: List[str] = []
+    hashed = 0
+    for e in index.entries:
+        if e.stage:
+            return f"unmerged: {e.path}", []
+        if e.flags & (_SKIP_WORKTREE | _ASSUME_VALID):
+            continue
+        if e.flags & _INTENT_TO_ADD:
+            return f"added: {e.path}", []
+        st = stats.get(e.path)
+        if st is None:
+            return f"deleted: {e.path}", []
+        mode, size, mtime_ns, ino = st
+        link = stat.S_ISLNK(e.mode)
+        if (stat.S_ISLNK(mode) != link or not (link or stat.S_ISREG(mode))
+                or (not link and bool(mode & 0o100) != bool(e.mode & 0o100))):
+            confirm.append(e.path)
+            continue
+        if (size & 0xFFFFFFFF == e.size and mtime_ns == e.mtime_ns and (not e.ino or ino & 0xFFFFFFFF == e.ino)
+                and mtime_ns < index.mtime_ns):
+            continue
+        hashed += 1
+        if _blob_id(os.path.join(root, e.path), link, oid_len) != e.oid:
+            confirm.append(e.path)
+    metrics.inc("dirty_files_hashed_total", hashed)
+    return None, confirm
+
+
+def _via_git(root: str, untracked: bool, why: str) -> dict:
+    """One `git status`; git applies core.fsmonitor and core.untrackedCache itself when configured."""
+    args = ["status", "--porcelain", "-z"] + ([] if untracked else ["--untracked-files=no"])
+    proc = _git(root, args)
+    if proc.returncode != 0:
+        return {"dirty": False, "engine": "git", "reason": None, "error": "git status failed", "note": why}
+    first = proc.stdout.split(b"\0", 1)[0]
+    return {"dirty": bool(first), "engine": "git", "reason": os.fsdecode(first[3:]) if first else None, "note": why}
+
+
+def dirty_state(root: str = ".", untracked: bool = True, snapshot: Optional[Snapshot] = None,
+                engine: Optional[str] = None) -> dict:
+    """Would `git status --porcelain` (or `git describe --dirty`, with untracked=False) report changes?
+
+    Returns {"dirty", "engine": "index" | "git", "reason"}: reason names the first change found.
+    `engine` (default $REPRO_DIRTY_ENGINE, else "git") picks how: "git" runs one `git status`;
+    "index" compares the index against stat data, from `snapshot` or one this process or
+    REPRO_STAT_SNAPSHOT already holds for the tree, else from lstat calls of its own.
+    """
+    engine = engine or os.environ.get("REPRO_DIRTY_ENGINE", "git")
+    if engine not in ("index", "git"):
+        raise ValueError(f"unknown dirty-check engine {engine!r}")
+    root, git_dir = _git_dir(os.path.realpath(root))
+    if engine == "git" or git_dir is None:
+        return _via_git(root, untracked, "default" if engine == "git" else "no .git directory")
+    g = git_info.get(root)
+    head_tree = g.rev_parse("HEAD^{tree}")
+    oid_len = len(head_tree) // 2 if head_tree else 20
+    with metrics.phase("dirty_check"):
+        try:
+            index = read_index(git_dir, oid_len)
+        except Unsupported as e:
+            return _via_git(root, untracked, str(e))
+        if b"FSMN" in index.extensions:
+            return _via_git(root, untracked, "fsmonitor")
+        result = {"dirty": True, "engine": "index", "reason": None}
+        if head_tree is None:
+            if index.entries:
+                return dict(result, reason="no commits yet")
+        elif index.tree is not None:
+            if index.tree.hex() != head_tree:
+                return dict(result, reason="staged changes")
+        elif _git(root, ["diff-index", "--cached", "--quiet", "HEAD", "--"]).returncode != 0:
+            return dict(result, reason="staged changes")
+        tracked = {e.path for e in index.entries}
+        tracked_dirs = _parent_dirs(tracked)
+        snap = snapshot if snapshot is not None else _snapshots.get(root) or load_snapshot(root)
+        if snap is not None:
+            metrics.cache("stat_snapshot", True)
+            stats, candidates = snap, (_untracked_from(snap, tracked, tracked_dirs) if untracked else [])
+        elif untracked:
+            stats, candidates = _sweep(root, tracked, tracked_dirs)
+        else:
+            stats, candidates = {}, []
+            for p in tracked:
+                try:
+                    st = os.lstat(os.path.join(root, p))
+                except OSError:
+                    continue
+                stats[p] = (st.st_mode, st.st_size, st.st_mtime_ns, st.st_ino)
+        metrics.inc("dirty_entries_checked_total", len(index.entries))
+        reason, confirm = _compare(root, index, stats, oid_len)
+        if reason:
+            return dict(result, reason=reason)
+        if confirm:
+            args = ["diff", "--quiet", "--no-ext-diff", "--"] + ([":(literal)" + p for p in confirm] if len(confirm) <= _CONFIRM_MAX else [])
+            if _git(root, args).returncode != 0:
+                return dict(result, reason=f"modified: {confirm[0]}" if len(confirm) == 1 else "modified files")
+        try:
+            first = _first_unignored(root, candidates)
+        except Unsupported as e:
+            return _via_git(root, untracked, str(e))
+        if first:
+            return dict(result, reason=f"untracked: {first}")
+    return dict(result, dirty=False)
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Report whether a git working tree has changes")
+    ap.add_argument("root", nargs="?", default=".")
+    ap.add_argument("--untracked-files", choices=["normal", "no"], default="normal")
+    ap.add_argument("--engine", choices=["index", "git"])
+    args = ap.parse_args()
+    state = dirty_state(args.root, untracked=args.untracked_files == "normal", engine=args.engine)
+    print(json.dumps(state, sort_keys=True, separators=(",", ":")))
+
+
+if __name__ == "__main__":
+    profiling.run(main)
@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+"""Shared git queries for the tools, one long-lived git process per repository.
+
+GitInfo keeps a `git cat-file --batch-check` pipe open and answers object
+questions over it: does a commit exist (vel_validator), what does HEAD or a
+tag resolve to (version_stamp, make_vel_manifest). Queries are pipelined in
+batches, so checking 1,000 manifests' commits costs one git process instead
+of 1,000. Other git commands (describe, ...) go through cached(), which runs
+each distinct command once per process.
+
+    from tools import git_info
+    g = git_info.get()                  # per process and working directory
+    g.rev_parse("HEAD"); g.commit_exists(sha); g.describe("--tags", "--always")
+"""
+from __future__ import annotations
+
+import atexit
+import os
+import subprocess
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from tools import metrics
+
+__all__ = ["GitInfo", "get"]
+
+_PIPELINE = 256  # queries in flight; keeps both pipe directions well under the OS buffer size
+_instances: Dict[str, "GitInfo"] = {}
+_instances_lock = threading.Lock()
+
+
+class GitInfo:
+    """Git queries for the repository containing `cwd` (default: the current directory)."""
+
+    def __init__(self, cwd: Optional[str] = None) -> None:
+        self.cwd = cwd
+        self._proc: Optional[subprocess.Popen] = None
+        self._state = "new"  # new | open | git_missing | failed
+        self._lock = threading.Lock()
+        self._objects: Dict[str, Optional[Tuple[str, str]]] = {}
+        self._outputs: Dict[Tuple[str, ...], Optional[str]] = {}
+
+    def _start(self) -> bool:
+        if self._state == "new":
+            try:
+                self._proc = subprocess.Popen(["git", "cat-file", "--batch-check"], cwd=self.cwd, stdin=subprocess.PIPE,
+                                              stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True, bufsize=1 << 16)
+                self._state = "open"
+                metrics.inc("git_processes_total")
+            except OSError:
+                self._state = "git_missing"
+        return self._state == "open"
+
+    def _query(self, names: List[str]) -> None:
+        """Resolve names not seen before into self._objects: (sha, type), or None if missing."""
+        todo = [n for n in dict.fromkeys(names) if n not in self._objects]
+        for n in names:
+            metrics.cache("git_object", n not in todo)
+        if not todo or not self._start():
+            return
+        proc = self._proc
+        for i in range(0, len(todo), _PIPELINE):
+            batch = todo[i:i + _PIPELINE]
+            try:
+                proc.stdin.write("".join(n + "\n" for n in batch))  # type: ignore[union-attr]
+                proc.stdin.flush()  # type: ignore[union-attr]
+                lines = [proc.stdout.readline() for _ in batch]  # type: ignore[union-attr]
+            except (OSError, ValueError):
+                lines = []
+            if len(lines) < len(batch) or not all(lines):
+                # git exited (e.g. not a repository): every answer from here on is "not found".
+                self._state = "failed"
+                self.close()
+                for n in todo[i:]:
+                    self._objects.setdefault(n, None)
+                return
+            for n, line in zip(batch, lines):
+                parts = line.split()
+                self._objects[n] = (parts[0], parts[1]) if len(parts) == 3 else None
+
+    def _status(self) -> str:
+        return "git_missing" if self._state == "git_missing" else "not_found"
+
+    def lookup(self, names: Iterable[str]) -> Dict[str, Optional[Tuple[str, str]]]:
+        """(sha, type) for each object name or revision expression, None if git cannot resolve it."""
+        names = list(names)
+        if any("\n" in n for n in names):
+            raise ValueError("object names cannot contain newlines")
+        with self._lock:
+            self._query(names)
+            return {n: self._objects.get(n) for n in names}
+
+    def commit_status(self, shas: Iterable[str]) -> Dict[str, Tuple[bool, str]]:
+        """sha -> (exists, "present" | "not_found" | "git_missing") for many commits in one pipelined pass."""
+        shas = list(shas)
+        # A name with a newline would split into two cat-file queries; it cannot be a commit.
+        found = self.lookup(f"{s}^{{commit}}" for s in shas if "\n" not in s)
+        out: Dict[str, Tuple[bool, str]] = {}
+        for s in shas:
+            if "\n" in s:
+                out[s] = (False, "not_found")
+            else:
+                out[s] = (True, "present") if found[f"{s}^{{commit}}"] else (False, self._status())
+        return out
+
+    def commit_exists(self, sha: str) -> Tuple[bool, str]:
+        return self.commit_status([sha])[sha]
+
+    def rev_parse(self, rev: str = "HEAD") -> Optional[str]:
+        """Object id `rev` resolves to (like `git rev-parse rev`), answered over the cat-file pipe."""
+        hit = self.lookup([rev])[rev]
+        return hit[0] if hit else None
+
+    def cached(self, *args: str) -> Optional[str]:
+        """Stripped stdout of `git <args>`, run at most once per process; None if git fails."""
+        with self._lock:
+            if args in self._outputs:
+                metrics.cache("git_command", True)
+                return self._outputs[args]
+        metrics.cache("git_command", False)
+        metrics.inc("git_processes_total")
+        try:
+            out: Optional[str] = subprocess.check_output(["git", *args], cwd=self.cwd, text=True, stderr=subprocess.DEVNULL).strip()
+        except (OSError, subprocess.CalledProcessError):
+            out = None
+        with self._lock:
+            self._outputs[args] = out
+        return out
+
+    def describe(self, *args: str) -> Optional[str]:
+        return self.cached("describe", *args)
+
+    def close(self) -> None:
+        proc, self._proc = self._proc, None
+        if proc is not None:
+            try:
+                proc.stdin.close()  # type: ignore[union-attr]
+                proc.wait(timeout=5)
+            except (OSError, subprocess.TimeoutExpired):
+                proc.kill()
+            if proc.stdout is not None:
+                proc.stdout.close()
+        if self._state == "open":
+            self._state = "new"
+
+
+def get(cwd: Optional[str] = None) -> GitInfo:
+    """The process-wide GitInfo for `cwd` (default: the current directory)."""
+    key = os.path.realpath(cwd or os.getcwd())
+    with _instances_lock:
+        g = _instances.get(key)
+        if g is None:
+            g = _instances[key] = GitInfo(key)
+        return g
+
+
+@atexit.register
+def _close_all() -> None:
+    for g in list(_instances.values()):
+        g.close()
@@ -1,13 +1,409 @@
+"""Shared file reading and hashing engine used by the tools.
+
+Reads go through an adaptive strategy chosen from the file size:
+  read      small files: one exact-size read, no large buffer to touch
+  readinto  medium files: reused per-thread buffer, POSIX_FADV_SEQUENTIAL
+  mmap      large files: hashed straight from the page cache, no copy
+  stream    huge files: readinto + FADV_SEQUENTIAL, dropping pages behind the
+            reader (FADV_DONTNEED) so shared builders keep their page cache
+Thresholds come from scripts/bench_io.py and can be overridden with
+REPRO_IO_SMALL_MAX, REPRO_IO_MMAP_MIN and REPRO_IO_DROP_CACHE_MIN (bytes).
+
+digest_path() computes any set of hashlib digests from that single read pass;
+for large chunks the per-algorithm updates run on threads (hashlib releases
+the GIL), so SHA-256 + SHA-512 + BLAKE2b cost about one read and one hash.
+
+Merkle mode (RFC 6962 tree shape, SHA-256, 0x00 leaf / 0x01 node prefixes)
+hashes fixed-size chunks in parallel with pread. Its root plus an O(log n)
+inclusion proof lets a verifier check one chunk, or one file of an RBOM
+artifact list (tree_root), without rehashing everything else.
+
+fingerprint_path()/fingerprint_bytes() are for internal change detection only
+(caches, dedup, "did this input change"); anything published stays SHA-256.
+The backend is BLAKE2b on every host, so fingerprints kept in caches stay valid
+across runs and runners; REPRO_FINGERPRINT selects blake3, xxh3_128 (xxhash) or
+sha256 instead. Values carry an "<algorithm>:" prefix so fingerprints from
+different backends never compare equal.
+
+prefetch_ordered() reads the next files of a fixed sequence on background
+threads while the caller consumes the current one, handing the contents back
+strictly in input order. Buffered bytes are capped (REPRO_PREFETCH_BYTES,
+default 64 MiB; REPRO_PREFETCH_WORKERS=0 disables it); larger files are not
+prefetched and come back as None, for the caller to stream itself.
+
+cache_dir() is the on-disk cache root shared by the tools: REPRO_CACHE_DIR,
+default $XDG_CACHE_HOME/repro-build (~/.cache/repro-build); "off" disables it.
+"""
 from __future__ import annotations
-import hashlib, os
+import hashlib, json, mmap, os, threading, time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Union
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple, TypeVar, Union
+from tools import metrics
+
 BufSize = 4 << 20
-def sha256_path(path: Union[str, Path]) -> str:
-    p=Path(path); h=hashlib.sha256(); buf=bytearray(BufSize); mv=memoryview(buf)
-    with p.open('rb', buffering=0) as f:
+SMALL_FILE_MAX = int(os.environ.get("REPRO_IO_SMALL_MAX", 256 << 10))
+MMAP_MIN = int(os.environ.get("REPRO_IO_MMAP_MIN", 1 << 20))
+DROP_CACHE_MIN = int(os.environ.get("REPRO_IO_DROP_CACHE_MIN", 1 << 30))
+STRATEGIES = ("read", "readinto", "mmap", "stream")
+DEFAULT_ALGORITHMS = ("sha256",)
+FANOUT_MIN = int(os.environ.get("REPRO_HASH_FANOUT_MIN", 1 << 20))
+MERKLE_CHUNK = int(os.environ.get("REPRO_MERKLE_CHUNK", 4 << 20))
+FINGERPRINT_BACKENDS = ("blake3", "xxh3_128", "blake2b", "sha256")
+# Fixed, not picked per host: fingerprints end up in persistent caches and action keys.
+DEFAULT_FINGERPRINT = "blake2b"
+_FP_MEMO_MAX = 1 << 16
+_FP_RACY_NS = 2_000_000_000
+_MMAP_SLICE = 16 << 20
+PREFETCH_BYTES = int(os.environ.get("REPRO_PREFETCH_BYTES", 64 << 20))
+_PREFETCH_GROUP_FILES = 64
+_PREFETCH_GROUP_BYTES = 1 << 20
+T = TypeVar("T")
+_local = threading.local()
+_pool: Optional[ThreadPoolExecutor] = None
+_pool_lock = threading.Lock()
+_fp_backend: Optional[str] = None
+_fp_memo: Dict[tuple, str] = {}
+
+def _buffer() -> memoryview:
+    """Per-thread reusable read buffer (allocated once per thread, BufSize bytes)."""
+    mv = getattr(_local, "buf", None)
+    if mv is None:
+        mv = _local.buf = memoryview(bytearray(BufSize))
+    return mv
+
+def choose_strategy(size: int) -> str:
+    if size <= SMALL_FILE_MAX: return "read"
+    if size >= DROP_CACHE_MIN: return "stream"
+    if size >= MMAP_MIN: return "mmap"
+    return "readinto"
+
+def _fadvise(fd: int, offset: int, length: int, advice_name: str) -> None:
+    advice = getattr(os, advice_name, None)
+    if advice is None or not hasattr(os, "posix_fadvise"): return
+    try: os.posix_fadvise(fd, offset, length, advice)
+    except OSError: pass
+
+def read_chunks(path: Union[str, Path], consume: Callable[[memoryview], object], strategy: Optional[str] = None) -> int:
+    """Feed the contents of `path` to `consume` in order and return the byte count.
+
+    Chunks may be views of a reused buffer or of a mapping: `consume` must not
+    keep a reference after it returns.
+    """
+    with open(path, "rb", buffering=0) as f:
+        fd = f.fileno(); size = os.fstat(fd).st_size
+        strategy = strategy or choose_strategy(size)
+        metrics.inc(f"io_{strategy}_files_total")
+        if strategy == "read":
+            data = f.readall()
+            if data: consume(memoryview(data))
+            return len(data)
+        if strategy == "mmap" and size > 0:
+            with mmap.mmap(fd, 0, access=mmap.ACCESS_READ) as mm:
+                if hasattr(mm, "madvise") and hasattr(mmap, "MADV_SEQUENTIAL"): mm.madvise(mmap.MADV_SEQUENTIAL)
+                with memoryview(mm) as whole:
+                    for off in range(0, len(mm), _MMAP_SLICE):
+                        with whole[off:off + _MMAP_SLICE] as part: consume(part)
+                return len(mm)
+        if strategy not in STRATEGIES: raise ValueError(f"unknown I/O strategy: {strategy}")
+        drop = strategy == "stream"; mv = _buffer(); total = 0; dropped = 0
+        _fadvise(fd, 0, 0, "POSIX_FADV_SEQUENTIAL")
         while True:
-            n=f.readinto(mv)
+            n = f.readinto(mv)
             if not n: break
-            h.update(mv[:n])
-    return h.hexdigest()
+            consume(mv[:n]); total += n
+            if drop and total - dropped >= 8 * BufSize:
+                _fadvise(fd, dropped, total - dropped, "POSIX_FADV_DONTNEED"); dropped = total
+        if drop: _fadvise(fd, 0, 0, "POSIX_FADV_DONTNEED")
+        return total
+
+def _hash_pool() -> ThreadPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=max(2, min(4, os.cpu_count() or 1)), thread_name_prefix="repro-hash")
+        return _pool
+
+def _algorithm_key(name: str) -> str:
+    """Canonical spelling of an algorithm name: "SHA-256" -> "sha256", "sha3-256" -> "sha3_256", "xxh3-128" -> "xxh3_128"."""
+    key = name.lower()
+    return key.replace("-", "") if key in ("sha-1", "sha-224", "sha-256", "sha-384", "sha-512") else key.replace("-", "_")
+
+def new_hashers(algorithms: Iterable[str]) -> Dict[str, "hashlib._Hash"]:
+    """Return {name: hash object} for hashlib algorithm names; ValueError if unsupported."""
+    out: Dict[str, "hashlib._Hash"] = {}
+    for name in algorithms:
+        key = _algorithm_key(name)
+        if key in out: continue
+        try: h = hashlib.new(key)
+        except (ValueError, TypeError): raise ValueError(f"unsupported digest algorithm: {name}") from None
+        if not h.digest_size: raise ValueError(f"unsupported digest algorithm: {name} (variable length)")
+        out[key] = h
+    if not out: raise ValueError("no digest algorithms requested")
+    return out
+
+def _multi_update(hashers: Dict[str, "hashlib._Hash"]) -> Callable[[memoryview], None]:
+    hs = list(hashers.values())
+    if len(hs) == 1: return hs[0].update
+    pool = _hash_pool()
+    def update(chunk: memoryview) -> None:
+        if len(chunk) < FANOUT_MIN:
+            for h in hs: h.update(chunk)
+            return
+        futures = [pool.submit(h.update, chunk) for h in hs[1:]]
+        hs[0].update(chunk)
+        for fut in futures: fut.result()
+    return update
+
+def digest_path(path: Union[str, Path], algorithms: Iterable[str] = DEFAULT_ALGORITHMS, strategy: Optional[str] = None) -> Dict[str, str]:
+    """Hash `path` once with every algorithm in `algorithms`; return {name: hexdigest}."""
+    hashers = new_hashers(algorithms); t0 = time.perf_counter()
+    total = read_chunks(path, _multi_update(hashers), strategy)
+    metrics.inc("bytes_read_total", total); metrics.inc("files_hashed_total"); metrics.observe("hash_file_seconds", time.perf_counter() - t0)
+    return {name: h.hexdigest() for name, h in hashers.items()}
+
+def sha256_path(path: Union[str, Path], strategy: Optional[str] = None) -> str:
+    return digest_path(path, DEFAULT_ALGORITHMS, strategy)["sha256"]
+
+def _fingerprint_factory(name: str) -> Optional[Callable[[], object]]:
+    """Hash constructor for a fingerprint backend, or None if its module is not installed."""
+    if name == "blake3":
+        try: from blake3 import blake3
+        except ImportError: return None
+        return blake3
+    if name == "xxh3_128":
+        try: from xxhash import xxh3_128
+        except ImportError: return None
+        return xxh3_128
+    if name in ("blake2b", "sha256"): return getattr(hashlib, name)
+    raise ValueError(f"unknown fingerprint backend: {name}")
+
+def fingerprint_backend() -> str:
+    """Name of the fingerprint algorithm in use: REPRO_FINGERPRINT, else DEFAULT_FINGERPRINT."""
+    global _fp_backend
+    if _fp_backend is None:
+        want = _algorithm_key(os.environ.get("REPRO_FINGERPRINT", DEFAULT_FINGERPRINT))
+        if _fingerprint_factory(want) is None: raise ValueError(f"fingerprint backend not installed: {want}")
+        _fp_backend = want
+    return _fp_backend
+
+def _new_fingerprinter(backend: Optional[str]) -> Tuple[str, object]:
+    name = backend or fingerprint_backend(); factory = _fingerprint_factory(name)
+    if factory is None: raise ValueError(f"fingerprint backend not installed: {name}")
+    return name, factory()
+
+def fingerprint_bytes(data: Union[bytes, memoryview], backend: Optional[str] = None) -> str:
+    """"<algorithm>:<hex>" of `data`; internal use only, never a published digest."""
+    name, h = _new_fingerprinter(backend); h.update(data)
+    return f"{name}:{h.hexdigest()}"
+
+def fingerprint_path(path: Union[str, Path], strategy: Optional[str] = None, backend: Optional[str] = None) -> str:
+    """"<algorithm>:<hex>" of the contents of `path`; internal use only.
+
+    Results are memoized per process on (path, device, inode, size, mtime,
+    ctime), except for files modified in the last two seconds whose mtime
+    cannot yet be trusted to change on the next write.
+    """
+    name, h = _new_fingerprinter(backend); st = os.stat(path)
+    key = (os.fspath(path), st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns, st.st_ctime_ns, name)
+    hit = _fp_memo.get(key); metrics.cache("fingerprint", hit is not None)
+    if hit is not None: return hit
+    t0 = time.perf_counter(); total = read_chunks(path, h.update, strategy)
+    metrics.inc("bytes_read_total", total); metrics.inc("files_fingerprinted_total"); metrics.observe("fingerprint_file_seconds", time.perf_counter() - t0)
+    fp = f"{name}:{h.hexdigest()}"
+    if time.time_ns() - st.st_mtime_ns > _FP_RACY_NS:
+        if len(_fp_memo) >= _FP_MEMO_MAX: _fp_memo.clear()
+        _fp_memo[key] = fp
+    return fp
+
+def _read_exact(path: Union[str, Path], size: int) -> bytes:
+    # At most `size` bytes, as a synchronous copy of a member of that size would take;
+    # a short result is left for the caller to report.
+    with open(path, "rb", buffering=0) as f:
+        data = f.read(size)
+        while 0 < len(data) < size:
+            more = f.read(size - len(data))
+            if not more: break
+            data += more
+    metrics.inc("prefetch_bytes_total", len(data))
+    return data
+
+def prefetch_workers() -> int:
+    return max(0, int(os.environ.get("REPRO_PREFETCH_WORKERS", min(8, os.cpu_count() or 1))))
+
+def _read_group(group: Sequence[Tuple[object, Optional[Union[str, Path]], int]], cap: int) -> List[Optional[bytes]]:
+    return [None if path is None or size > cap else _read_exact(path, size) for _, path, size in group]
+
+def prefetch_ordered(items: Iterable[Tuple[T, Optional[Union[str, Path]], int]], workers: Optional[int] = None,
+                     max_bytes: Optional[int] = None) -> Iterator[Tuple[T, Optional[bytes]]]:
+    """Yield (item, contents) for (item, path, size) triples, in input order, reading ahead on threads.
+
+    contents is None when path is None or size exceeds `max_bytes`; at most
+    `max_bytes` of read-ahead data is held at once. Consecutive small files
+    are read as one task (up to _PREFETCH_GROUP_FILES / _PREFETCH_GROUP_BYTES)
+    so thread hand-offs do not cost more than the reads they hide. Read
+    errors surface when their item is reached, as for a synchronous read.
+    """
+    workers = prefetch_workers() if workers is None else workers
+    cap = PREFETCH_BYTES if max_bytes is None else max_bytes
+    if workers <= 0 or cap <= 0:
+        for item, _, _ in items: yield item, None
+        return
+    source = iter(items); window: deque = deque(); held = 0; nxt = None; done = False
+    pool = ThreadPoolExecutor(workers, thread_name_prefix="prefetch")
+    try:
+        while True:
+            # Top up the window in input order; stop at the first file that does not fit the budget.
+            while len(window) < 2 * workers and not done:
+                group, nbytes, full = [], 0, False
+                while len(group) < _PREFETCH_GROUP_FILES and nbytes < _PREFETCH_GROUP_BYTES:
+                    if nxt is None:
+                        nxt = next(source, None)
+                        if nxt is None: done = True; break
+                    need = nxt[2] if nxt[1] is not None and nxt[2] <= cap else 0
+                    if need and held + nbytes + need > cap and (window or group): full = True; break
+                    group.append(nxt); nbytes += need; nxt = None
+                if group:
+                    window.append((group, pool.submit(_read_group, group, cap))); held += nbytes
+                if full: break
+            if not window: return
+            group, fut = window.popleft()
+            if not fut.done():
+                t0 = time.perf_counter(); fut.exception(); metrics.observe("prefetch_wait_seconds", time.perf_counter() - t0)
+            try:
+                contents: Optional[List[Optional[bytes]]] = fut.result()
+            except OSError:
+                contents = None  # re-read one by one below so the error is raised at its own item
+            for i, (item, _path, size) in enumerate(group):
+                data = contents[i] if contents is not None else _read_group([group[i]], cap)[0]
+                if data is not None: held -= size
+                yield item, data
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+
+def merkle_leaf(data: bytes) -> bytes:
+    return hashlib.sha256(b"\x00" + bytes(data)).digest()
+
+def _merkle_node(left: bytes, right: bytes) -> bytes:
+    return hashlib.sha256(b"\x01" + left + right).digest()
+
+def _split(n: int) -> int:
+    # Largest power of two strictly smaller than n (RFC 6962 section 2.1).
+    return 1 << ((n - 1).bit_length() - 1)
+
+def merkle_root(leaves: Sequence[bytes]) -> bytes:
+    """Root of the tree over leaf hashes (an empty list hashes to SHA-256 of nothing)."""
+    if not leaves: return hashlib.sha256(b"").digest()
+    level = list(leaves)
+    # Bottom-up pairing with the odd node carried up gives the same root as RFC 6962's split.
+    while len(level) > 1:
+        nxt = [_merkle_node(level[i], level[i + 1]) for i in range(0, len(level) - 1, 2)]
+        if len(level) % 2: nxt.append(level[-1])
+        level = nxt
+    return level[0]
+
+def merkle_proof(leaves: Sequence[bytes], index: int) -> List[bytes]:
+    """Audit path (sibling hashes, leaf to root) proving leaves[index]."""
+    if not 0 <= index < len(leaves): raise IndexError(index)
+    proof: List[bytes] = []; lo, hi = 0, len(leaves)
+    while hi - lo > 1:
+        k = _split(hi - lo)
+        if index < lo + k: proof.append(merkle_root(leaves[lo + k:hi])); hi = lo + k
+        else: proof.append(merkle_root(leaves[lo:lo + k])); lo = lo + k
+    return proof[::-1]
+
+def merkle_verify(leaf: bytes, index: int, count: int, proof: Sequence[bytes], root: bytes) -> bool:
+    """Check an audit path in O(log n) (RFC 9162 section 2.1.3.2)."""
+    if not 0 <= index < count: return False
+    fn, sn, r = index, count - 1, leaf
+    for p in proof:
+        if sn == 0: return False
+        if fn & 1 or fn == sn:
+            r = _merkle_node(p, r)
+            while not fn & 1 and fn != 0: fn >>= 1; sn >>= 1
+        else:
+            r = _merkle_node(r, p)
+        fn >>= 1; sn >>= 1
+    return sn == 0 and r == root
+
+def chunk_leaves(path: Union[str, Path], indices: Iterable[int], chunk_size: int = MERKLE_CHUNK) -> List[bytes]:
+    """Leaf hashes of the given chunk indices, read with pread on the shared hash pool."""
+    idx = list(indices)
+    with open(path, "rb", buffering=0) as f:
+        fd = f.fileno()
+        def leaf(i: int) -> bytes:
+            data = os.pread(fd, chunk_size, i * chunk_size)
+            metrics.inc("bytes_read_total", len(data))
+            return merkle_leaf(data)
+        if len(idx) <= 1: return [leaf(i) for i in idx]
+        return list(_hash_pool().map(leaf, idx))
+
+def merkle_leaves_path(path: Union[str, Path], chunk_size: int = MERKLE_CHUNK) -> List[bytes]:
+    """All chunk leaf hashes of `path` (an empty file has one empty leaf)."""
+    size = os.stat(path).st_size
+    return chunk_leaves(path, range(max(1, -(-size // chunk_size))), chunk_size)
+
+def merkle_path(path: Union[str, Path], chunk_size: int = MERKLE_CHUNK, leaves_out: Optional[List[bytes]] = None) -> Dict[str, object]:
+    """{"root", "chunk_size", "leaf_count", "size"} for `path`; leaf hashes go to `leaves_out` if given."""
+    t0 = time.perf_counter(); leaves = merkle_leaves_path(path, chunk_size)
+    metrics.observe("merkle_file_seconds", time.perf_counter() - t0)
+    if leaves_out is not None: leaves_out.extend(leaves)
+    return {"root": merkle_root(leaves).hex(), "chunk_size": chunk_size, "leaf_count": len(leaves), "size": os.stat(path).st_size}
+
+def verify_chunks(path: Union[str, Path], indices: Iterable[int], root_hex: str, leaves: Sequence[bytes], chunk_size: int = MERKLE_CHUNK) -> Tuple[bool, List[int]]:
+    """Rehash only `indices` of `path` and prove each against the published root.
+
+    `leaves` (e.g. from a .merkle.json sidecar) is untrusted: it only supplies
+    the sibling hashes, every proof is checked against `root_hex`.
+    """
+    idx = sorted(set(indices)); root = bytes.fromhex(root_hex); bad: List[int] = []
+    if list(leaves) and merkle_root(leaves) != root: leaves = []  # tampered sidecar: every proof fails
+    for i, got in zip(idx, chunk_leaves(path, idx, chunk_size)):
+        if not (0 <= i < len(leaves)) or not merkle_verify(got, i, len(leaves), merkle_proof(leaves, i), root): bad.append(i)
+    return (not bad, bad)
+
+def parse_chunk_range(text: str) -> range:
+    """"N" or "START:END" (end exclusive) -> range of chunk indices."""
+    start, sep, end = text.partition(":")
+    try: r = range(int(start), int(end) if sep else int(start) + 1)
+    except ValueError: raise ValueError(f"bad chunk range: {text!r}") from None
+    if r.start < 0 or len(r) == 0: raise ValueError(f"bad chunk range: {text!r}")
+    return r
+
+def load_merkle_leaves(path: Union[str, Path]) -> List[bytes]:
+    """Leaf hashes from a .merkle.json sidecar ({"leaves": [hex, ...], ...})."""
+    doc = json.loads(Path(path).read_text(encoding="utf-8"))
+    return [bytes.fromhex(h) for h in doc.get("leaves", [])]
+
+def tree_leaf(name: str, sha256_hex: str) -> bytes:
+    """Leaf for one file of a directory tree: H(0x00 || name || 0x00 || sha256)."""
+    return merkle_leaf(name.encode("utf-8") + b"\x00" + bytes.fromhex(sha256_hex))
+
+def tree_entries(artifacts: Iterable[Dict[str, object]]) -> List[Tuple[str, str]]:
+    """(name, sha256) pairs of an RBOM artifact list in tree (sorted name) order."""
+    return sorted((str(a["name"]), str(a["sha256"]).lower()) for a in artifacts)
+
+def tree_root(artifacts: Iterable[Dict[str, object]]) -> str:
+    return merkle_root([tree_leaf(n, h) for n, h in tree_entries(artifacts)]).hex()
+
+def tree_proof(artifacts: Iterable[Dict[str, object]], name: str) -> Tuple[int, int, List[bytes]]:
+    """(index, count, audit path) for `name` in the RBOM tree; KeyError if absent."""
+    entries = tree_entries(artifacts); names = [n for n, _ in entries]
+    if name not in names: raise KeyError(name)
+    i = names.index(name); leaves = [tree_leaf(n, h) for n, h in entries]
+    return i, len(leaves), merkle_proof(leaves, i)
+
+def verify_workers(workers: Optional[int], jobs: int) -> int:
+    """Process count for `jobs` independent checks: `workers`, else REPRO_VERIFY_WORKERS, else the CPU count."""
+    workers = int(os.environ.get("REPRO_VERIFY_WORKERS", os.cpu_count() or 1)) if workers is None else workers
+    return max(1, min(workers, jobs))
+
+def cache_dir(name: str) -> Optional[Path]:
+    """Directory `name` under the tools' cache root, created on demand; None when caching is off or the root is unwritable."""
+    root = os.environ.get("REPRO_CACHE_DIR") or os.path.join(os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache"), "repro-build")
+    if root == "off": return None
+    d = Path(root) / name
+    try: d.mkdir(parents=True, exist_ok=True)
+    except OSError: return None
+    return d
@@ -1,5 +1,7 @@
 #!/usr/bin/env python3
 import argparse, json, glob, pathlib, sys
+if __package__ in (None, ""): sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[1]))
+from tools import profiling
 def is_canonical(text:str)->bool:
     try:
         obj=json.loads(text)
@@ -21,4 +23,4 @@ def main():
     pathlib.Path(args.out).write_text(json.dumps(out, sort_keys=True, separators=(",",":")), encoding="utf-8")
     print("JSON canonical check:", "PASS" if out["ok"] else "FAIL")
     sys.exit(0)
-if __name__=="__main__": main()
+if __name__=="__main__": profiling.run(main)
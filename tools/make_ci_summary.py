@@ -1,6 +1,8 @@
 #!/usr/bin/env python3
 from __future__ import annotations
-import json, pathlib, datetime
+import json, pathlib, datetime, sys
+if __package__ in (None, ""): sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[1]))
+from tools import profiling
 FILES=["evidence_index.json","pins_report.json","permissions_report.json","tar_check.json","gzip_check.json","reports/repro.md.json"]
 def load(p): 
     pp=pathlib.Path(p)
@@ -19,4 +21,4 @@ def main():
     for f,m in rows: md.append(f"- {m} `{f}`")
     pathlib.Path("CI_SUMMARY.md").write_text("\n".join(md)+"\n", encoding="utf-8")
     print("Wrote CI_SUMMARY.md")
-if __name__=="__main__": main()
+if __name__=="__main__": profiling.run(main)
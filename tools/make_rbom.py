@@ -2,64 +2,110 @@
 """RBOM helpers with the API shape expected by tests."""
 from __future__ import annotations
 
-import hashlib
+import argparse
+import glob
 import json
+import sys
 from datetime import datetime, timezone
 from pathlib import Path
 from typing import Any, Dict, Iterable, List, Tuple
 
-__all__ = ["collect_artifacts", "generate_rbom"]
+if __package__ in (None, ""):
+    # Allow `python -I tools/make_rbom.py`, where the repo root is not on sys.path.
+    sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
 
+from tools import metrics, profiling
+from tools.io_utils import digest_path, merkle_path, tree_root
 
-def _sha256_file(p: Path, bufsize: int = 1024 * 1024) -> str:
-    h = hashlib.sha256()
-    with p.open("rb") as f:
-        while True:
-            chunk = f.read(bufsize)
-            if not chunk:
-                break
-            h.update(chunk)
-    return h.hexdigest()
+__all__ = ["collect_artifacts", "collect_inputs", "generate_rbom"]
 
 
 def collect_artifacts(
     root: str | Path = ".",
     extensions: Iterable[str] | None = None,
+    algorithms: Iterable[str] | None = None,
+    merkle: bool = False,
 ) -> List[Dict[str, Any]]:
     """
     Walk `root` and return a list of artifact dicts:
       { "name": <relative path>, "path": <absolute path>, "size": <int>, "sha256": <hex> }
     Tests expect dictionaries (not Path objects).
+
+    `algorithms` adds one key per extra hashlib digest (e.g. "sha512", "blake2b"),
+    computed in the same read pass as sha256. `merkle` adds "merkle_root" and
+    "merkle_chunk_size" (chunk tree, see io_utils.merkle_path).
     """
     base = Path(root).resolve()
     artifacts: List[Dict[str, Any]] = []
     allow_ext = set(e.lower() for e in (extensions or []))
+    algos = ["sha256", *(algorithms or [])]
 
-    for p in sorted(base.rglob("*")):
-        if not p.is_file():
-            continue
-        rel = p.relative_to(base).as_posix()
-
-        if allow_ext:
-            ext = p.suffix.lower()
-            if ext not in allow_ext:
+    with metrics.phase("rbom_collect"):
+        for p in sorted(base.rglob("*")):
+            if not p.is_file():
                 continue
+            rel = p.relative_to(base).as_posix()
 
-        artifacts.append(
-            {
-                "name": rel,
-                "path": str(p),
-                "size": p.stat().st_size,
-                "sha256": _sha256_file(p),
-            }
-        )
+            if allow_ext:
+                ext = p.suffix.lower()
+                if ext not in allow_ext:
+                    continue
+
+            artifacts.append(_artifact(p, rel, algos, merkle))
+    metrics.inc("artifacts_collected_total", len(artifacts))
+    return artifacts
+
+
+def collect_inputs(
+    patterns: Iterable[str],
+    algorithms: Iterable[str] | None = None,
+    merkle: bool = False,
+    exclude: Iterable[str | Path] = (),
+) -> List[Dict[str, Any]]:
+    """
+    Artifact dicts, as collect_artifacts returns, for the files matching `patterns`.
+    Each pattern string may hold several space-separated globs ("out/* VEL_MANIFEST.json").
+    Names are basenames, as safe_paths_check requires; ValueError if two inputs share one.
+    Files in `exclude` (e.g. the RBOM being written) are skipped.
+    """
+    skip = {Path(e).resolve() for e in exclude}
+    paths = set()
+    for pattern in patterns:
+        for pat in pattern.split():
+            paths.update(Path(m).resolve() for m in glob.glob(pat, recursive=True) if Path(m).is_file())
+    by_name: Dict[str, Path] = {}
+    for p in sorted(paths - skip):
+        if p.name in by_name:
+            raise ValueError(f"two inputs named {p.name}: {by_name[p.name]}, {p}")
+        by_name[p.name] = p
+    algos = ["sha256", *(algorithms or [])]
+    with metrics.phase("rbom_collect"):
+        artifacts = [_artifact(p, name, algos, merkle) for name, p in sorted(by_name.items())]
+    metrics.inc("artifacts_collected_total", len(artifacts))
     return artifacts
 
 
+def _artifact(p: Path, name: str, algos: List[str], merkle: bool) -> Dict[str, Any]:
+    art: Dict[str, Any] = {
+        "name": name,
+        "path": str(p),
+        "size": p.stat().st_size,
+        **digest_path(p, algos),
+    }
+    if merkle:
+        m = merkle_path(p)
+        art["merkle_root"] = m["root"]
+        art["merkle_chunk_size"] = m["chunk_size"]
+    return art
+
+
 def generate_rbom(
     root: str | Path,
     version: str,
     metadata: Dict[str, Any] | None = None,
+    algorithms: Iterable[str] | None = None,
+    merkle: bool = False,
+    artifacts: List[Dict[str, Any]] | None = None,
 ) -> Dict[str, Any]:
     """
     Build an RBOM document with the shape tests assert on:
@@ -69,10 +115,13 @@ def generate_rbom(
       "generated_at": "<iso8601 z>",
       "count": <int>,
       "artifacts": [ {name,path,size,sha256}, ... ],
+      "tree_root": "<hex>",  # merkle=True: root over (name, sha256) of all artifacts
       "metadata": {...}   # optional
     }
+    `artifacts` (e.g. from collect_inputs) replaces the walk of `root`.
     """
-    artifacts = collect_artifacts(root)
+    if artifacts is None:
+        artifacts = collect_artifacts(root, algorithms=algorithms, merkle=merkle)
     doc: Dict[str, Any] = {
         "schema_version": "1.0",
         "release_version": version,
@@ -80,14 +129,44 @@ def generate_rbom(
         "count": len(artifacts),
         "artifacts": artifacts,
     }
+    if merkle:
+        doc["tree_root"] = tree_root(artifacts)
     if metadata:
         doc["metadata"] = metadata
     return doc
 
 
+def main() -> None:
+    # python tools/make_rbom.py <root> <version> > rbom.json
+    # python tools/make_rbom.py --inputs "release_assets/*" --out release_assets/release_bom.json
+    ap = argparse.ArgumentParser()
+    ap.add_argument("root", nargs="?", default=".")
+    ap.add_argument("version", nargs="?", default="v0.0.0")
+    ap.add_argument("--digest", action="append", default=[], metavar="ALG",
+                    help="Extra digest per artifact (e.g. sha512, blake2b); repeatable")
+    ap.add_argument("--merkle", action="store_true",
+                    help="Record per-artifact chunk Merkle roots and the artifact tree_root")
+    ap.add_argument("--inputs", action="append", default=[], metavar="GLOBS",
+                    help="Space-separated globs of the artifacts to list, by basename, instead of walking root; repeatable")
+    ap.add_argument("--out", help="Write the RBOM here instead of stdout")
+    args = ap.parse_args()
+    artifacts = None
+    if args.inputs:
+        try:
+            artifacts = collect_inputs(args.inputs, args.digest, args.merkle, exclude=[args.out] if args.out else [])
+        except ValueError as e:
+            print(f"ERROR: {e}", file=sys.stderr)
+            sys.exit(2)
+        if not artifacts:
+            print(f"ERROR: no files match --inputs {' '.join(args.inputs)}", file=sys.stderr)
+            sys.exit(2)
+    text = json.dumps(generate_rbom(args.root, args.version, algorithms=args.digest, merkle=args.merkle, artifacts=artifacts), indent=2)
+    if args.out:
+        Path(args.out).parent.mkdir(parents=True, exist_ok=True)
+        Path(args.out).write_text(text + "\n", encoding="utf-8")
+    else:
+        print(text)
+
+
 if __name__ == "__main__":
-    # tiny CLI for local checks: python tools/make_rbom.py <root> <version> > rbom.json
-    import sys
-    root = sys.argv[1] if len(sys.argv) > 1 else "."
-    ver = sys.argv[2] if len(sys.argv) > 2 else "v0.0.0"
-    print(json.dumps(generate_rbom(root, ver), indent=2))
+    profiling.run(main)
@@ -1,6 +1,8 @@
 #!/usr/bin/env python3
-import json, pathlib, os
+import json, pathlib, os, sys
 from typing import Dict, Any
+if __package__ in (None, ""): sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[1]))
+from tools import profiling
 from tools.config import get_path
 def compute_field_metrics(_: str) -> Dict[str, Any]:
     return {"phi_kappa_ratio":"1.46282301","phi_matrix":[[1,0],[0,1]],"input_count":42}
@@ -11,4 +13,4 @@ def main():
     snap={"version":"v0.9-P1B-decimal","input_vector_sha256":"deadbeef"*8, **m}
     OUT.write_text(json.dumps(snap, sort_keys=True, separators=(",",":")), encoding="utf-8")
     print(f"Wrote {OUT}")
-if __name__=="__main__": main()
+if __name__=="__main__": profiling.run(main)
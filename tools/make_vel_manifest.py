@@ -1,20 +1,89 @@
 #!/usr/bin/env python3
-import argparse, json, os, subprocess, uuid, platform, pathlib
+"""VEL manifest for one artifact, or (--artifacts/--out-dir) one manifest per artifact of a whole set:
+environment and git provenance are computed once and the artifacts hashed on a thread pool."""
+import argparse, glob, json, os, uuid, platform, pathlib, sys, time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+if __package__ in (None, ""): sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[1]))
+from tools import git_info, metrics, profiling
 from tools.config import get_path
-from tools.io_utils import sha256_path
+from tools.cjson import write_canonical_json
+from tools.io_utils import digest_path, merkle_path, verify_workers
 def deterministic_uuid(repo: str, git_sha: str) -> str:
     url=f"https://github.com/{(repo or 'local-repo').strip('/')}".lower()
     ns=uuid.uuid5(uuid.NAMESPACE_URL, url)
     return str(uuid.uuid5(ns, git_sha or "0"*40))
+def artifact_uuid(repo: str, git_sha: str, name: str) -> str:
+    """Per-artifact manifest UUID for batch mode: uuid5 of the artifact name under deterministic_uuid(repo, git_sha)."""
+    return str(uuid.uuid5(uuid.UUID(deterministic_uuid(repo, git_sha)), name))
+def artifact_digests(artifact: str, algorithms=()) -> dict:
+    """provenance fields artifact_<alg> for sha256 plus any extra algorithms, from one read."""
+    algos=["sha256",*algorithms]
+    if not pathlib.Path(artifact).exists(): return {"artifact_sha256":""}
+    return {f"artifact_{k}":v for k,v in digest_path(artifact, algos).items()}
+def merkle_fields(artifact: str, sidecar: str) -> dict:
+    """provenance artifact_merkle_* fields; the leaf hashes go to `sidecar` for partial verification."""
+    leaves=[]; m=merkle_path(artifact, leaves_out=leaves)
+    write_canonical_json({**m, "algorithm":"sha256-merkle", "leaves":[h.hex() for h in leaves]}, sidecar)
+    return {"artifact_merkle_root":m["root"],"artifact_merkle_chunk_size":m["chunk_size"],"artifact_merkle_leaf_count":m["leaf_count"]}
+def base_manifest(repo: str, git_sha: str) -> dict:
+    """Every manifest field that does not depend on the artifact."""
+    return {"vel_schema_version":"1.0","manifest_uuid":deterministic_uuid(repo, git_sha),"license_id":"MIT",
+         "provenance":{"git_sha":git_sha},
+         "environment":{"python_version":platform.python_version(),"system_locale":os.environ.get("LC_ALL","C"),"timezone":os.environ.get("TZ","UTC"),"decimal_context":"28","decimal_rounding":"ROUND_HALF_EVEN"},
+         "results_contract":{"metrics_version":"v0.9-P1B-decimal","canonical_ratio":"1.46282301","input_vector_sha256":"deadbeef"*8,"rounding_precision":8,"pass_fail":True}}
+def expand_artifacts(patterns: List[str]) -> List[str]:
+    """Files matching any pattern (glob, or a directory for all files directly in it), sorted; ValueError on a repeated basename."""
+    paths=set()
+    for pat in patterns:
+        matches=[str(p) for p in pathlib.Path(pat).iterdir()] if pathlib.Path(pat).is_dir() else glob.glob(pat, recursive=True)
+        paths.update(m for m in matches if os.path.isfile(m))
+    names={}
+    for p in sorted(paths):
+        if pathlib.Path(p).name in names: raise ValueError(f"two artifacts named {pathlib.Path(p).name}: {names[pathlib.Path(p).name]}, {p}")
+        names[pathlib.Path(p).name]=p
+    return sorted(paths)
+def _batch_one(base: dict, repo: str, artifact: str, out_dir: str, algorithms: List[str], merkle: bool) -> dict:
+    name=pathlib.Path(artifact).name; out=os.path.join(out_dir, name+".json")
+    doc={**base,"manifest_uuid":artifact_uuid(repo, base["provenance"]["git_sha"], name),"provenance":{**base["provenance"],**artifact_digests(artifact, algorithms)}}
+    if merkle: doc["provenance"].update(merkle_fields(artifact, os.path.join(out_dir, name+".merkle.json")))
+    write_canonical_json(doc, out)
+    return {"artifact":artifact,"manifest":out}
+def make_batch(artifacts: List[str], out_dir: str, algorithms=(), merkle: bool=False, workers: Optional[int]=None, repo: Optional[str]=None, git_sha: Optional[str]=None) -> dict:
+    """
+    Write <out_dir>/<artifact name>.json for every artifact, plus <out_dir>/manifests.jsonl (vel_validator --batch format).
+    The shared fields (git SHA, environment, contract) are computed once; artifacts are hashed on threads
+    (REPRO_VERIFY_WORKERS / workers). Manifests are identical to single-artifact runs except manifest_uuid.
+        {"count", "workers", "seconds", "manifests": [{"artifact", "manifest"}, ...]}
+    """
+    t0=time.perf_counter(); repo=repo or os.environ.get("GITHUB_REPOSITORY","org/repo")
+    base=base_manifest(repo, git_sha or git_info.get().rev_parse("HEAD") or "0"*40); algorithms=list(algorithms); workers=verify_workers(workers, len(artifacts))
+    os.makedirs(out_dir, exist_ok=True)
+    with metrics.phase("manifest_batch"):
+        by_size=sorted(artifacts, key=lambda a: -os.path.getsize(a))
+        if workers==1: done=[_batch_one(base, repo, a, out_dir, algorithms, merkle) for a in by_size]
+        else:
+            with ThreadPoolExecutor(workers, thread_name_prefix="vel-manifest") as pool: done=list(pool.map(lambda a: _batch_one(base, repo, a, out_dir, algorithms, merkle), by_size))
+    rows=sorted(done, key=lambda r: r["manifest"]); metrics.inc("manifests_written_total", len(rows))
+    pathlib.Path(out_dir, "manifests.jsonl").write_text("".join(json.dumps({k: os.path.relpath(v, out_dir) for k, v in r.items()}, sort_keys=True, separators=(",",":"))+"\n" for r in rows), encoding="utf-8")
+    return {"count":len(rows),"workers":workers,"seconds":round(time.perf_counter()-t0,4),"manifests":rows}
 def main():
-    ap=argparse.ArgumentParser(); ap.add_argument("--artifact", default=get_path('artifact')); ap.add_argument("--out", default=get_path('manifest')); args=ap.parse_args()
-    try: git_sha=subprocess.check_output(["git","rev-parse","HEAD"], text=True).strip()
-    except Exception: git_sha="0"*40
+    ap=argparse.ArgumentParser(); ap.add_argument("--artifact", default=get_path('artifact')); ap.add_argument("--out", default=get_path('manifest'))
+    ap.add_argument("--digest", action="append", default=[], metavar="ALG", help="Extra provenance digest (e.g. sha512, blake2b); repeatable")
+    ap.add_argument("--merkle", action="store_true", help="Record the artifact's chunk Merkle root and write a leaf sidecar"); ap.add_argument("--merkle-leaves", help="Sidecar path (default: <out>.merkle.json)")
+    ap.add_argument("--artifacts", action="append", metavar="PATTERN", help="Batch mode: artifacts matching PATTERN (glob or directory); repeatable")
+    ap.add_argument("--out-dir", default="manifests", help="Batch mode: where <artifact>.json manifests go"); ap.add_argument("--workers", type=int, help="Batch mode: hashing threads (default: REPRO_VERIFY_WORKERS or CPU count)"); args=ap.parse_args()
+    if args.artifacts:
+        try: arts=expand_artifacts(args.artifacts)
+        except ValueError as e: print(f"ERROR: {e}", file=sys.stderr); sys.exit(2)
+        if not arts: print("ERROR: no artifacts matched", file=sys.stderr); sys.exit(2)
+        rep=make_batch(arts, args.out_dir, args.digest, args.merkle, args.workers)
+        print(f"Wrote {rep['count']} manifests to {args.out_dir} in {rep['seconds']:.2f}s"); return
+    git_sha=git_info.get().rev_parse("HEAD") or "0"*40
     repo=os.environ.get("GITHUB_REPOSITORY","org/repo")
-    doc={"vel_schema_version":"1.0","manifest_uuid":deterministic_uuid(repo, git_sha),"license_id":"MIT",
-         "provenance":{"git_sha":git_sha,"artifact_sha256":sha256_path(args.artifact) if pathlib.Path(args.artifact).exists() else ""},
-         "environment":{"python_version":platform.python_version(),"system_locale":os.environ.get("LC_ALL","C"),"timezone":os.environ.get("TZ","UTC"),"decimal_context":"28","decimal_rounding":"ROUND_HALF_EVEN"},
-         "results_contract":{"metrics_version":"v0.9-P1B-decimal","canonical_ratio":"1.46282301","input_vector_sha256":"deadbeef"*8,"rounding_precision":8,"pass_fail":true}}
+    doc=base_manifest(repo, git_sha); doc["provenance"].update(artifact_digests(args.artifact, args.digest))
+    if args.merkle and pathlib.Path(args.artifact).exists():
+        doc["provenance"].update(merkle_fields(args.artifact, args.merkle_leaves or str(pathlib.Path(args.out).with_suffix(".merkle.json"))))
     pathlib.Path(args.out).write_text(json.dumps(doc, sort_keys=True, separators=(",",":")), encoding="utf-8")
     print(f"Wrote {args.out}")
-if __name__=="__main__": main()
+if __name__=="__main__": profiling.run(main)
@@ -1,6 +1,8 @@
 #!/usr/bin/env python3
 from __future__ import annotations
-import os, pathlib, stat, json
+import os, pathlib, stat, json, sys
+if __package__ in (None, ""): sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[1]))
+from tools import profiling
 ROOT=pathlib.Path("."); BAD=[]
 def check_exec_headers():
     for p in ROOT.rglob("*.sh"):
@@ -25,4 +27,4 @@ def main():
     out={"ok": not BAD, "issues": BAD}
     pathlib.Path("meta_trace.json").write_text(json.dumps(out, sort_keys=True, separators=(",",":")), encoding="utf-8")
     print(f"Meta-lint complete ({len(BAD)} issues)")
-if __name__=="__main__": main()
+if __name__=="__main__": profiling.run(main)
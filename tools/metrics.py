@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+"""Per-tool hot-path metrics: counters, latency histograms, cache and phase timings.
+
+Recording is always on and cheap (one lock, a few dict updates per call).
+Nothing is written unless one of these is set when the process exits:
+  REPRO_METRICS           - path of metrics.json (per-tool sections are merged under
+                            an flock on metrics.json.lock, so parallel tools keep theirs)
+  REPRO_METRICS_TEXTFILE  - node-exporter textfile collector output (*.prom)
+  REPRO_METRICS_TOOL      - override the tool label (defaults to argv[0] stem)
+"""
+from __future__ import annotations
+
+import atexit
+import bisect
+import json
+import os
+import re
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Tuple
+
+from tools.cjson import write_canonical_json
+
+try:
+    import fcntl
+except ImportError:  # Windows: merges are not serialised
+    fcntl = None  # type: ignore[assignment]
+
+__all__ = [
+    "LATENCY_BUCKETS", "inc", "observe", "cache", "phase", "set_tool", "tool_name",
+    "snapshot", "reset", "write_json", "write_textfile", "render_textfile",
+]
+
+# Upper bounds (seconds) for per-file latency histograms; +Inf is implicit.
+LATENCY_BUCKETS: Tuple[float, ...] = (0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 30.0)
+
+_lock = threading.Lock()
+_counters: Dict[str, float] = {}
+_histograms: Dict[str, "_Histogram"] = {}
+_phases: Dict[str, float] = {}
+_caches: Dict[str, List[int]] = {}
+_tool: str | None = None
+
+
+class _Histogram:
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self) -> None:
+        self.counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def add(self, value: float) -> None:
+        self.counts[bisect.bisect_left(LATENCY_BUCKETS, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def to_dict(self) -> Dict[str, Any]:
+        # Cumulative buckets, as Prometheus expects.
+        buckets: Dict[str, int] = {}
+        running = 0
+        for bound, n in zip(LATENCY_BUCKETS + (float("inf"),), self.counts):
+            running += n
+            buckets["+Inf" if bound == float("inf") else repr(bound)] = running
+        return {"buckets": buckets, "count": self.count, "sum": round(self.sum, 6)}
+
+
+def inc(name: str, value: float = 1) -> None:
+    """Add `value` to counter `name` (e.g. bytes_read_total, files_hashed_total)."""
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + value
+
+
+def observe(name: str, seconds: float) -> None:
+    """Record one latency sample (seconds) in histogram `name`."""
+    with _lock:
+        h = _histograms.get(name)
+        if h is None:
+            h = _histograms[name] = _Histogram()
+        h.add(seconds)
+
+
+def cache(name: str, hit: bool) -> None:
+    """Record one lookup against cache `name`."""
+    with _lock:
+        hm = _caches.setdefault(name, [0, 0])
+        hm[0 if hit else 1] += 1
+
+
+@contextmanager
+def phase(name: str) -> Iterator[None]:
+    """Accumulate wall time spent inside the block under phase `name`."""
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        dt = time.perf_counter() - t0
+        with _lock:
+            _phases[name] = _phases.get(name, 0.0) + dt
+
+
+def set_tool(name: str) -> None:
+    global _tool
+    _tool = name
+
+
+def tool_name() -> str:
+    if _tool:
+        return _tool
+    env = os.environ.get("REPRO_METRICS_TOOL")
+    if env:
+        return env
+    argv0 = sys.argv[0] if sys.argv and sys.argv[0] else "python"
+    stem = Path(argv0).stem
+    return stem if stem not in ("", "-c", "-m", "__main__") else "python"
+
+
+def snapshot() -> Dict[str, Any]:
+    """Return the metrics recorded so far by this process."""
+    with _lock:
+        return {
+            "counters": dict(sorted(_counters.items())),
+            "histograms": {k: h.to_dict() for k, h in sorted(_histograms.items())},
+            "phases": {k: round(v, 6) for k, v in sorted(_phases.items())},
+            "cache": {
+                k: {"hits": h, "misses": m, "hit_rate": round(h / (h + m), 6) if (h + m) else 0.0}
+                for k, (h, m) in sorted(_caches.items())
+            },
+        }
+
+
+def reset() -> None:
+    with _lock:
+        _counters.clear()
+        _histograms.clear()
+        _phases.clear()
+        _caches.clear()
+
+
+def _load(path: Path) -> Dict[str, Any]:
+    try:
+        doc = json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {"tools": {}}
+    if not isinstance(doc, dict) or not isinstance(doc.get("tools"), dict):
+        return {"tools": {}}
+    return doc
+
+
+@contextmanager
+def _merge_lock(path: Path) -> Iterator[None]:
+    """Exclusive lock on `path`.lock for the read-modify-write of `path`; released on close."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path.with_name(path.name + ".lock"), "a") as lock:
+        if fcntl is not None:
+            fcntl.flock(lock.fileno(), fcntl.LOCK_EX)
+        yield
+
+
+def _merge(path: Path, tool: str | None) -> Dict[str, Any]:
+    doc = _load(path)
+    doc["tools"][tool or tool_name()] = snapshot()
+    write_canonical_json(doc, path)
+    return doc
+
+
+def write_json(path: str | Path, tool: str | None = None) -> Dict[str, Any]:
+    """Merge this process's metrics into `path` under the tool's key; return the document."""
+    p = Path(path)
+    with _merge_lock(p):
+        return _merge(p, tool)
+
+
+def _metric_name(name: str) -> str:
+    return "repro_" + re.sub(r"[^a-zA-Z0-9_]", "_", name)
+
+
+def _label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def render_textfile(doc: Dict[str, Any]) -> str:
+    """Render a metrics.json document in Prometheus text exposition format."""
+    series: Dict[str, Tuple[str, List[str]]] = {}
+
+    def add(name: str, kind: str, line: str) -> None:
+        series.setdefault(name, (kind, []))[1].append(line)
+
+    for tool, m in sorted(doc.get("tools", {}).items()):
+        t = _label(tool)
+        for k, v in sorted(m.get("counters", {}).items()):
+            n = _metric_name(k)
+            add(n, "counter", f'{n}{{tool="{t}"}} {v}')
+        for k, h in sorted(m.get("histograms", {}).items()):
+            n = _metric_name(k)
+            for le, c in sorted(h["buckets"].items(), key=lambda kv: float(kv[0])):
+                add(n, "histogram", f'{n}_bucket{{tool="{t}",le="{le}"}} {c}')
+            add(n, "histogram", f'{n}_sum{{tool="{t}"}} {h["sum"]}')
+            add(n, "histogram", f'{n}_count{{tool="{t}"}} {h["count"]}')
+        for k, v in sorted(m.get("phases", {}).items()):
+            add("repro_phase_seconds", "gauge", f'repro_phase_seconds{{tool="{t}",phase="{_label(k)}"}} {v}')
+        for k, c in sorted(m.get("cache", {}).items()):
+            lbl = f'{{tool="{t}",cache="{_label(k)}"}}'
+            add("repro_cache_hits_total", "counter", f"repro_cache_hits_total{lbl} {c['hits']}")
+            add("repro_cache_misses_total", "counter", f"repro_cache_misses_total{lbl} {c['misses']}")
+
+    out: List[str] = []
+    for name in sorted(series):
+        kind, lines = series[name]
+        out.append(f"# TYPE {name} {kind}")
+        out.extend(lines)
+    return "\n".join(out) + "\n" if out else ""
+
+
+def write_textfile(path: str | Path, doc: Dict[str, Any] | None = None) -> None:
+    """Write a node-exporter textfile atomically (tmp file + rename)."""
+    p = Path(path)
+    p.parent.mkdir(parents=True, exist_ok=True)
+    if doc is None:
+        doc = {"tools": {tool_name(): snapshot()}}
+    tmp = p.with_name(p.name + f".{os.getpid()}.tmp")
+    tmp.write_text(render_textfile(doc), encoding="utf-8")
+    os.replace(tmp, p)
+
+
+def _flush_at_exit() -> None:
+    json_path = os.environ.get("REPRO_METRICS")
+    prom_path = os.environ.get("REPRO_METRICS_TEXTFILE")
+    try:
+        if not json_path:
+            if prom_path:
+                write_textfile(prom_path)
+            return
+        with _merge_lock(Path(json_path)):  # the textfile is rendered from the merged document
+            doc = _merge(Path(json_path), None)
+            if prom_path:
+                write_textfile(prom_path, doc)
+    except OSError as e:
+        print(f"WARN: failed to write metrics: {e}", file=sys.stderr)
+
+
+if os.environ.get("REPRO_METRICS") or os.environ.get("REPRO_METRICS_TEXTFILE"):
+    atexit.register(_flush_at_exit)
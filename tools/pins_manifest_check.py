@@ -1,6 +1,8 @@
 #!/usr/bin/env python3
 from __future__ import annotations
 import json, pathlib, re, sys
+if __package__ in (None, ""): sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[1]))
+from tools import profiling
 WF=pathlib.Path(".github/workflows")
 PINS=pathlib.Path("ACTIONS-PINS.md")
 USE_RE=re.compile(r"^\s*uses:\s*([^\s@]+)@([0-9a-f]{40}|[^\s#]+)", re.M)
@@ -35,4 +37,4 @@ def main():
     pathlib.Path("pins_manifest_report.json").write_text(json.dumps(report, sort_keys=True, separators=(",",":")), encoding="utf-8")
     if report["ok"]: print("Pins manifest check: PASS")
     else: print("Pins manifest check: FAIL", file=sys.stderr); sys.exit(2)
-if __name__=="__main__": main()
+if __name__=="__main__": profiling.run(main)
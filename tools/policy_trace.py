@@ -1,6 +1,8 @@
 #!/usr/bin/env python3
 from __future__ import annotations
-import json, pathlib, hashlib, datetime
+import json, pathlib, hashlib, datetime, sys
+if __package__ in (None, ""): sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[1]))
+from tools import profiling
 SCHEMA = pathlib.Path("schema")
 def sha256sum(p: pathlib.Path) -> str: return hashlib.sha256(p.read_bytes()).hexdigest()
 def main():
@@ -15,4 +17,4 @@ def main():
     out={"generated": datetime.datetime.utcnow().isoformat()+"Z","policies": entries}
     pathlib.Path("schema/policy_index.json").write_text(json.dumps(out, sort_keys=True, separators=(",",":")), encoding="utf-8")
     print(f"Wrote schema/policy_index.json ({len(entries)} policies)")
-if __name__=="__main__": main()
+if __name__=="__main__": profiling.run(main)
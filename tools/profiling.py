@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""Opt-in profiling for tool entry points.
+
+Every tool runs its ``main`` through :func:`run`, which accepts:
+  --profile[=PREFIX]       on the command line (stripped before argparse sees it), or
+  REPRO_PROFILE=PREFIX     in the environment ("1" selects the default prefix).
+
+Outputs:
+  PREFIX.pstats      cProfile statistics (load with ``pstats.Stats``)
+  PREFIX.collapsed   sampled stacks, one ``frame;frame;frame count`` line each,
+                     ready for flamegraph.pl / inferno / speedscope
+
+PREFIX defaults to ``profiles/<tool>``; an existing directory (or a value ending
+in "/") becomes ``<dir>/<tool>`` so one setting covers a whole pipeline.
+REPRO_PROFILE_MODE=sample skips cProfile and keeps only the sampler, whose
+overhead (one stack walk every REPRO_PROFILE_INTERVAL_MS, default 5) is low
+enough for nightly runs.
+"""
+from __future__ import annotations
+
+import cProfile
+import os
+import sys
+import threading
+from collections import Counter
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+from tools.metrics import tool_name
+
+__all__ = ["StackSampler", "profile_prefix", "run"]
+
+_DEFAULT_DIR = "profiles"
+
+
+def _frame_label(code: Any) -> str:
+    # ';' separates frames and ' ' separates the count in collapsed format.
+    label = f"{code.co_name} ({Path(code.co_filename).name}:{code.co_firstlineno})"
+    return label.replace(";", ":")
+
+
+class StackSampler:
+    """Background thread that periodically records the stacks of all other threads."""
+
+    def __init__(self, interval: float = 0.005) -> None:
+        self.interval = interval
+        self.samples: Counter[str] = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._loop, name="repro-profiler", daemon=True)
+
+    def _loop(self) -> None:
+        own = threading.get_ident()
+        names: Dict[int, str] = {}
+        while not self._stop.wait(self.interval):
+            frames = sys._current_frames()
+            if len(names) != len(frames):
+                names = {t.ident: t.name for t in threading.enumerate() if t.ident is not None}
+            for ident, frame in frames.items():
+                if ident == own:
+                    continue
+                stack: List[str] = []
+                f: Optional[Any] = frame
+                while f is not None:
+                    stack.append(_frame_label(f.f_code))
+                    f = f.f_back
+                stack.append(names.get(ident, f"thread-{ident}").replace(";", ":").replace(" ", "_"))
+                self.samples[";".join(reversed(stack))] += 1
+
+    def start(self) -> "StackSampler":
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def collapsed(self) -> str:
+        return "".join(f"{stack} {n}\n" for stack, n in sorted(self.samples.items()))
+
+
+def profile_prefix(argv: List[str]) -> Optional[str]:
+    """Remove ``--profile[=PREFIX]`` from `argv` in place; return the output prefix or None."""
+    value: Optional[str] = None
+    for i, arg in enumerate(argv[1:], start=1):
+        if arg == "--profile" or arg.startswith("--profile="):
+            value = arg.partition("=")[2] or "1"
+            del argv[i]
+            break
+    if value is None:
+        value = os.environ.get("REPRO_PROFILE") or None
+    if value is None or value.lower() in ("0", "false", "no"):
+        return None
+    if value.lower() in ("1", "true", "yes"):
+        value = _DEFAULT_DIR + "/"
+    if value.endswith(("/", os.sep)) or Path(value).is_dir():
+        return str(Path(value) / tool_name())
+    return value
+
+
+def run(main: Callable[[], Any]) -> Any:
+    """Call `main`, profiling it when requested via --profile or REPRO_PROFILE."""
+    prefix = profile_prefix(sys.argv)
+    if prefix is None:
+        return main()
+    sample_only = os.environ.get("REPRO_PROFILE_MODE", "full").lower() == "sample"
+    interval = float(os.environ.get("REPRO_PROFILE_INTERVAL_MS", "5")) / 1000.0
+    Path(prefix).parent.mkdir(parents=True, exist_ok=True)
+    sampler = StackSampler(interval).start()
+    prof = None if sample_only else cProfile.Profile()
+    try:
+        if prof is None:
+            return main()
+        return prof.runcall(main)
+    finally:
+        sampler.stop()
+        Path(prefix + ".collapsed").write_text(sampler.collapsed(), encoding="utf-8")
+        if prof is not None:
+            prof.dump_stats(prefix + ".pstats")
+        print(f"Profile written to {prefix}.*", file=sys.stderr)
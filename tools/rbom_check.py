@@ -3,6 +3,9 @@
 from __future__ import annotations
 from typing import Iterable, Tuple, List, Dict, Any
 import argparse, json, pathlib, sys, re
+if __package__ in (None, ""): sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[1]))
+from tools import metrics, profiling
+from tools.io_utils import tree_root
 HEX64 = re.compile(r"^[0-9a-fA-F]{64}$")
 
 def check_schema_version(version: str, allowed: Iterable[str] = ("1.0", "1.1", "2.0")) -> bool:
@@ -44,6 +47,7 @@ def validate_rbom(doc: Dict[str, Any]) -> Tuple[bool, List[str]]:
       - doc["schema_version"] must be allowed
       - doc["count"] must equal len(doc["artifacts"])
       - each artifact has name/path/size/sha256 and sha256 is 64 hex chars
+      - if present, doc["tree_root"] is the Merkle root of the artifact list
     """
     errors: List[str] = []
 
@@ -63,6 +67,7 @@ def validate_rbom(doc: Dict[str, Any]) -> Tuple[bool, List[str]]:
         errors.append(f"count_mismatch:{count}!={len(artifacts)}")
 
     # per-artifact checks
+    metrics.inc("artifacts_checked_total", len(artifacts) if isinstance(artifacts, list) else 0)
     for i, art in enumerate(artifacts):
         if not isinstance(art, dict):
             errors.append(f"artifact[{i}].not_object")
@@ -70,6 +75,9 @@ def validate_rbom(doc: Dict[str, Any]) -> Tuple[bool, List[str]]:
         for e in _required_artifact_fields_ok(art):
             errors.append(f"artifact[{i}].{e}")
 
+    if "tree_root" in doc and not errors and str(doc["tree_root"]).lower() != tree_root(artifacts):
+        errors.append("tree_root_mismatch")
+
     return (len(errors) == 0, errors)
 
 def main():
@@ -87,4 +95,4 @@ def main():
     sys.exit(0 if ok else 2)
 
 if __name__ == "__main__":
-    main()
+    profiling.run(main)
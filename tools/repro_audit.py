@@ -1,26 +1,190 @@
 #!/usr/bin/env python3
-import argparse, json, hashlib, os, platform, re, locale
+"""Reproducibility audit: one artifact against its manifest or RBOM, or a whole release at once.
+
+Release mode (--rbom without --artifact, or --manifests) checks every artifact concurrently on
+threads through io_utils.digest_path, which reads each file once for all its published digests,
+and writes one reports/repro.md + .json with per-artifact status and throughput."""
+import argparse, json, os, platform, re, locale, sys, time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
+from typing import Dict, List, Optional
+if __package__ in (None, ""): sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from tools import metrics, profiling
+from tools.io_utils import digest_path, load_merkle_leaves, merkle_verify, new_hashers, parse_chunk_range, sha256_path, tree_leaf, tree_proof, tree_root, verify_chunks, verify_workers
+def _load_json(path: str, what: str):
+    """The JSON object in `path`; a missing or malformed file is an ERROR line and exit 2, not a traceback."""
+    try: d=json.loads(Path(path).read_text(encoding="utf-8"))
+    except (OSError, ValueError) as e: print(f"ERROR: cannot read {what} {path}: {e}", file=sys.stderr); sys.exit(2)
+    if not isinstance(d, dict): print(f"ERROR: {what} {path} is not a JSON object", file=sys.stderr); sys.exit(2)
+    return d
 def g(d,*p,default="MISSING"):
     cur=d
     for k in p:
         if not isinstance(cur,dict) or k not in cur: return default
         cur=cur[k]
     return str(cur)
-def sha256sum(path: Path) -> str:
-    h=hashlib.sha256()
-    with path.open('rb') as f:
-        for chunk in iter(lambda: f.read(1<<20), b""): h.update(chunk)
-    return h.hexdigest()
-def verify_artifact(m: dict, art: Path):
-    exp=g(m,"provenance","artifact_sha256")
+def _supported(alg: str) -> bool:
+    try: new_hashers([alg]); return True
+    except ValueError: return False
+def expected_digests(m: dict) -> dict:
+    """{alg: hex} for every provenance artifact_<alg> field with a supported algorithm."""
+    prov=m.get("provenance") if isinstance(m,dict) else None; prov=prov if isinstance(prov,dict) else {}
+    out={"sha256":g(m,"provenance","artifact_sha256")}
+    for k,v in sorted(prov.items()):
+        alg=k[len("artifact_"):] if k.startswith("artifact_") else ""
+        if not alg or alg in out or not isinstance(v,str) or not v or not _supported(alg): continue
+        out[alg]=v
+    return out
+def verify_artifact(m: dict, art: Path, digests: dict | None = None):
+    """Check every published digest in one read; returns (status, actual sha256)."""
+    exp=expected_digests(m)
     if not art.exists(): return "ERROR","missing"
-    got=sha256sum(art); 
-    return ("PASS" if got.lower()==exp.lower() else "FAIL", got)
+    got=digest_path(art, exp.keys())
+    if digests is not None: digests.update(got)
+    ok=all(got[a].lower()==e.lower() for a,e in exp.items())
+    return ("PASS" if ok else "FAIL", got["sha256"])
+def verify_artifact_chunks(m: dict, art: Path, chunks: str, leaves_path: Path):
+    """Rehash only the given Merkle chunks and prove them against provenance.artifact_merkle_root."""
+    prov=m.get("provenance",{}); root=prov.get("artifact_merkle_root","")
+    if not art.exists(): return "ERROR",["missing"]
+    if not root or not leaves_path.exists(): return "ERROR",["no_merkle_data"]
+    try: ok, bad = verify_chunks(art, parse_chunk_range(chunks), root, load_merkle_leaves(leaves_path), int(prov.get("artifact_merkle_chunk_size",0)))
+    except (OSError, ValueError) as e: return "ERROR",[str(e)]
+    return ("PASS" if ok else "FAIL", bad)
+def verify_tree_member(rbom: dict, name: str, art: Path):
+    """Prove that `art`, published as `name`, belongs to the RBOM tree_root (one file hash + O(log n))."""
+    root=rbom.get("tree_root","")
+    if not art.exists(): return "ERROR","missing"
+    if not root: return "ERROR","no_tree_root"
+    got=sha256_path(art)
+    try: i, n, proof = tree_proof(rbom.get("artifacts",[]), name)
+    except KeyError: return "FAIL", got
+    return ("PASS" if merkle_verify(tree_leaf(name, got), i, n, proof, bytes.fromhex(root)) else "FAIL", got)
+def rbom_jobs(rbom: dict, rbom_path: str, release_dir: Optional[str] = None) -> List[dict]:
+    """One job per RBOM artifact: {"name", "artifact", "expect": {alg: hex}, "size"}. The file is
+    <release_dir>/<name> (default: the RBOM's directory), or the recorded "path" if that is missing.
+    An entry that is not an object gives a job with an "error", which audits as ERROR."""
+    base=Path(release_dir or Path(rbom_path).resolve().parent); jobs=[]
+    for i, a in enumerate(rbom.get("artifacts",[])):
+        if not isinstance(a, dict):
+            jobs.append({"name":f"artifacts[{i}]","artifact":"","expect":{},"size":None,"error":"RBOM entry is not an object"}); continue
+        name=str(a.get("name","")); art=base/name
+        if not art.exists() and a.get("path") and Path(a["path"]).exists(): art=Path(a["path"])
+        expect={k:str(v) for k,v in sorted(a.items()) if k not in ("name","path","size") and isinstance(v,str) and v and _supported(k)}
+        jobs.append({"name":name,"artifact":str(art),"expect":expect,"size":a.get("size")})
+    return jobs
+def manifest_jobs(src: str, release_dir: Optional[str] = None) -> List[dict]:
+    """Jobs from a vel_validator batch file ({"manifest", "artifact"} entries) or a directory of manifests,
+    where <name>.json describes artifact <name> in release_dir (default: the same directory).
+    A manifest that cannot be read or parsed gives a job with an "error", which audits as ERROR."""
+    from tools.vel_validator import load_batch
+    p=Path(src)
+    if p.is_dir():
+        base=Path(release_dir or p)
+        pairs=[(str(m), str(base/m.name[:-len(".json")])) for m in sorted(p.glob("*.json")) if not m.name.endswith(".merkle.json")]
+    else: pairs=[(i["manifest"], i.get("artifact","")) for i in load_batch(src)]
+    jobs=[]
+    for man, art in pairs:
+        job={"name":Path(art).name if art else Path(man).name,"artifact":art,"manifest":man,"expect":{},"size":None}
+        try: job["expect"]=expected_digests(json.loads(Path(man).read_text(encoding="utf-8")))
+        except (OSError, ValueError) as e: job["error"]=f"manifest {man}: {e}"
+        jobs.append(job)
+    return jobs
+def audit_one(job: dict) -> dict:
+    """Hash one job's artifact once for all its expected digests: status PASS | FAIL | ERROR, plus throughput."""
+    t0=time.perf_counter(); art=Path(job["artifact"]) if job["artifact"] else None
+    out={"name":job["name"],"artifact":job["artifact"],"bytes":0,"seconds":0.0,"mib_per_s":0.0}
+    if job.get("error"): return {**out,"status":"ERROR","detail":job["error"]}
+    if art is None or not art.is_file(): return {**out,"status":"ERROR","detail":"missing"}
+    if not job["expect"]: return {**out,"status":"ERROR","detail":"no expected digest"}
+    try:
+        size=art.stat().st_size
+        if job.get("size") is not None and int(job["size"])!=size: return {**out,"status":"FAIL","detail":f"size {size} != {job['size']}","bytes":size}
+        got=digest_path(art, job["expect"].keys()); dt=time.perf_counter()-t0
+    except (OSError, ValueError, TypeError) as e: return {**out,"status":"ERROR","detail":str(e)}
+    bad=[a for a,e in job["expect"].items() if got[a].lower()!=e.lower()]
+    return {**out,"status":"FAIL" if bad else "PASS","detail":("mismatch: "+",".join(bad)) if bad else "","bytes":size,
+            "seconds":round(dt,4),"mib_per_s":round(size/(1<<20)/dt,1) if dt>0 else 0.0}
+def audit_release(jobs: List[dict], workers: Optional[int] = None, fail_fast: bool = False) -> dict:
+    """
+    audit_one() every job on a thread pool (REPRO_VERIFY_WORKERS / workers), largest artifacts first.
+    With fail_fast, the first FAIL/ERROR cancels everything not yet started (status SKIPPED).
+        {"overall", "count", "passed", "failed": [names], "skipped": [names], "workers", "seconds", "bytes", "mib_per_s", "artifacts": [...]}
+    """
+    workers=verify_workers(workers, len(jobs)); t0=time.perf_counter(); results: Dict[int, dict]={}
+    order=sorted(range(len(jobs)), key=lambda i: -(os.path.getsize(jobs[i]["artifact"]) if jobs[i]["artifact"] and os.path.isfile(jobs[i]["artifact"]) else 0))
+    with metrics.phase("audit_release"):
+        if workers==1:
+            for i in order:
+                results[i]=audit_one(jobs[i])
+                if fail_fast and results[i]["status"]!="PASS": break
+        else:
+            pool=ThreadPoolExecutor(workers, thread_name_prefix="repro-audit")
+            try:
+                futures={pool.submit(audit_one, jobs[i]): i for i in order}
+                for fut in as_completed(futures):
+                    results[futures[fut]]=r=fut.result()
+                    if fail_fast and r["status"]!="PASS":
+                        for f in futures: f.cancel()
+                        break
+            finally: pool.shutdown(wait=True, cancel_futures=True)
+            for fut, i in futures.items():
+                if i not in results and fut.done() and not fut.cancelled(): results[i]=fut.result()
+    arts=[results.get(i) or {"name":j["name"],"artifact":j["artifact"],"status":"SKIPPED","detail":"fail-fast","bytes":0,"seconds":0.0,"mib_per_s":0.0} for i,j in enumerate(jobs)]
+    dt=time.perf_counter()-t0; total=sum(a["bytes"] for a in arts if a["status"]!="SKIPPED")
+    metrics.inc("artifacts_audited_total", len(results))
+    failed=[a["name"] for a in arts if a["status"] in ("FAIL","ERROR")]; skipped=[a["name"] for a in arts if a["status"]=="SKIPPED"]
+    return {"overall":"PASS" if arts and not failed and not skipped else "FAIL","count":len(arts),"passed":len(arts)-len(failed)-len(skipped),
+            "failed":failed,"skipped":skipped,"workers":workers,"seconds":round(dt,4),"bytes":total,"mib_per_s":round(total/(1<<20)/dt,1) if dt>0 else 0.0,"artifacts":arts}
+def render_release(rep: dict) -> str:
+    lines=["# Repro Audit","",f"Overall: **{rep['overall']}**","",
+           f"{rep['passed']}/{rep['count']} artifacts passed; {rep['bytes']/(1<<20):.1f} MiB in {rep['seconds']:.2f} s ({rep['mib_per_s']} MiB/s, {rep['workers']} workers)",""]
+    if "tree_root" in rep: lines+=[f"RBOM tree_root: **{rep['tree_root']}**",""]
+    lines+=["| Artifact | Status | Bytes | Seconds | MiB/s | Detail |","|---|---|---:|---:|---:|---|"]
+    lines+=[f"| {a['name']} | {a['status']} | {a['bytes']} | {a['seconds']} | {a['mib_per_s']} | {a['detail']} |" for a in rep["artifacts"]]
+    return "\n".join(lines)+"\n"
+def release_main(args) -> None:
+    if args.rbom:
+        rbom=_load_json(args.rbom, "RBOM")
+        jobs=rbom_jobs(rbom, args.rbom, args.release)
+    else:
+        rbom=None
+        try: jobs=manifest_jobs(args.manifests, args.release)
+        except (OSError, ValueError, TypeError) as e: print(f"ERROR: cannot read batch file {args.manifests}: {e}", file=sys.stderr); sys.exit(2)
+    rep=audit_release(jobs, args.workers, args.fail_fast)
+    if rbom is not None and rbom.get("tree_root"):
+        try: rep["tree_root"]="PASS" if tree_root(rbom.get("artifacts",[]))==rbom["tree_root"] else "FAIL"
+        except (KeyError, TypeError, ValueError): rep["tree_root"]="ERROR"  # malformed artifact entries
+        if rep["tree_root"]!="PASS": rep["overall"]="FAIL"
+    md=render_release(rep); Path(args.out).parent.mkdir(parents=True, exist_ok=True)
+    if args.stdout: print(md)
+    else: Path(args.out).write_text(md, encoding="utf-8")
+    Path(args.out).with_suffix(".json").write_text(json.dumps(rep, sort_keys=True, separators=(",",":")), encoding="utf-8")
+    for a in rep["artifacts"]:
+        if a["status"] in ("FAIL","ERROR"): print(f"{a['status']} {a['name']}: {a['detail']}", file=sys.stderr)
+    print(f"Audit {rep['overall']} ({rep['passed']}/{rep['count']} artifacts, {rep['mib_per_s']} MiB/s)")
+    if rep["overall"]!="PASS": sys.exit(2)
 def main():
-    ap=argparse.ArgumentParser(); ap.add_argument("--manifest", required=True); ap.add_argument("--artifact", required=True); ap.add_argument("--stdout", action="store_true"); ap.add_argument("--json", action="store_true"); ap.add_argument("-o","--out", default="reports/repro.md"); args=ap.parse_args()
-    m=json.loads(Path(args.manifest).read_text(encoding="utf-8"))
-    status, got = verify_artifact(m, Path(args.artifact))
+    ap=argparse.ArgumentParser(); ap.add_argument("--manifest"); ap.add_argument("--artifact"); ap.add_argument("--stdout", action="store_true"); ap.add_argument("--json", action="store_true"); ap.add_argument("-o","--out", default="reports/repro.md")
+    ap.add_argument("--chunks", help="Verify only these Merkle chunks (N or START:END) of the artifact"); ap.add_argument("--merkle-leaves", help="Leaf sidecar (default: <manifest>.merkle.json)")
+    ap.add_argument("--rbom", help="Verify the artifact against this RBOM's tree_root instead of a manifest"); ap.add_argument("--member", help="Artifact name inside the RBOM (default: artifact basename)")
+    ap.add_argument("--manifests", help="Release mode: directory of <artifact>.json manifests, or a vel_validator batch file"); ap.add_argument("--release", help="Release mode: directory holding the artifacts (default: next to the RBOM / manifests)")
+    ap.add_argument("--workers", type=int, help="Release mode: hashing threads (default: REPRO_VERIFY_WORKERS or CPU count)"); ap.add_argument("--fail-fast", action="store_true", help="Release mode: stop at the first failing artifact"); args=ap.parse_args()
+    if args.manifests or (args.rbom and not args.artifact):
+        if args.manifests and args.rbom: ap.error("--manifests and --rbom are alternatives")
+        return release_main(args)
+    if not args.artifact: ap.error("--artifact is required unless auditing a release (--rbom alone or --manifests)")
+    if not (args.manifest or args.rbom): ap.error("one of --manifest or --rbom is required")
+    art=Path(args.artifact); digests={}; extra={}
+    if args.rbom:
+        rbom=_load_json(args.rbom, "RBOM")
+        status, got = verify_tree_member(rbom, args.member or art.name, art)
+    else:
+        m=_load_json(args.manifest, "manifest")
+        if args.chunks:
+            status, bad = verify_artifact_chunks(m, art, args.chunks, Path(args.merkle_leaves or Path(args.manifest).with_suffix(".merkle.json")))
+            got=None; extra={"chunks":args.chunks, "chunks_failed":bad}
+        else: status, got = verify_artifact(m, art, digests)
     overall = "PASS" if status=="PASS" else "FAIL"
     rep=f"# Repro Audit\n\nOverall: **{overall}**\n"
     if args.stdout: print(rep)
@@ -28,6 +192,6 @@ def main():
         Path(args.out).parent.mkdir(parents=True, exist_ok=True)
         Path(args.out).write_text(rep, encoding="utf-8")
     if args.json:
-        Path(args.out).with_suffix(".json").write_text(json.dumps({"overall":overall, "artifact_sha_actual":got}, sort_keys=True, separators=(",",":")), encoding="utf-8")
+        Path(args.out).with_suffix(".json").write_text(json.dumps({"overall":overall, "artifact_sha_actual":got, "digests_actual":digests, **extra}, sort_keys=True, separators=(",",":")), encoding="utf-8")
     print("Audit", overall)
-if __name__=="__main__": main()
+if __name__=="__main__": profiling.run(main)
@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+"""Double-build reproducibility check: build twice under perturbations, compare.
+
+Runs the snapshot -> manifest -> tar pipeline in two isolated copies of the
+source tree at the same time, then compares the artifact, manifest and
+tarball digests. On a mismatch both archives are streamed member by member
+and the first differing entry and field is reported (tools/tar_diff.py).
+
+Build "a" uses the environment contract of scripts/enforce_env.sh. Build "b"
+perturbs what the contract does not pin:
+  umask     077 instead of 022
+  order     source files copied in reverse order (directory order, inodes)
+  hashseed  a different PYTHONHASHSEED
+  locale    LANG / LC_CTYPE / LC_COLLATE / LC_TIME set to a non-C locale
+  tz        TZ and LC_ALL themselves; opt-in, because the manifest records
+            both in its environment block and is expected to differ
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import pathlib
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, Optional, Sequence
+
+if __package__ in (None, ""): sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[1]))
+from tools import metrics, profiling
+from tools.config import CONFIG, ROOT
+from tools.io_utils import sha256_path
+from tools.tar_diff import first_content_offset, iter_diff
+
+__all__ = ["PERTURBATIONS", "DEFAULT_PERTURBATIONS", "build_env", "prepare_tree", "run_pipeline", "first_divergence", "rebuild"]
+
+PERTURBATIONS = ("umask", "order", "hashseed", "locale", "tz")
+DEFAULT_PERTURBATIONS = ("umask", "order", "hashseed", "locale")
+CONTRACT = {"LC_ALL": "C", "TZ": "UTC", "PYTHONHASHSEED": "0", "GZIP": "-n"}
+OUTPUTS = ("artifact", "manifest", "tarball")
+_IGNORE_DIRS = {".git", "__pycache__", ".pytest_cache", ".venv", "venv", "profiles"}
+# Runs one module with a given umask; "-c" puts the cwd (the build tree) on sys.path.
+_RUNNER = ("import os, runpy, sys; os.umask(int(sys.argv[1], 8)); mod = sys.argv[2]; "
+           "sys.argv = [mod] + sys.argv[3:]; runpy.run_module(mod, run_name='__main__', alter_sys=True)")
+
+
+def build_env(perturb: Iterable[str] = ()) -> Dict[str, object]:
+    """Environment, umask and copy order for one build; empty `perturb` gives the contract build."""
+    perturb = set(perturb)
+    unknown = perturb - set(PERTURBATIONS)
+    if unknown:
+        raise ValueError(f"unknown perturbation(s): {', '.join(sorted(unknown))}")
+    env = {k: v for k, v in os.environ.items() if not k.startswith(("LC_", "REPRO_PROFILE", "REPRO_METRICS"))}
+    env.update(CONTRACT)
+    env.pop("LANG", None)
+    env["PYTHONDONTWRITEBYTECODE"] = "1"
+    if "hashseed" in perturb:
+        env["PYTHONHASHSEED"] = "4242"
+    if "locale" in perturb:
+        for k in ("LANG", "LC_CTYPE", "LC_COLLATE", "LC_TIME", "LC_NUMERIC"):
+            env[k] = "de_DE.UTF-8"
+    if "tz" in perturb:
+        env["TZ"] = "Pacific/Chatham"
+        env["LC_ALL"] = "de_DE.UTF-8"
+    return {"env": env, "umask": "077" if "umask" in perturb else "022", "reverse": "order" in perturb,
+            "perturbations": sorted(perturb)}
+
+
+def _source_files(src: pathlib.Path) -> List[str]:
+    """Relative paths of tracked and non-ignored files (working-tree contents), or every file outside git."""
+    try:
+        out = subprocess.run(["git", "ls-files", "-z", "--cached", "--others", "--exclude-standard"], cwd=src, capture_output=True, check=True).stdout
+        return sorted({p for p in out.decode("utf-8").split("\0") if p and (src / p).is_file()})
+    except (OSError, subprocess.CalledProcessError):
+        files = []
+        for dirpath, dirnames, filenames in os.walk(src):
+            dirnames[:] = sorted(d for d in dirnames if d not in _IGNORE_DIRS)
+            rel = pathlib.Path(dirpath).relative_to(src)
+            files.extend(str(rel / f) for f in sorted(filenames))
+        return files
+
+
+def prepare_tree(src: pathlib.Path, dest: pathlib.Path, files: Sequence[str], reverse: bool, umask: str) -> None:
+    """Copy `files` from `src` into `dest`, honouring the build's umask and copy order."""
+    for rel in (reversed(files) if reverse else files):
+        target = dest / rel
+        target.parent.mkdir(parents=True, exist_ok=True)
+        shutil.copyfile(src / rel, target)
+        # copyfile creates with the process umask; apply the build's instead.
+        mode = (0o777 if os.stat(src / rel).st_mode & 0o111 else 0o666) & ~int(umask, 8)
+        os.chmod(target, mode)
+
+
+def run_pipeline(tree: pathlib.Path, spec: Dict[str, object], git_dir: Optional[pathlib.Path] = None) -> Dict[str, object]:
+    """Run snapshot -> manifest -> tar inside `tree`; return output paths, digests and timings."""
+    env = dict(spec["env"])  # type: ignore[arg-type]
+    if git_dir is not None:
+        # The manifest records HEAD; point git at the real repository from the copy.
+        env["GIT_DIR"] = str(git_dir)
+        env["GIT_WORK_TREE"] = str(tree)
+    steps = [("snapshot", "tools.make_snapshot", []), ("manifest", "tools.make_vel_manifest", []),
+             ("tar", "tools.det_tar", [])]
+    t0 = time.perf_counter()
+    timings: Dict[str, float] = {}
+    for name, module, args in steps:
+        s0 = time.perf_counter()
+        proc = subprocess.run([sys.executable, "-c", _RUNNER, str(spec["umask"]), module, *args],
+                              cwd=tree, env=env, capture_output=True, text=True)
+        timings[name] = round(time.perf_counter() - s0, 3)
+        if proc.returncode != 0:
+            return {"ok": False, "error": f"{name} failed ({proc.returncode}): {proc.stderr.strip()[-2000:]}",
+                    "seconds": timings}
+    paths = {"artifact": tree / CONFIG["paths"]["artifact"], "manifest": tree / CONFIG["paths"]["manifest"],
+             "tarball": tree / (CONFIG["paths"]["tarball_base"] + ".gz")}
+    return {"ok": True, "paths": {k: str(p) for k, p in paths.items()},
+            "digests": {k: sha256_path(p) for k, p in paths.items()},
+            "seconds": {**timings, "total": round(time.perf_counter() - t0, 3)}}
+
+
+def first_divergence(tar_a: str, tar_b: str) -> Optional[Dict[str, object]]:
+    """
+    First difference between two archives, in tar_diff's format (see tools/tar_diff.py),
+    or {"name": None, "change": "archive", "offset": n} when every member matches but
+    the compressed bytes do not. None if the files are identical.
+    """
+    for d in iter_diff(tar_a, tar_b):
+        return d
+    if sha256_path(tar_a) == sha256_path(tar_b):
+        return None
+    with open(tar_a, "rb") as fa, open(tar_b, "rb") as fb:
+        return {"name": None, "change": "archive", "offset": first_content_offset(fa, fb)}
+
+
+def rebuild(src: pathlib.Path, perturb: Iterable[str] = DEFAULT_PERTURBATIONS, workdir: Optional[str] = None, keep: bool = False) -> Dict[str, object]:
+    """Build `src` twice concurrently (contract vs perturbed) and compare; returns the report dict."""
+    src = src.resolve()
+    specs = {"a": build_env(), "b": build_env(perturb)}
+    files = _source_files(src)
+    git_dir = src / ".git" if (src / ".git").exists() else None
+    base = pathlib.Path(tempfile.mkdtemp(prefix="repro-rebuild-", dir=workdir))
+    # Different path lengths also catch absolute paths leaking into outputs.
+    trees = {"a": base / "a", "b": base / "build-b"}
+
+    def one(label: str) -> Dict[str, object]:
+        spec = specs[label]
+        prepare_tree(src, trees[label], files, bool(spec["reverse"]), str(spec["umask"]))
+        return run_pipeline(trees[label], spec, git_dir)
+
+    t0 = time.perf_counter()
+    try:
+        with metrics.phase("rebuild"), ThreadPoolExecutor(max_workers=2) as pool:
+            results = dict(zip(specs, pool.map(one, specs)))
+        rep: Dict[str, object] = {"files": len(files), "workdir": str(base) if keep else None,
+                                  "builds": [{"label": k, "perturbations": specs[k]["perturbations"], "umask": specs[k]["umask"], **results[k]} for k in specs]}
+        if not all(r["ok"] for r in results.values()):
+            rep.update(ok=False, reason="build_failed")
+        else:
+            mismatches = [k for k in OUTPUTS if results["a"]["digests"][k] != results["b"]["digests"][k]]
+            rep.update(ok=not mismatches, mismatches=mismatches)
+            if "tarball" in mismatches:
+                rep["divergence"] = first_divergence(results["a"]["paths"]["tarball"], results["b"]["paths"]["tarball"])
+    finally:
+        if not keep:
+            shutil.rmtree(base, ignore_errors=True)
+    rep["wall_seconds"] = round(time.perf_counter() - t0, 3)
+    metrics.observe("rebuild_seconds", rep["wall_seconds"])
+    return rep
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--src", default=str(ROOT), help="Source tree to rebuild (default: this repository)")
+    ap.add_argument("--perturb", default=",".join(DEFAULT_PERTURBATIONS),
+                    help=f"Comma-separated perturbations for build b, from {','.join(PERTURBATIONS)} (or 'none')")
+    ap.add_argument("--workdir", help="Parent directory for the temporary build trees")
+    ap.add_argument("--keep", action="store_true", help="Keep both build trees for inspection")
+    ap.add_argument("--out", default="repro_rebuild.json")
+    args = ap.parse_args()
+    perturb = [] if args.perturb in ("", "none") else [p.strip() for p in args.perturb.split(",")]
+    rep = rebuild(pathlib.Path(args.src), perturb, args.workdir, args.keep)
+    pathlib.Path(args.out).write_text(json.dumps(rep, sort_keys=True, separators=(",", ":")), encoding="utf-8")
+    if not rep.get("ok", False):
+        div = rep.get("divergence") or {}
+        detail = f" first divergence: {div.get('name')} [{div.get('field') or div.get('change')}]" if div else ""
+        print(f"Rebuild: FAIL ({rep.get('reason') or ','.join(rep.get('mismatches', []))}){detail}", file=sys.stderr)
+        sys.exit(2)
+    print(f"Rebuild: PASS ({rep['wall_seconds']}s wall)")
+
+
+if __name__ == "__main__":
+    profiling.run(main)
@@ -1,6 +1,8 @@
 #!/usr/bin/env python3
 from __future__ import annotations
 import json, pathlib, sys
+if __package__ in (None, ""): sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[1]))
+from tools import profiling
 RBOM_CANDIDATES=[pathlib.Path("release_assets/release_bom.json"), pathlib.Path("release_bom.json")]
 def load_first():
     for p in RBOM_CANDIDATES:
@@ -25,4 +27,4 @@ def main():
     if not out["ok"]:
         print("Safe paths check: FAIL", file=sys.stderr); sys.exit(2)
     print("Safe paths check: PASS")
-if __name__=="__main__": main()
+if __name__=="__main__": profiling.run(main)
@@ -1,7 +1,8 @@
 #!/usr/bin/env python3
 from __future__ import annotations
-import math, re
+import math, re, time
 from typing import Iterable, List, Dict, Any
+from tools import metrics
 
 _DEFAULT_PATTERNS: List[tuple[str, re.Pattern[str]]] = [
     ("aws_access_key_id", re.compile(r"AKIA[0-9A-Z]{16}")),
@@ -30,8 +31,11 @@ def check_entropy(s: str, threshold: float = 4.0) -> bool:
     return H >= threshold
 
 def scan_for_secrets(text: str) -> List[Dict[str, Any]]:
+    t0 = time.perf_counter()
     findings = detect_patterns(text)
     for token in re.findall(r"[A-Za-z0-9/_+=-]{20,}", text or ""):
         if check_entropy(token):
             findings.append({"rule": "high_entropy_token", "match": token, "span": [-1, -1]})
+    metrics.inc("texts_scanned_total"); metrics.inc("chars_scanned_total", len(text or ""))
+    metrics.inc("findings_total", len(findings)); metrics.observe("secret_scan_seconds", time.perf_counter() - t0)
     return findings
\ No newline at end of file
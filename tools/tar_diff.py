@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+"""Streaming diff of two tar archives (.tar, .tar.gz, .tar.xz, .tar.zst) without extracting either.
+
+Both archives are read once, as streams, and merge-joined on det_tar's member
+order (a directory, its files by name, then its subdirectories). The member that
+sorts first is compared with the other side's same-named member, or held
+(metadata and hash only, never content) if it has none yet; held members are
+reported as added / removed at the end. For archives in det_tar order only the
+members that really were added or removed are held, so memory is O(changes),
+not O(archive). Archives in any other order are still diffed correctly; members
+that arrive out of order are held until their counterpart turns up.
+
+Differences come out as dicts:
+  {"name": n, "change": "added" | "removed"}
+  {"name": n, "change": "metadata", "field": <TarInfo field>, "a": ..., "b": ...}
+  {"name": n, "change": "content", "sha256_a": ..., "sha256_b": ..., "offset": <first differing byte or None>}
+"""
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import pathlib
+import sys
+import tarfile
+from typing import Dict, Iterator, List, Optional, Tuple
+
+if __package__ in (None, ""): sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[1]))
+from tools import metrics, profiling
+from tools.compress import open_reader
+
+__all__ = ["FIELDS", "iter_diff", "diff_tars", "first_content_offset"]
+
+# The fields normalize_tar_info pins, plus what identifies the entry itself.
+FIELDS = ("type", "mode", "uid", "gid", "uname", "gname", "mtime", "size", "linkname")
+_CHUNK = 1 << 20
+
+
+def _order_key(ti: tarfile.TarInfo) -> Tuple[Tuple[int, str], ...]:
+    """Sort key of det_tar's member order: in each directory its files (0, name) before its subdirectories (1, name)."""
+    parts = ti.name.rstrip("/").split("/")
+    return tuple((1, p) for p in parts[:-1]) + ((1 if ti.isdir() else 0, parts[-1]),)
+
+
+def _fields(ti: tarfile.TarInfo) -> Dict[str, object]:
+    return {f: getattr(ti, f) for f in FIELDS}
+
+
+def _show(field: str, value: object) -> object:
+    if field == "mode":
+        return oct(value)  # type: ignore[arg-type]
+    if field == "type":
+        return value.decode("ascii", "replace") if isinstance(value, bytes) else value
+    return value
+
+
+def _metadata_diffs(name: str, fa: Dict[str, object], fb: Dict[str, object]) -> List[Dict[str, object]]:
+    return [{"name": name, "change": "metadata", "field": f, "a": _show(f, fa[f]), "b": _show(f, fb[f])}
+            for f in FIELDS if fa[f] != fb[f]]
+
+
+def first_content_offset(fa, fb, chunk: int = _CHUNK) -> Optional[int]:
+    """Offset of the first differing byte of two readable streams, None if equal."""
+    off = 0
+    while True:
+        a, b = fa.read(chunk), fb.read(chunk)
+        if a != b:
+            n = min(len(a), len(b))
+            return off + next((i for i in range(n) if a[i] != b[i]), n)
+        if not a:
+            return None
+        off += len(a)
+
+
+def _hash_member(tf: tarfile.TarFile, ti: tarfile.TarInfo) -> Optional[str]:
+    if not ti.isfile():
+        return None
+    h = hashlib.sha256(); f = tf.extractfile(ti)
+    for block in iter(lambda: f.read(_CHUNK), b""):
+        h.update(block)
+    return h.hexdigest()
+
+
+def _lockstep_content(ta: tarfile.TarFile, ma: tarfile.TarInfo, tb: tarfile.TarFile, mb: tarfile.TarInfo) -> Tuple[Optional[str], Optional[str], Optional[int]]:
+    """Hash both current members in one pass, noting where they first differ."""
+    if not (ma.isfile() and mb.isfile()):
+        return _hash_member(ta, ma), _hash_member(tb, mb), None
+    fa, fb = ta.extractfile(ma), tb.extractfile(mb)
+    ha, hb = hashlib.sha256(), hashlib.sha256()
+    off, first = 0, None
+    while True:
+        a, b = fa.read(_CHUNK), fb.read(_CHUNK)
+        if not a and not b:
+            break
+        ha.update(a); hb.update(b)
+        if first is None and a != b:
+            n = min(len(a), len(b))
+            first = off + next((i for i in range(n) if a[i] != b[i]), n)
+        off += max(len(a), len(b))
+    return ha.hexdigest(), hb.hexdigest(), first
+
+
+def _content_diff(name: str, sa: Optional[str], sb: Optional[str], offset: Optional[int]) -> List[Dict[str, object]]:
+    if sa == sb:
+        return []
+    return [{"name": name, "change": "content", "sha256_a": sa, "sha256_b": sb, "offset": offset}]
+
+
+def iter_diff(tar_a: str, tar_b: str, stats: Optional[Dict[str, int]] = None) -> Iterator[Dict[str, object]]:
+    """Yield the differences between two archives in stream order (added/removed last).
+
+    `stats`, if given, receives members_a, members_b and held (out-of-step
+    members that had to be buffered).
+    """
+    stats = stats if stats is not None else {}
+    stats.update(members_a=0, members_b=0, held=0)
+    held: Tuple[Dict[str, tuple], Dict[str, tuple]] = ({}, {})
+    with open_reader(tar_a) as sa, open_reader(tar_b) as sb, \
+            tarfile.open(fileobj=sa, mode="r|") as ta, tarfile.open(fileobj=sb, mode="r|") as tb:
+        tfs = (ta, tb)
+
+        def advance(side: int) -> Optional[tarfile.TarInfo]:
+            # Only called while the stream has a current member: an ended stream would seek back.
+            m = tfs[side].next()
+            if m is not None:
+                stats["members_b" if side else "members_a"] += 1
+                metrics.inc("members_checked_total")
+            return m
+
+        cur = [advance(0), advance(1)]
+        while cur[0] is not None or cur[1] is not None:
+            ma, mb = cur
+            if ma is not None and mb is not None and ma.name == mb.name:
+                yield from _metadata_diffs(ma.name, _fields(ma), _fields(mb))
+                yield from _content_diff(ma.name, *_lockstep_content(ta, ma, tb, mb))
+                cur = [advance(0), advance(1)]
+                continue
+            # The member that sorts first has no counterpart still to come in an archive in det_tar order.
+            side = 0 if mb is None or (ma is not None and _order_key(ma) < _order_key(mb)) else 1
+            m = cur[side]
+            entry = (_fields(m), _hash_member(tfs[side], m))
+            other = held[1 - side]
+            if m.name in other:
+                a, b = (entry, other.pop(m.name)) if side == 0 else (other.pop(m.name), entry)
+                yield from _metadata_diffs(m.name, a[0], b[0])
+                yield from _content_diff(m.name, a[1], b[1], None)
+            else:
+                held[side][m.name] = entry; stats["held"] += 1
+            cur[side] = advance(side)
+    for name in sorted(held[0]):
+        yield {"name": name, "change": "removed"}
+    for name in sorted(held[1]):
+        yield {"name": name, "change": "added"}
+
+
+def diff_tars(tar_a: str, tar_b: str) -> Dict[str, object]:
+    """
+    Full report:
+      {"identical": bool, "added": [...], "removed": [...], "metadata": [...], "content": [...],
+       "members_a": int, "members_b": int, "held": int, "a": path, "b": path}
+    """
+    stats: Dict[str, int] = {}
+    rep: Dict[str, object] = {"a": str(tar_a), "b": str(tar_b), "added": [], "removed": [], "metadata": [], "content": []}
+    with metrics.phase("tar_diff"):
+        for d in iter_diff(tar_a, tar_b, stats):
+            if d["change"] in ("added", "removed"):
+                rep[d["change"]].append(d["name"])  # type: ignore[union-attr]
+            else:
+                rep[d["change"]].append({k: v for k, v in d.items() if k != "change"})  # type: ignore[union-attr]
+    rep.update(stats)
+    rep["identical"] = not any(rep[k] for k in ("added", "removed", "metadata", "content"))
+    return rep
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Diff two tar archives member by member")
+    ap.add_argument("a")
+    ap.add_argument("b")
+    ap.add_argument("--out", help="Also write the report as JSON")
+    args = ap.parse_args()
+    for p in (args.a, args.b):
+        if not pathlib.Path(p).is_file():
+            print(f"ERROR: no such archive: {p}", file=sys.stderr)
+            sys.exit(2)
+    try:
+        rep = diff_tars(args.a, args.b)
+    except (tarfile.TarError, OSError, EOFError) as e:
+        print(f"ERROR: {e}", file=sys.stderr)
+        sys.exit(2)
+    if args.out:
+        pathlib.Path(args.out).write_text(json.dumps(rep, sort_keys=True, separators=(",", ":")), encoding="utf-8")
+    for name in rep["removed"]:
+        print(f"- {name}")
+    for name in rep["added"]:
+        print(f"+ {name}")
+    for d in rep["metadata"]:
+        print(f"~ {d['name']}: {d['field']} {d['a']!r} -> {d['b']!r}")
+    for d in rep["content"]:
+        at = f" at byte {d['offset']}" if d["offset"] is not None else ""
+        print(f"M {d['name']}: content differs{at}")
+    print(f"{'identical' if rep['identical'] else 'different'} ({rep['members_a']} vs {rep['members_b']} members)")
+    sys.exit(0 if rep["identical"] else 1)
+
+
+if __name__ == "__main__":
+    profiling.run(main)
@@ -0,0 +1,267 @@
+#!/usr/bin/env python3
+"""Random-access member index for det_tar archives (<archive>.index.json).
+
+det_tar --index writes, next to the archive, a canonical JSON sidecar with
+each member's name, type, header offset, data offset, size and SHA-256
+(offsets in the uncompressed tar stream). For gzip archives it also records
+seek points, taken at the first member boundary after every `interval`
+uncompressed bytes:
+  {"in": <tar offset>, "out": <file offset>, "window": <base64 zlib of the preceding 32 KiB>}
+Like zlib's zran.c, a reader starts raw inflate at "out" with the window as
+its dictionary, so reading one member costs at most about `interval` bytes
+of inflate plus the member itself instead of everything before it.
+Uncompressed archives need no seek points; xz / zstd archives get the member
+table only and are read from the start.
+
+    python tools/tar_index.py out/artifact.tar.gz --list
+    python tools/tar_index.py out/artifact.tar.gz --extract VEL_MANIFEST.json -o manifest.json
+    python tools/tar_index.py out/artifact.tar.gz --verify [NAME ...]
+"""
+from __future__ import annotations
+
+import argparse
+import base64
+import bisect
+import hashlib
+import json
+import os
+import pathlib
+import sys
+import zlib
+from typing import Dict, List, Optional
+
+if __package__ in (None, ""): sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[1]))
+from tools import metrics, profiling
+from tools.cjson import write_canonical_json
+from tools.compress import detect, open_reader
+from tools.tar_writer import LNKTYPE, REGTYPE
+
+__all__ = ["INDEX_FORMAT", "DEFAULT_INTERVAL", "TarIndex", "index_path_for", "load_index", "read_member",
+           "verify_member", "verify_all", "extract_member"]
+
+INDEX_FORMAT = "repro-tar-index/1"
+DEFAULT_INTERVAL = 4 << 20
+_CHUNK = 1 << 16
+
+
+def index_path_for(archive: str) -> str:
+    return str(archive) + ".index.json"
+
+
+class TarIndex:
+    """Collects members and seek points from a TarWriter (TarWriter(out, index=TarIndex()))."""
+
+    def __init__(self, interval: int = DEFAULT_INTERVAL) -> None:
+        self.interval = interval
+        self.members: List[Dict[str, object]] = []
+        self.points: List[Dict[str, object]] = []
+        self._seek = None
+        self._last = 0
+
+    def attach(self, out) -> None:
+        seek = getattr(out, "seek_point", None)
+        if seek is not None:
+            out.track_window()
+            self._seek = seek
+            self.points.append({"in": 0, "out": out.HEADER_SIZE, "window": ""})
+
+    def before_member(self, tw) -> None:
+        if self._seek is not None and tw.offset - self._last >= self.interval:
+            tw.flush()
+            pos, out, window = self._seek()
+            self.points.append({"in": pos, "out": out, "window": base64.b64encode(zlib.compress(window, 9)).decode("ascii")})
+            self._last = pos
+
+    def member(self, entry, header_offset: int, data_offset: int, sha256: Optional[str]) -> None:
+        rec: Dict[str, object] = {"name": entry.name, "type": entry.type.decode("ascii"), "header_offset": header_offset,
+                                  "data_offset": data_offset, "size": entry.size if entry.type == REGTYPE else 0}
+        if sha256 is not None:
+            rec["sha256"] = sha256
+        if entry.linkname:
+            rec["linkname"] = entry.linkname
+        self.members.append(rec)
+
+    def write(self, archive: str, path: Optional[str] = None) -> str:
+        """Write the sidecar for the finished `archive`; returns its path."""
+        path = path or index_path_for(archive)
+        with open(archive, "rb") as f:
+            compression = detect(f.read(8)).name
+            size = f.seek(0, os.SEEK_END)
+        write_canonical_json({"format": INDEX_FORMAT, "archive": pathlib.Path(archive).name, "archive_bytes": size,
+                              "compression": compression, "interval": self.interval,
+                              "members": self.members, "seek_points": self.points}, path)
+        return path
+
+
+def load_index(path: str) -> Dict[str, object]:
+    doc = json.loads(pathlib.Path(path).read_text(encoding="utf-8"))
+    if doc.get("format") != INDEX_FORMAT:
+        raise ValueError(f"{path}: not a {INDEX_FORMAT} index")
+    return doc
+
+
+def _lookup(doc: Dict[str, object], name: str) -> Dict[str, object]:
+    for rec in doc["members"]:  # type: ignore[union-attr]
+        if rec["name"] in (name, name + "/"):
+            return rec
+    raise KeyError(f"no member {name!r} in index")
+
+
+def _inflate_range(f, point: Dict[str, object], offset: int, size: int) -> bytes:
+    f.seek(point["out"])
+    window = zlib.decompress(base64.b64decode(point["window"])) if point["window"] else b""
+    d = zlib.decompressobj(-zlib.MAX_WBITS, zdict=window) if window else zlib.decompressobj(-zlib.MAX_WBITS)
+    skip, out, inflated = offset - point["in"], bytearray(), 0  # type: ignore[operator]
+    while len(out) < size:
+        buf = d.unconsumed_tail or f.read(_CHUNK)
+        if not buf:
+            raise EOFError("archive ends inside the member")
+        block = d.decompress(buf, _CHUNK * 16)
+        inflated += len(block)
+        if skip:
+            n = min(skip, len(block)); block = block[n:]; skip -= n
+        out += block
+    metrics.inc("index_bytes_inflated_total", inflated)
+    return bytes(out[:size])
+
+
+def _read_range(archive: str, doc: Dict[str, object], offset: int, size: int) -> bytes:
+    if doc["compression"] == "none":
+        with open(archive, "rb") as f:
+            f.seek(offset)
+            return f.read(size)
+    points = doc["seek_points"]
+    if doc["compression"] == "gzip" and points:
+        point = points[bisect.bisect_right([p["in"] for p in points], offset) - 1]  # type: ignore[union-attr]
+        with open(archive, "rb") as f:
+            return _inflate_range(f, point, offset, size)
+    with open_reader(archive) as r:
+        left = offset
+        while left:
+            n = len(r.read(min(left, 1 << 20)))
+            if not n:
+                raise EOFError("archive ends before the member")
+            left -= n
+        return r.read(size)
+
+
+def _check_current(archive: str, doc: Dict[str, object]) -> None:
+    if os.path.getsize(archive) != doc["archive_bytes"]:
+        raise ValueError(f"index does not match {archive} (size differs); rebuild it with det_tar --index")
+
+
+def _data_record(doc: Dict[str, object], rec: Dict[str, object]) -> Dict[str, object]:
+    """The record holding `rec`'s data: `rec` itself, or for a hardlink (det_tar --dedup) the member it links to."""
+    name = rec["name"]
+    for _ in range(len(doc["members"])):  # type: ignore[arg-type]
+        if rec["type"] != LNKTYPE.decode():
+            break
+        target = next((r for r in doc["members"] if r["name"] == rec.get("linkname")), None)  # type: ignore[union-attr]
+        if target is None:
+            raise ValueError(f"{name}: hardlink target {rec.get('linkname')!r} is not in the index")
+        rec = target
+    if rec["type"] != REGTYPE.decode():
+        raise ValueError(f"{name}: not a regular file member (type {rec['type']!r})")
+    return rec
+
+
+def _read_verified(archive: str, doc: Dict[str, object], rec: Dict[str, object]) -> bytes:
+    name, rec = rec["name"], _data_record(doc, rec)
+    data = _read_range(archive, doc, rec["data_offset"], rec["size"])  # type: ignore[arg-type]
+    if hashlib.sha256(data).hexdigest() != rec["sha256"]:
+        raise ValueError(f"{name}: content does not match the index sha256")
+    return data
+
+
+def read_member(archive: str, name: str, index: Optional[Dict[str, object]] = None) -> bytes:
+    """Contents of regular or hardlink member `name`, checked against the index's SHA-256 (ValueError on mismatch)."""
+    doc = index if index is not None else load_index(index_path_for(archive))
+    _check_current(archive, doc)
+    return _read_verified(archive, doc, _lookup(doc, name))
+
+
+def verify_member(archive: str, name: str, index: Optional[Dict[str, object]] = None) -> bool:
+    try:
+        read_member(archive, name, index)
+        return True
+    except (ValueError, KeyError, EOFError, zlib.error):
+        return False
+
+
+def verify_all(archive: str, index: Optional[Dict[str, object]] = None) -> List[str]:
+    """Names of regular members whose content does not match the index, in one sequential pass."""
+    doc = index if index is not None else load_index(index_path_for(archive))
+    _check_current(archive, doc)
+    bad, pos = [], 0
+    with open_reader(archive) as r:
+        for rec in doc["members"]:  # type: ignore[union-attr]
+            if rec["type"] != REGTYPE.decode():
+                continue
+            while pos < rec["data_offset"]:
+                n = len(r.read(min(rec["data_offset"] - pos, 1 << 20)))
+                if not n:
+                    break
+                pos += n
+            h, left = hashlib.sha256(), rec["size"]
+            while left:
+                block = r.read(min(left, 1 << 20))
+                if not block:
+                    break
+                h.update(block); left -= len(block); pos += len(block)
+            if left or h.hexdigest() != rec["sha256"]:
+                bad.append(rec["name"])
+    return bad
+
+
+def extract_member(archive: str, name: str, dest: str, index: Optional[Dict[str, object]] = None) -> int:
+    """Write member `name` to `dest` after verifying it; returns its size."""
+    data = read_member(archive, name, index)
+    pathlib.Path(dest).write_bytes(data)
+    return len(data)
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Read or verify single members of an indexed det_tar archive")
+    ap.add_argument("archive")
+    ap.add_argument("--index", help="Index sidecar (default: <archive>.index.json)")
+    g = ap.add_mutually_exclusive_group(required=True)
+    g.add_argument("--list", action="store_true", help="List members with offsets and sizes")
+    g.add_argument("--extract", metavar="NAME", help="Extract one member")
+    g.add_argument("--verify", nargs="*", metavar="NAME", help="Verify members against the index (default: all)")
+    ap.add_argument("-o", "--output", help="Destination for --extract (default: the member's basename)")
+    args = ap.parse_args()
+    try:
+        doc = load_index(args.index or index_path_for(args.archive))
+        _check_current(args.archive, doc)
+    except (OSError, ValueError) as e:
+        print(f"ERROR: {e}", file=sys.stderr)
+        sys.exit(2)
+    if args.list:
+        for rec in doc["members"]:
+            print(f"{rec['type']} {rec['data_offset']:>12} {rec['size']:>12} {rec['name']}")
+        return
+    if args.extract:
+        dest = args.output or pathlib.PurePosixPath(args.extract).name
+        try:
+            n = extract_member(args.archive, args.extract, dest, doc)
+        except (KeyError, ValueError, EOFError, zlib.error, OSError) as e:
+            print(f"ERROR: {e}", file=sys.stderr)
+            sys.exit(2)
+        print(f"Wrote {dest} ({n} bytes)")
+        return
+    try:
+        if args.verify:
+            names, bad = args.verify, [n for n in args.verify if not verify_member(args.archive, n, doc)]
+        else:
+            names, bad = [r["name"] for r in doc["members"] if r["type"] == REGTYPE.decode()], verify_all(args.archive, doc)
+    except (OSError, EOFError, zlib.error) as e:
+        print(f"ERROR: {e}", file=sys.stderr)
+        sys.exit(2)
+    for n in bad:
+        print(f"FAIL {n}", file=sys.stderr)
+    print(f"Verified {len(names) - len(bad)}/{len(names)} members")
+    sys.exit(2 if bad else 0)
+
+
+if __name__ == "__main__":
+    profiling.run(main)
@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+"""Incremental .tar.gz builds from independently compressed segments.
+
+The archive is split into segments, runs of consecutive members, and each
+segment is compressed as its own gzip member (RFC 1952 allows concatenation;
+gzip, tarfile and tools.compress read them as one stream). A segment starts
+  - at a member whose name hashes to 0 mod SEGMENT_FANOUT (about one boundary
+    per SEGMENT_FANOUT members; chosen by name, so editing a file never moves
+    a boundary and adding one only splits its own segment)
+  - at a member of SOLO_MIN bytes or more, and right after one
+The end-of-archive blocks are a final segment of their own.
+
+Each segment's key is a fingerprint of its tar headers plus the content
+fingerprints of its files, compression level and zlib version. The sidecar
+<archive>.segments.json maps keys to byte ranges of the archive (and their
+SHA-256). The next build copies a segment with a known key straight from the
+previous archive, after checking the copied bytes' SHA-256, and only
+compresses the rest.
+A segment compresses to the same bytes whether it is copied or rebuilt, so
+the output depends only on the input tree.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import zlib
+from contextlib import nullcontext
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from tools import metrics
+from tools.cjson import write_canonical_json
+from tools.compress import BACKENDS
+from tools.io_utils import fingerprint_bytes, fingerprint_path
+from tools.tar_writer import REGTYPE, TarEntry, TarWriter, end_of_archive, header
+
+__all__ = ["SEGMENTS_FORMAT", "SEGMENT_FANOUT", "SOLO_MIN", "manifest_path_for", "segment", "write_segmented"]
+
+SEGMENTS_FORMAT = "repro-tar-segments/1"
+SEGMENT_FANOUT = 32
+SOLO_MIN = 1 << 20
+_COPY_CHUNK = 1 << 20
+
+
+def manifest_path_for(archive: str) -> str:
+    return str(archive) + ".segments.json"
+
+
+def _solo(entry: TarEntry) -> bool:
+    return entry.type == REGTYPE and entry.size >= SOLO_MIN
+
+
+def segment(entries: Iterable[TarEntry]) -> Iterator[List[TarEntry]]:
+    """Group entries (in archive order) into segments by the boundary rules above."""
+    run: List[TarEntry] = []
+    for entry in entries:
+        boundary = (_solo(entry) or (run and _solo(run[-1]))
+                    or zlib.crc32(entry.name.encode("utf-8", "surrogateescape")) % SEGMENT_FANOUT == 0)
+        if run and boundary:
+            yield run
+            run = []
+        run.append(entry)
+    if run:
+        yield run
+
+
+def _key(run: List[TarEntry], level: int) -> str:
+    parts = [f"gzip-{level}-zlib-{zlib.ZLIB_RUNTIME_VERSION}".encode()]
+    for e in run:
+        parts.append(header(e.name, e.mode, e.size if e.type == REGTYPE else 0, e.type, e.linkname, e.rdev))
+        if e.type == REGTYPE and e.size:
+            parts.append(fingerprint_path(e.path).encode())
+    return fingerprint_bytes(b"\0".join(parts))
+
+
+def _load_previous(previous: Optional[str], level: int) -> Tuple[Optional[str], Dict[str, Dict[str, object]]]:
+    """(archive, key -> segment) of a previous build, or (None, {}) if it cannot be reused."""
+    if not previous or not os.path.exists(previous):
+        return None, {}
+    try:
+        doc = json.loads(Path(manifest_path_for(previous)).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None, {}
+    if doc.get("format") != SEGMENTS_FORMAT or doc.get("archive_bytes") != os.path.getsize(previous) \
+            or doc.get("level") != level or doc.get("zlib") != zlib.ZLIB_RUNTIME_VERSION:
+        return None, {}
+    return previous, {s["key"]: s for s in doc["segments"]}
+
+
+class _Tee:
+    """Writes through to `raw` while hashing what was written."""
+
+    def __init__(self, raw) -> None:
+        self.raw = raw
+        self.sha = hashlib.sha256()
+
+    def write(self, data) -> int:
+        self.sha.update(data)
+        return self.raw.write(data)
+
+
+def _copy_segment(src, dst, seg: Dict[str, object]) -> bool:
+    """Append the previous archive's bytes for `seg` to dst if they still hash as recorded."""
+    start, left, sha = dst.tell(), int(seg["length"]), hashlib.sha256()  # type: ignore[arg-type]
+    src.seek(seg["offset"])
+    while left:
+        data = src.read(min(left, _COPY_CHUNK))
+        if not data:
+            break
+        sha.update(data); dst.write(data); left -= len(data)
+    if left or sha.hexdigest() != seg["sha256"]:
+        dst.seek(start); dst.truncate()
+        return False
+    return True
+
+
+def _compress_run(dst, run: List[TarEntry], level: int) -> Tuple[int, str]:
+    """Compress `run` as one gzip member onto dst; returns (uncompressed size, sha256 of the member)."""
+    tee = _Tee(dst)
+    gz = BACKENDS["gzip"].writer(tee, level)
+    tw = TarWriter(gz)
+    for e in run:
+        tw.add(e)
+    tw.flush()
+    gz.close()
+    return tw.offset, tee.sha.hexdigest()
+
+
+def write_segmented(entries: Iterable[TarEntry], out: str, level: Optional[int] = None,
+                    previous: Optional[str] = None) -> Dict[str, int]:
+    """Write a segmented .tar.gz of `entries` to `out` plus its manifest, reusing segments of `previous`.
+
+    `previous` may be `out` itself; the new archive is written next to it and
+    renamed into place. Returns {"segments", "reused", "compressed", "bytes_reused"}.
+    """
+    level = BACKENDS["gzip"].default_level if level is None else level
+    prev_path, prev = _load_previous(previous, level)
+    tmp = f"{out}.tmp-{os.getpid()}"
+    stats = {"segments": 0, "reused": 0, "compressed": 0, "bytes_reused": 0}
+    segments: List[Dict[str, object]] = []
+    offset = 0
+    try:
+        with open(tmp, "wb") as dst, (open(prev_path, "rb") if prev_path else nullcontext()) as src:
+            for run in segment(entries):
+                key = _key(run, level)
+                start = dst.tell()
+                seg = prev.get(key)
+                if seg is not None and _copy_segment(src, dst, seg):
+                    size, sha = int(seg["size"]), str(seg["sha256"])  # type: ignore[arg-type]
+                    stats["reused"] += 1; stats["bytes_reused"] += dst.tell() - start
+                    metrics.inc("segments_reused_total")
+                else:
+                    size, sha = _compress_run(dst, run, level)
+                    stats["compressed"] += 1
+                    metrics.inc("segments_compressed_total")
+                segments.append({"key": key, "offset": start, "length": dst.tell() - start, "size": size,
+                                 "members": len(run), "first": run[0].name, "sha256": sha})
+                offset += size
+            # The end-of-archive blocks depend on the total length, so they are always written fresh.
+            gz = BACKENDS["gzip"].writer(dst, level)
+            gz.write(end_of_archive(offset))
+            gz.close()
+    except BaseException:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+        raise
+    os.replace(tmp, out)
+    stats["segments"] = len(segments) + 1
+    write_canonical_json({"format": SEGMENTS_FORMAT, "archive": Path(out).name, "archive_bytes": os.path.getsize(out),
+                          "compression": "gzip", "level": level, "zlib": zlib.ZLIB_RUNTIME_VERSION, "segments": segments},
+                         manifest_path_for(out))
+    return stats
@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+"""Minimal ustar/PAX writer for normalized archives.
+
+Encodes headers directly instead of going through tarfile.TarInfo: owner,
+group and mtime are fixed (0 / "root" / 0), so a header only depends on the
+name, mode, size, type and link target. The bytes match what tarfile writes in
+its default PAX format for the same normalized member:
+  - a "././@PaxHeader" record carries path / linkpath when the name (or link)
+    is over 100 characters or not ASCII, and size when it is >= 8 GiB
+  - ustar fields are NUL-terminated octal; device fields are only filled for
+    character / block devices
+  - content is padded to 512 bytes; close() writes two zero blocks and pads
+    the archive to a 10240-byte record
+Small members are coalesced into one buffer so the compressor sees few, large
+writes. When the output offers copy_from() (tools.compress's uncompressed
+writer), bodies of at least ZERO_COPY_MIN bytes are moved by the kernel
+(copy_file_range / sendfile) instead; if that is unsupported or stops short,
+the remainder is copied through Python, so the bytes are the same either way.
+With an index (tools/tar_index.py), every member's offsets and SHA-256 are
+reported to it as they are written.
+"""
+from __future__ import annotations
+
+import hashlib
+import os
+from typing import BinaryIO, Optional
+
+__all__ = ["BLOCKSIZE", "RECORDSIZE", "ZERO_COPY_MIN", "REGTYPE", "LNKTYPE", "SYMTYPE", "CHRTYPE", "BLKTYPE", "DIRTYPE", "FIFOTYPE",
+           "TarEntry", "header", "end_of_archive", "TarWriter"]
+
+BLOCKSIZE = 512
+RECORDSIZE = 20 * BLOCKSIZE
+REGTYPE, LNKTYPE, SYMTYPE, CHRTYPE, BLKTYPE, DIRTYPE, FIFOTYPE = b"0", b"1", b"2", b"3", b"4", b"5", b"6"
+_NUL = b"\0"
+_ZERO8 = b"0000000\0"
+_ZERO12 = b"00000000000\0"
+_ROOT32 = b"root" + _NUL * 28
+_EMPTY8 = _NUL * 8
+_SIZE_LIMIT = 8 ** 11
+_FLUSH_AT = 1 << 20
+_COPY_CHUNK = 1 << 20
+# Below this a kernel copy costs more (flush + syscalls) than coalescing the bytes.
+ZERO_COPY_MIN = int(os.environ.get("REPRO_ZERO_COPY_MIN", 64 << 10))
+
+
+class TarEntry:
+    """One archive member as the writer needs it (built from a cached lstat)."""
+
+    __slots__ = ("name", "path", "type", "mode", "size", "linkname", "ino", "dev", "nlink", "rdev")
+
+    def __init__(self, name: str, path: Optional[str], type: bytes, mode: int, size: int = 0, linkname: str = "",
+                 ino: int = 0, dev: int = 0, nlink: int = 1, rdev: int = 0) -> None:
+        self.name = name
+        self.path = path
+        self.type = type
+        self.mode = mode
+        self.size = size
+        self.linkname = linkname
+        self.ino = ino
+        self.dev = dev
+        self.nlink = nlink
+        self.rdev = rdev
+
+
+def _stn(s: str, length: int) -> bytes:
+    b = s.encode("ascii", "replace")
+    return b[:length] + (length - len(b)) * _NUL
+
+
+def _itn(n: int, digits: int) -> bytes:
+    return b"%0*o\0" % (digits - 1, n)
+
+
+def _ustar(name: str, mode: int, size: int, type: bytes, linkname: str, devmajor: bytes = _EMPTY8, devminor: bytes = _EMPTY8,
+           owner: bytes = _ROOT32) -> bytes:
+    buf = bytearray(b"".join((
+        _stn(name, 100), _itn(mode & 0o7777, 8), _ZERO8, _ZERO8, _itn(size, 12), _ZERO12, b"        ", type,
+        _stn(linkname, 100), b"ustar\x0000", owner, owner, devmajor, devminor)))
+    buf += _NUL * (BLOCKSIZE - len(buf))
+    buf[148:156] = b"%06o\0 " % sum(buf)
+    return bytes(buf)
+
+
+def _pax_record(keyword: bytes, value: bytes) -> bytes:
+    l = len(keyword) + len(value) + 3
+    n = p = 0
+    while True:
+        n = l + len(str(p))
+        if n == p:
+            break
+        p = n
+    return b"%d %s=%s\n" % (p, keyword, value)
+
+
+def _pax(fields: dict) -> bytes:
+    try:
+        for v in fields.values():
+            v.encode("utf-8", "strict")
+        records, enc = b"", "strict"
+    except UnicodeEncodeError:
+        # Undecodable file names (surrogateescape) keep their original bytes.
+        records, enc = b"21 hdrcharset=BINARY\n", "surrogateescape"
+    records += b"".join(_pax_record(k.encode("utf-8"), v.encode("utf-8", enc)) for k, v in fields.items())
+    pad = -len(records) % BLOCKSIZE
+    # tarfile leaves mode and owner names empty on the extended header itself.
+    return _ustar("././@PaxHeader", 0, len(records), b"x", "", owner=_NUL * 32) + records + _NUL * pad
+
+
+def _needs_pax(s: str, length: int) -> bool:
+    return not s.isascii() or len(s) > length
+
+
+def header(name: str, mode: int, size: int = 0, type: bytes = REGTYPE, linkname: str = "", rdev: int = 0) -> bytes:
+    """Header block(s) for one normalized member, PAX-extended when ustar cannot hold it."""
+    fields = {}
+    if _needs_pax(name, 100):
+        fields["path"] = name
+    if _needs_pax(linkname, 100):
+        fields["linkpath"] = linkname
+    ustar_size = size
+    if size >= _SIZE_LIMIT:
+        fields["size"] = str(size)
+        ustar_size = 0
+    dev = (_itn(os.major(rdev), 8), _itn(os.minor(rdev), 8)) if type in (CHRTYPE, BLKTYPE) else (_EMPTY8, _EMPTY8)
+    block = _ustar(name, mode, ustar_size, type, linkname, *dev)
+    return _pax(fields) + block if fields else block
+
+
+def end_of_archive(offset: int) -> bytes:
+    """Two zero blocks plus padding to a whole record, for an archive whose members end at `offset`."""
+    return _NUL * (2 * BLOCKSIZE + -(offset + 2 * BLOCKSIZE) % RECORDSIZE)
+
+
+class TarWriter:
+    """Streams members to a binary writer (e.g. a tools.compress writer)."""
+
+    __slots__ = ("_out", "_buf", "_copy_from", "_hash", "index", "offset")
+
+    def __init__(self, out: BinaryIO, index=None) -> None:
+        """`index` (a tools.tar_index.TarIndex) is told about every member; bodies are then hashed, never kernel-copied."""
+        self._out = out
+        self._buf = bytearray()
+        self._copy_from = getattr(out, "copy_from", None) if index is None else None
+        self._hash = None
+        self.index = index
+        self.offset = 0
+        if index is not None:
+            index.attach(out)
+
+    @property
+    def zero_copy(self) -> bool:
+        """True when large file bodies go to the output by kernel copy (uncompressed file output)."""
+        return self._copy_from is not None
+
+    def _write(self, data) -> None:
+        self._buf += data
+        self.offset += len(data)
+        if len(self._buf) >= _FLUSH_AT:
+            self.flush()
+
+    def flush(self) -> None:
+        if self._buf:
+            self._out.write(self._buf)
+            self._buf = bytearray()
+
+    def add(self, entry: TarEntry, data: Optional[bytes] = None) -> None:
+        """Write `entry`'s header and, for regular files, exactly entry.size bytes.
+
+        The content is `data` when given (e.g. from io_utils.prefetch_ordered),
+        otherwise it is read from entry.path.
+        """
+        index = self.index
+        if index is not None:
+            index.before_member(self)
+            header_offset = self.offset
+            self._hash = hashlib.sha256() if entry.type == REGTYPE else None
+        self._write(header(entry.name, entry.mode, entry.size if entry.type == REGTYPE else 0,
+                           entry.type, entry.linkname, entry.rdev))
+        data_offset = self.offset
+        if entry.type == REGTYPE and entry.size:
+            if data is None:
+                self._copy(entry.path, entry.size)
+            else:
+                self._put(entry.path, data, entry.size)
+        if index is not None:
+            index.member(entry, header_offset, data_offset, self._hash.hexdigest() if self._hash is not None else None)
+            self._hash = None
+
+    def _put(self, path: Optional[str], data: bytes, size: int) -> None:
+        if len(data) != size:
+            raise OSError(f"unexpected end of data: {path}")
+        if self._hash is not None:
+            self._hash.update(data)
+        if size < _COPY_CHUNK:
+            self._write(data)
+        else:
+            self.flush()
+            self._out.write(data)
+            self.offset += size
+        self._pad(size)
+
+    def _copy(self, path: str, size: int) -> None:
+        with open(path, "rb", buffering=0) as f:
+            if size >= ZERO_COPY_MIN and self._copy_from is not None:
+                self.flush()
+                n = self._copy_from(f.fileno(), size)
+                self.offset += n
+                if n == size:
+                    self._pad(size)
+                    return
+                # Kernel copy unsupported or cut short: the rest goes through Python,
+                # which also reports a file that shrank.
+                f.seek(n)
+                self._stream(f, path, size - n)
+                self._pad(size)
+                return
+            if size < _COPY_CHUNK:
+                data = f.read(size)
+                if len(data) != size:
+                    raise OSError(f"unexpected end of data: {path}")
+                if self._hash is not None:
+                    self._hash.update(data)
+                self._write(data)
+            else:
+                self.flush()
+                self._stream(f, path, size)
+        self._pad(size)
+
+    def _stream(self, f, path: str, left: int) -> None:
+        while left:
+            data = f.read(min(left, _COPY_CHUNK))
+            if not data:
+                raise OSError(f"unexpected end of data: {path}")
+            if self._hash is not None:
+                self._hash.update(data)
+            self._out.write(data)
+            self.offset += len(data)
+            left -= len(data)
+
+    def _pad(self, size: int) -> None:
+        pad = -size % BLOCKSIZE
+        if pad:
+            self._write(_NUL * pad)
+
+    def close(self) -> None:
+        """End-of-archive marker and record padding (as tarfile.TarFile.close)."""
+        self._write(end_of_archive(self.offset))
+        self.flush()
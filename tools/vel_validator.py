@@ -1,45 +1,157 @@
 #!/usr/bin/env python3
-import argparse, json, subprocess, sys, pathlib
-from typing import Tuple, Any, Dict
-from tools.io_utils import sha256_path
+"""Validates VEL manifests: core sections, JSON Schema, artifact sha256 (or Merkle chunks), git commit.
+The JSON Schema is compiled once per process (keyed by its sha256); its metaschema check, the slow part,
+runs once per schema and jsonschema installation and is remembered under io_utils.cache_dir("schema").
+--batch validates many manifests in one process, on a process pool, into one report (vel_check.json)."""
+import argparse, hashlib, json, os, sys, pathlib, time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Tuple, Any, Dict, List, Optional
+if __package__ in (None, ""): sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[1]))
+from tools import git_info, metrics, profiling
+from tools.cjson import write_canonical_json
+from tools.io_utils import cache_dir, load_merkle_leaves, parse_chunk_range, sha256_path, verify_chunks, verify_workers
+CORE_SECTIONS=("provenance","environment","results_contract")
+_validators: Dict[str, Any] = {}
+_jsonschema_version: Optional[str] = None
 def read_json(path: str) -> Dict[str, Any]:
     return json.loads(pathlib.Path(path).read_text(encoding="utf-8"))
 def validate_schema_builtin(doc: dict) -> bool:
-    req=["provenance","environment","results_contract"]
-    ok=all(k in doc for k in req)
+    ok=all(k in doc for k in CORE_SECTIONS)
     if not ok: print("WARN: manifest missing core sections; consider JSON Schema.", file=sys.stderr)
     return ok
+def schema_validator(schema_path: str) -> Any:
+    """Compiled jsonschema validator for schema_path, cached in-process by schema sha256 + jsonschema installation."""
+    global _jsonschema_version
+    import jsonschema
+    if _jsonschema_version is None:  # identifies the installed jsonschema without importlib.metadata (~15 ms per process)
+        st=os.stat(jsonschema.validators.__file__); _jsonschema_version=f"{jsonschema.validators.__file__}:{st.st_size}:{st.st_mtime_ns}"
+    raw=pathlib.Path(schema_path).read_bytes(); key=hashlib.sha256(raw+b"\0"+_jsonschema_version.encode()).hexdigest()
+    v=_validators.get(key); metrics.cache("schema_validator", v is not None)
+    if v is not None: return v
+    schema=json.loads(raw); cls=jsonschema.validators.validator_for(schema)
+    d=cache_dir("schema"); marker=d/f"{key}.json" if d else None
+    if marker is None or not marker.exists():
+        with metrics.phase("schema_check"): cls.check_schema(schema)
+        if marker is not None:
+            try: write_canonical_json({"checked": True, "validator": cls.__name__}, marker)
+            except OSError: pass
+    v=_validators[key]=cls(schema); return v
+def schema_errors(doc: dict, schema_path: str) -> List[str]:
+    """Best-matching JSON Schema error for doc ([] if valid); FileNotFoundError if the schema is missing."""
+    from jsonschema.exceptions import best_match
+    err=best_match(schema_validator(schema_path).iter_errors(doc))
+    if err is None: return []
+    where="/".join(str(p) for p in err.absolute_path)
+    return [f"{err.message} (at /{where})"]
 def validate_schema_jsonschema(doc: dict, schema_path: str) -> bool:
-    try:
-        import jsonschema, json as _j
-        schema=_j.loads(pathlib.Path(schema_path).read_text(encoding="utf-8"))
-        jsonschema.validate(instance=doc, schema=schema); return True
+    try: errs=schema_errors(doc, schema_path)
     except FileNotFoundError:
         print("WARN: schema not found; skipping jsonschema.", file=sys.stderr); return True
     except Exception as e:
         print(f"ERROR: jsonschema validation failed: {e}", file=sys.stderr); return False
+    if errs: print(f"ERROR: jsonschema validation failed: {errs[0]}", file=sys.stderr); return False
+    return True
 def check_git_sha_exists_locally(expected_sha: str) -> Tuple[bool,str]:
-    try:
-        subprocess.check_call(["git","cat-file","-e",f"{expected_sha}^{{commit}}"], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL); return True,"present"
-    except subprocess.CalledProcessError: return False,"not_found"
-    except FileNotFoundError: return False,"git_missing"
+    """(exists, "present" | "not_found" | "git_missing"), answered over the process's shared git cat-file pipe."""
+    return git_info.get().commit_exists(expected_sha)
 def check_artifact_sha(expected_sha: str, artifact_path: str) -> bool:
     try: return sha256_path(artifact_path).lower()==expected_sha.lower()
     except Exception as e: print(f"ERROR: failed to hash artifact: {e}", file=sys.stderr); return False
+def check_artifact_chunks(prov: dict, artifact_path: str, chunks: str, leaves_path: str) -> bool:
+    """Verify only chunk range `chunks` ("N" or "A:B") against provenance.artifact_merkle_root."""
+    root=prov.get("artifact_merkle_root",""); size=int(prov.get("artifact_merkle_chunk_size",0) or 0)
+    if not root or size<=0: print("ERROR: manifest has no artifact_merkle_root; cannot verify chunks.", file=sys.stderr); return False
+    try:
+        ok, bad = verify_chunks(artifact_path, parse_chunk_range(chunks), root, load_merkle_leaves(leaves_path), size)
+    except (OSError, ValueError) as e: print(f"ERROR: chunk verification failed: {e}", file=sys.stderr); return False
+    if not ok: print(f"ERROR: chunks failed Merkle proof: {bad}", file=sys.stderr)
+    return ok
+def validate_one(item: Dict[str, str], schema_path: str) -> Dict[str, Any]:
+    """Core-section, schema and artifact sha256 checks of one batch entry; errors are collected, not printed."""
+    rep: Dict[str, Any]={"manifest": item["manifest"], "artifact": item.get("artifact"), "errors": []}; errors=rep["errors"]
+    try: doc=read_json(item["manifest"])
+    except (OSError, ValueError) as e: errors.append(f"read: {e}"); rep["ok"]=False; return rep
+    if not isinstance(doc, dict): errors.append("read: not a JSON object"); rep["ok"]=False; return rep
+    missing=[k for k in CORE_SECTIONS if k not in doc]
+    if missing: errors.append("missing core sections: "+", ".join(missing))
+    try: errors.extend(f"schema: {m}" for m in schema_errors(doc, schema_path))
+    except FileNotFoundError: pass
+    except Exception as e: errors.append(f"schema: {e}")
+    prov=doc.get("provenance",{}) if isinstance(doc.get("provenance"), dict) else {}
+    if item.get("artifact"):
+        exp=str(prov.get("artifact_sha256",""))
+        try: got=sha256_path(item["artifact"])
+        except OSError as e: errors.append(f"artifact: {e}")
+        else:
+            if not exp or got.lower()!=exp.lower(): errors.append("artifact sha256 mismatch")
+    rep["git_sha"]=str(prov.get("git_sha","")); rep["ok"]=not errors
+    return rep
+def _validate_many(items: List[Dict[str, str]], schema_path: str) -> List[Dict[str, Any]]:
+    return [validate_one(i, schema_path) for i in items]
+def load_batch(path: str) -> List[Dict[str, str]]:
+    """Batch entries from a JSON list or JSON-lines file: {"manifest", "artifact"?} objects or bare manifest paths.
+    Relative paths are resolved against the batch file's directory."""
+    p=pathlib.Path(path); text=p.read_text(encoding="utf-8"); base=p.resolve().parent
+    rows=json.loads(text) if text.lstrip().startswith("[") else [json.loads(l) for l in text.splitlines() if l.strip()]
+    items=[]
+    for r in rows:
+        r={"manifest": r} if isinstance(r, str) else dict(r)
+        items.append({k: str(base/v) for k, v in r.items() if k in ("manifest","artifact") and v})
+    return items
+def validate_batch(items: List[Dict[str, str]], schema_path: str, workers: Optional[int]=None, strict_git: bool=False) -> Dict[str, Any]:
+    """
+    Validate every entry in one process (workers=1) or a process pool (REPRO_VERIFY_WORKERS / workers),
+    each worker compiling the schema once. Entries are sent in contiguous slices, so the report keeps input order.
+    Each distinct git_sha is looked up once, all over one git cat-file process.
+        {"ok", "count", "failed": [manifest, ...], "schema", "workers", "seconds", "manifests": [validate_one, ...]}
+    """
+    t0=time.perf_counter(); workers=verify_workers(workers, len(items))
+    with metrics.phase("validate_batch"):
+        if workers==1: results=_validate_many(items, schema_path)
+        else:
+            step=max(1, min(256, -(-len(items)//(workers*4)))); slices=[items[i:i+step] for i in range(0, len(items), step)]
+            with ProcessPoolExecutor(workers) as pool: results=[r for part in pool.map(_validate_many, slices, [schema_path]*len(slices)) for r in part]
+    with metrics.phase("validate_git"): git={sha: check_git_sha_exists_locally(sha)[1] for sha in sorted({r.get("git_sha","") for r in results} - {""})}
+    for r in results:
+        if r.get("git_sha"):
+            r["git"]=git[r["git_sha"]]
+            if strict_git and r["git"]!="present": r["errors"].append(f"git commit not confirmed: {r['git']}"); r["ok"]=False
+    metrics.inc("manifests_validated_total", len(results))
+    failed=[r["manifest"] for r in results if not r["ok"]]
+    return {"ok": bool(results) and not failed, "count": len(results), "failed": failed, "schema": schema_path, "workers": workers,
+            "seconds": round(time.perf_counter()-t0, 4), "manifests": results}
 def main():
-    ap=argparse.ArgumentParser(); ap.add_argument("--artifact", required=True); ap.add_argument("--schema", required=True); ap.add_argument("manifest"); ap.add_argument("--strict-git", action="store_true"); args=ap.parse_args()
+    ap=argparse.ArgumentParser(); ap.add_argument("--artifact"); ap.add_argument("--schema", required=True); ap.add_argument("manifest", nargs="?"); ap.add_argument("--strict-git", action="store_true")
+    ap.add_argument("--chunks", help="Verify only these Merkle chunks (N or START:END) instead of the full sha256"); ap.add_argument("--merkle-leaves", help="Leaf sidecar (default: <manifest>.merkle.json)")
+    ap.add_argument("--batch", help="JSON / JSON-lines list of {manifest, artifact} to validate in one run"); ap.add_argument("--workers", type=int, help="Processes for --batch (default: REPRO_VERIFY_WORKERS or CPU count)")
+    ap.add_argument("--out", default="vel_check.json", help="Report for --batch"); args=ap.parse_args()
+    if args.batch:
+        try: items=load_batch(args.batch)
+        except (OSError, ValueError) as e: print(f"ERROR: {e}", file=sys.stderr); sys.exit(2)
+        rep=validate_batch(items, args.schema, args.workers, args.strict_git); write_canonical_json(rep, args.out)
+        for r in rep["manifests"]:
+            if not r["ok"]: print(f"FAIL {r['manifest']}: {'; '.join(r['errors'])}", file=sys.stderr)
+        print(f"Manifest validation {'PASS' if rep['ok'] else 'FAIL'} ({rep['count']-len(rep['failed'])}/{rep['count']})")
+        sys.exit(0 if rep["ok"] else 2)
+    if not (args.manifest and args.artifact): ap.error("manifest and --artifact are required without --batch")
     doc=read_json(args.manifest); ok=True
-    if not (validate_schema_builtin(doc) and validate_schema_jsonschema(doc, args.schema)): ok=False
+    with metrics.phase("validate_schema"):
+        if not (validate_schema_builtin(doc) and validate_schema_jsonschema(doc, args.schema)): ok=False
     exp=doc.get("provenance",{}).get("artifact_sha256","")
-    if not exp or not check_artifact_sha(exp, args.artifact):
-        print("ERROR: artifact sha256 mismatch.", file=sys.stderr); ok=False
+    with metrics.phase("validate_artifact"):
+        if args.chunks:
+            leaves=args.merkle_leaves or str(pathlib.Path(args.manifest).with_suffix(".merkle.json"))
+            if not check_artifact_chunks(doc.get("provenance",{}), args.artifact, args.chunks, leaves): ok=False
+        elif not exp or not check_artifact_sha(exp, args.artifact):
+            print("ERROR: artifact sha256 mismatch.", file=sys.stderr); ok=False
     git_sha=doc.get("provenance",{}).get("git_sha","")
     if git_sha:
-        present, reason = check_git_sha_exists_locally(git_sha)
+        with metrics.phase("validate_git"): present, reason = check_git_sha_exists_locally(git_sha)
         if not present:
             msg=f"WARN: local git cannot confirm commit: {git_sha} ({reason})."
-            if args.strict-git: print("ERROR: "+msg, file=sys.stderr); ok=False
+            if args.strict_git: print("ERROR: "+msg, file=sys.stderr); ok=False
             else: print(msg, file=sys.stderr)
+    metrics.inc("manifests_validated_total")
     print("Manifest validation PASS" if ok else "Manifest validation FAIL")
     sys.exit(0 if ok else 2)
-if __name__=="__main__": main()
+if __name__=="__main__": profiling.run(main)
@@ -1,18 +1,73 @@
 #!/usr/bin/env python3
-"""Checks a .tar.gz for deterministic tar metadata (owner/group, mtime, sort order)."""
+"""Checks a tar (.tar, .tar.gz, .tar.xz, .tar.zst) for deterministic metadata (owner/group, mtime, sort order)
+and, for compressed archives, a deterministic compression header.
+With integrity=True (--integrity) a .tar.gz is read through verify_gzip_header's
+GzipIntegrityReader, so the CRC32/ISIZE check of every gzip member shares the
+one decompression pass with the metadata checks.
+check_many() (--glob / --rbom) checks many archives on a process pool and
+writes one report; archives are listed sorted by path whatever order the
+workers finish in."""
 from __future__ import annotations
-import argparse, json, pathlib, sys, tarfile
-from typing import Iterable
+import argparse, glob, json, os, pathlib, sys, tarfile, time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import contextmanager
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+if __package__ in (None, ""): sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[1]))
+from tools import metrics, profiling
+from tools.compress import detect, open_reader, verify_header
+from tools.io_utils import verify_workers
+from tools.verify_gzip_header import GzipIntegrityError, GzipIntegrityReader, check_gzip_stream
 
-def check_tar(tar_path: str) -> dict:
+TAR_SUFFIXES = (".tar", ".tar.gz", ".tgz", ".tar.xz", ".txz", ".tar.zst", ".tzst")
+
+def verify_links(members: Iterable[tarfile.TarInfo]) -> list:
+    """Hardlink members (e.g. det_tar --dedup) whose target is not an earlier regular file; [] if all resolve."""
+    files, bad = set(), []
+    for m in members:
+        if m.islnk() and m.linkname not in files:
+            bad.append(m.name)
+        elif m.isreg():
+            files.add(m.name)
+    return bad
+
+@contextmanager
+def _open_stream(p: pathlib.Path, integrity: bool) -> Iterator[object]:
+    """Decompressed stream of p; a GzipIntegrityReader when checking the integrity of a gzip archive."""
+    if integrity:
+        with open(p, "rb") as raw:
+            gz = detect(raw.read(8)).name == "gzip"
+            raw.seek(0)
+            if gz:
+                yield GzipIntegrityReader(raw)
+                return
+    with open_reader(p) as stream:
+        yield stream
+
+def _read_members(p: pathlib.Path, integrity: bool) -> Tuple[List[tarfile.TarInfo], Optional[Dict[str, object]]]:
+    """Members of the archive and, with integrity, the full-stream compression report.
+    gzip gets both from one decompression pass; xz / zstd are drained a second time by check_gzip_stream."""
+    with metrics.phase("tar_read"), _open_stream(p, integrity) as stream:
+        if not isinstance(stream, GzipIntegrityReader):
+            with tarfile.open(fileobj=stream, mode="r|") as tf:
+                members = tf.getmembers()
+            return members, (check_gzip_stream(str(p)) if integrity else None)
+        try:
+            with tarfile.open(fileobj=stream, mode="r|") as tf:
+                members = tf.getmembers()
+            # tarfile stops at the end-of-archive blocks; the rest still has to pass the CRC/ISIZE check.
+            return members, stream.drain()
+        except GzipIntegrityError:
+            raise GzipIntegrityError(f"integrity:{stream.error}") from None
+
+def check_tar(tar_path: str, integrity: bool = False) -> dict:
     p = pathlib.Path(tar_path)
     if not p.exists():
         return {"ok": False, "reason": "missing_tar", "path": str(p)}
     try:
-        with tarfile.open(str(p), mode="r:gz") as tgz:
-            members = tgz.getmembers()
+        members, stream_rep = _read_members(p, integrity)
     except Exception as e:
         return {"ok": False, "reason": f"read_error:{e}"}
+    metrics.inc("members_checked_total", len(members))
     names = [m.name for m in members if m.isfile()]
     sorted_names = sorted(names)
     order_ok = (names == sorted_names)
@@ -29,22 +84,101 @@ def check_tar(tar_path: str) -> dict:
                 "gname": m.gname,
                 "mtime": m.mtime
             })
-    ok = order_ok and meta_ok
-    return {
+    bad_links = verify_links(members)
+    header = verify_header(p)
+    ok = order_ok and meta_ok and not bad_links and bool(header["deterministic"])
+    rep = {
         "ok": ok,
         "order_ok": order_ok,
         "meta_ok": meta_ok,
+        "links_ok": not bad_links,
+        "bad_links": bad_links,
+        "compression": header,
         "bad_meta": bad_meta,
         "count": len(members),
         "path": str(p)
     }
+    if stream_rep is not None:
+        rep["integrity"] = stream_rep
+        rep["ok"] = ok and bool(stream_rep["is_valid"])
+    return rep
+
+def expand_globs(patterns: Iterable[str]) -> List[str]:
+    """Tar archives matching any of the glob patterns (** recurses), sorted and deduplicated."""
+    found = {os.path.normpath(m) for pat in patterns for m in glob.glob(pat, recursive=True)}
+    return sorted(m for m in found if os.path.isfile(m) and m.endswith(TAR_SUFFIXES))
+
+def rbom_archives(rbom_path: str) -> List[str]:
+    """Tar archives listed in an RBOM (make_rbom); an artifact's "path" is used if it exists, else "name" next to the RBOM."""
+    doc = json.loads(pathlib.Path(rbom_path).read_text(encoding="utf-8"))
+    base = pathlib.Path(rbom_path).resolve().parent
+    out = set()
+    for art in doc.get("artifacts", []):
+        name = str(art.get("name", ""))
+        if not name.endswith(TAR_SUFFIXES):
+            continue
+        path = art.get("path")
+        out.add(str(path) if path and os.path.exists(path) else str(base / name))
+    return sorted(out)
+
+def _timed_check(path: str, integrity: bool) -> dict:
+    t0 = time.perf_counter()
+    rep = check_tar(path, integrity)
+    return {**rep, "path": path, "seconds": round(time.perf_counter() - t0, 4)}
+
+def check_many(paths: Sequence[str], workers: Optional[int] = None, integrity: bool = False) -> dict:
+    """
+    check_tar() for every archive, in parallel processes (REPRO_VERIFY_WORKERS / workers).
+    Largest archives are submitted first so one big tarball does not finish last;
+    the report lists archives sorted by path regardless of completion order:
+        {"ok", "count", "failed": [paths], "workers", "seconds", "archives": [check_tar + "seconds", ...]}
+    """
+    paths = sorted(set(paths))
+    workers = verify_workers(workers, len(paths))
+    t0 = time.perf_counter()
+    results: Dict[str, dict] = {}
+    with metrics.phase("tar_batch"):
+        if workers == 1:
+            for p in paths:
+                results[p] = _timed_check(p, integrity)
+        else:
+            by_size = sorted(paths, key=lambda p: -(os.path.getsize(p) if os.path.exists(p) else 0))
+            with ProcessPoolExecutor(workers) as pool:
+                futures = {pool.submit(_timed_check, p, integrity): p for p in by_size}
+                for fut in as_completed(futures):
+                    results[futures[fut]] = fut.result()
+    metrics.inc("archives_checked_total", len(paths))
+    archives = [results[p] for p in paths]
+    failed = [a["path"] for a in archives if not a.get("ok", False)]
+    return {"ok": bool(archives) and not failed, "count": len(archives), "failed": failed, "workers": workers,
+            "seconds": round(time.perf_counter() - t0, 4), "archives": archives}
 
 def main():
     ap = argparse.ArgumentParser()
-    ap.add_argument("--tar", required=True, help="Path to .tar.gz")
+    src = ap.add_mutually_exclusive_group(required=True)
+    src.add_argument("--tar", help="Path to .tar / .tar.gz / .tar.xz / .tar.zst")
+    src.add_argument("--glob", action="append", metavar="PATTERN", help="Check every tar archive matching PATTERN (repeatable)")
+    src.add_argument("--rbom", help="Check every tar archive listed in this RBOM")
     ap.add_argument("--out", default="tar_check.json")
+    ap.add_argument("--integrity", action="store_true", help="Also check the CRC32/ISIZE of the whole compressed stream")
+    ap.add_argument("--workers", type=int, help="Processes for --glob/--rbom (default: REPRO_VERIFY_WORKERS or CPU count)")
     args = ap.parse_args()
-    rep = check_tar(args.tar)
+    if not args.tar:
+        try:
+            paths = expand_globs(args.glob) if args.glob else rbom_archives(args.rbom)
+        except (OSError, ValueError) as e:
+            print(f"ERROR: {e}", file=sys.stderr)
+            sys.exit(2)
+        rep = check_many(paths, args.workers, args.integrity)
+        pathlib.Path(args.out).write_text(json.dumps(rep, sort_keys=True, separators=(",",":")), encoding="utf-8")
+        for p in rep["failed"]:
+            print(f"FAIL {p}", file=sys.stderr)
+        if not rep["ok"]:
+            print(f"Tar determinism: FAIL ({len(rep['failed'])}/{rep['count']} archives)", file=sys.stderr)
+            sys.exit(2)
+        print(f"Tar determinism: PASS ({rep['count']} archives)")
+        return
+    rep = check_tar(args.tar, args.integrity)
     pathlib.Path(args.out).write_text(json.dumps(rep, sort_keys=True, separators=(",",":")), encoding="utf-8")
     if not rep.get("ok", False):
         print("Tar determinism: FAIL", file=sys.stderr)
@@ -69,7 +203,7 @@ def verify_metadata(member: tarfile.TarInfo) -> bool:
     perms_ok = (mode & 0o002) == 0  # Not world-writable
     return uid_ok and gid_ok and uname_ok and gname_ok and mtime_ok and perms_ok
 
-def check_tar_determinism(tar_path: str) -> dict:
+def check_tar_determinism(tar_path: str, integrity: bool = False) -> dict:
     """
     Check if tar is deterministic and return dict with detailed results.
     Expected by tests to return a dict with 'is_deterministic' key.
@@ -79,17 +213,23 @@ def check_tar_determinism(tar_path: str) -> dict:
         return {"is_deterministic": False, "issues": ["Tar file does not exist"]}
     
     try:
-        with tarfile.open(str(p), "r:*") as tf:
-            members = [m for m in tf.getmembers() if m.name != "./"]
+        members, stream_rep = _read_members(p, integrity)
     except Exception as e:
         return {"is_deterministic": False, "issues": [f"Failed to read tar: {e}"]}
+    members = [m for m in members if m.name != "./"]
+    metrics.inc("members_checked_total", len(members))
     
     issues = []
+    if stream_rep is not None and not stream_rep["is_valid"]:
+        issues.append(f"Compressed stream is damaged: {stream_rep['error']}")
     
     # Check file order
     if not verify_file_order(members):
         issues.append("Files are not in sorted order")
     
+    for name in verify_links(members):
+        issues.append(f"{name}: hardlink target is not an earlier file")
+
     # Check metadata for each member
     for m in members:
         if not verify_metadata(m):
@@ -115,4 +255,4 @@ def check_tar_determinism(tar_path: str) -> dict:
     }
 
 if __name__ == "__main__":
-    main()
+    profiling.run(main)
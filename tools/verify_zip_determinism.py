@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""Checks a zip or wheel for the normalization det_zip applies (order, timestamps, attributes, no extras)
+and, for wheels (.whl), that RECORD is last and matches every entry's hash and size."""
+from __future__ import annotations
+import argparse, base64, csv, hashlib, io, json, pathlib, sys, zipfile
+from typing import List
+if __package__ in (None, ""): sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[1]))
+from tools import metrics, profiling
+from tools.det_zip import zip_order
+
+_EPOCH = (1980, 1, 1, 0, 0, 0)
+
+def verify_entry(info: zipfile.ZipInfo) -> List[str]:
+    """Normalization problems of one entry; [] if it is as det_zip writes it."""
+    issues = []
+    if info.date_time != _EPOCH:
+        issues.append(f"{info.filename}: timestamp is {info.date_time}, not {_EPOCH}")
+    if info.create_system != 3:
+        issues.append(f"{info.filename}: create_system is {info.create_system}, not 3 (Unix)")
+    mode = info.external_attr >> 16
+    if info.is_dir():
+        issues.append(f"{info.filename}: directory entry")
+    elif mode not in (0o100644, 0o100755):
+        issues.append(f"{info.filename}: mode is {oct(mode)}, not 0o100644/0o100755")
+    if info.extra and info.file_size < 0xFFFFFFFF and info.compress_size < 0xFFFFFFFF and info.header_offset < 0xFFFFFFFF:
+        issues.append(f"{info.filename}: has extra fields")
+    if info.comment:
+        issues.append(f"{info.filename}: has a comment")
+    if info.flag_bits & 0x8:
+        issues.append(f"{info.filename}: uses a data descriptor")
+    return issues
+
+def verify_record(zf: zipfile.ZipFile, names: List[str]) -> List[str]:
+    """Wheel RECORD problems: must be the last entry and list every other entry with its sha256 and size."""
+    record = names[-1] if names and names[-1].endswith(".dist-info/RECORD") else None
+    if record is None:
+        return ["RECORD is not the last entry"]
+    issues, seen = [], set()
+    for row in csv.reader(io.StringIO(zf.read(record).decode("utf-8"))):
+        if not row:
+            continue
+        name, digest, size = (row + ["", ""])[:3]
+        seen.add(name)
+        if name == record:
+            continue
+        if name not in names:
+            issues.append(f"RECORD lists missing entry {name}")
+            continue
+        data = zf.read(name)
+        want = "sha256=" + base64.urlsafe_b64encode(hashlib.sha256(data).digest()).rstrip(b"=").decode("ascii")
+        if digest != want or size != str(len(data)):
+            issues.append(f"{name}: RECORD hash/size does not match")
+    issues += [f"{n}: not listed in RECORD" for n in names if n not in seen]
+    return issues
+
+def check_zip_determinism(zip_path: str) -> dict:
+    """Dict with 'is_deterministic' and 'issues', like verify_tar_determinism.check_tar_determinism."""
+    p = pathlib.Path(zip_path)
+    if not p.exists():
+        return {"is_deterministic": False, "issues": ["Zip file does not exist"]}
+    try:
+        with metrics.phase("zip_read"), zipfile.ZipFile(p) as zf:
+            infos = zf.infolist()
+            names = [i.filename for i in infos]
+            wheel = p.suffix == ".whl"
+            issues = []
+            if zf.comment:
+                issues.append("archive has a comment")
+            if names != zip_order(names, wheel) or len(names) != len(set(names)):
+                issues.append("Entries are not in sorted order" + (" (.dist-info last, RECORD at the end)" if wheel else ""))
+            for info in infos:
+                issues += verify_entry(info)
+            bad = zf.testzip()
+            if bad is not None:
+                issues.append(f"{bad}: CRC mismatch")
+            if wheel:
+                issues += verify_record(zf, names)
+    except Exception as e:
+        return {"is_deterministic": False, "issues": [f"Failed to read zip: {e}"]}
+    metrics.inc("members_checked_total", len(infos))
+    return {"is_deterministic": not issues, "issues": issues}
+
+def check_zip(zip_path: str) -> dict:
+    rep = check_zip_determinism(zip_path)
+    return {"ok": rep["is_deterministic"], "issues": rep["issues"], "path": str(pathlib.Path(zip_path))}
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--zip", required=True, help="Path to .zip / .whl")
+    ap.add_argument("--out", default="zip_check.json")
+    args = ap.parse_args()
+    rep = check_zip(args.zip)
+    pathlib.Path(args.out).write_text(json.dumps(rep, sort_keys=True, separators=(",",":")), encoding="utf-8")
+    if not rep["ok"]:
+        for issue in rep["issues"]:
+            print(f"  {issue}", file=sys.stderr)
+        print("Zip determinism: FAIL", file=sys.stderr)
+        sys.exit(2)
+    print("Zip determinism: PASS")
+
+if __name__ == "__main__":
+    profiling.run(main)